@@ -3,68 +3,196 @@ const express = require('express');
 const prisma = require('../lib/prisma');
 const router = express.Router();
 
+// Persistent Python inference daemon (inference.py --server)
+// Model chỉ load 1 lần, các request sau chỉ tốn thời gian inference
+const INFERENCE_STARTUP_TIMEOUT_MS = 120000; // Model loading lần đầu có thể lâu
+const INFERENCE_REQUEST_TIMEOUT_MS = 30000;
+
+let inferenceProcess = null;
+let inferenceReady = null; // Promise resolve khi daemon gửi handshake 'ready'
+let inferenceIsReady = false;
+let nextRequestId = 1;
+const pendingRequests = new Map();
+
+function rejectAllPending(reason) {
+  for (const [, pending] of pendingRequests) {
+    clearTimeout(pending.timer);
+    pending.reject(new Error(reason));
+  }
+  pendingRequests.clear();
+}
+
+function isProcessAlive(python) {
+  return !!python && python.exitCode === null && !python.killed;
+}
+
 /**
- * Run Python inference script
- * @param {string} imageBase64 - Base64 encoded image
- * @returns {Promise<object>} - Inference result
+ * Bỏ daemon đang cache (đã chết / stdin hỏng) → request sau sẽ spawn lại
  */
-function runInference(imageBase64) {
-  // Fast path: allow disabling ML to avoid Python dependency in dev/CI
-  if (!process.env.USE_ML || String(process.env.USE_ML).toLowerCase() !== 'true') {
-    return Promise.resolve({
-      success: true,
-      plate_number: '49G1-11111',
-      confidence: 0.99,
-      bypassed: true,
-      message: 'ML disabled, returning demo result'
-    });
+function resetInferenceProcess(python, reason) {
+  if (inferenceProcess !== python) return;
+  inferenceProcess = null;
+  inferenceReady = null;
+  inferenceIsReady = false;
+  rejectAllPending(reason);
+}
+
+/**
+ * Start (hoặc tái sử dụng) inference daemon
+ * @returns {Promise<ChildProcess>} - Resolve khi model đã load xong
+ */
+function ensureInferenceProcess() {
+  if (inferenceReady && inferenceProcess && !isProcessAlive(inferenceProcess)) {
+    // Daemon chết nhưng 'close' chưa kịp chạy → không dùng lại process cũ
+    resetInferenceProcess(inferenceProcess, 'Inference daemon exited');
   }
-  return new Promise((resolve, reject) => {
-    // CRITICAL FIX: Use stdin instead of command line argument to avoid E2BIG error
+  if (inferenceReady) {
+    return inferenceReady;
+  }
+
+  inferenceReady = new Promise((resolve, reject) => {
     const python = spawn('python', [
       'ml_models/utils/inference.py',
-      '--stdin'  // Tell Python to read from stdin
+      '--server'
     ]);
+    inferenceProcess = python;
 
-    let result = '';
-    let error = '';
+    let buffer = '';
+    let isReady = false;
+
+    const startupTimer = setTimeout(() => {
+      reject(new Error('Inference daemon startup timeout - Model loading may take time on first run'));
+      python.kill();
+    }, INFERENCE_STARTUP_TIMEOUT_MS);
 
     python.stdout.on('data', (data) => {
-      result += data.toString();
+      buffer += data.toString();
+      let newlineIndex;
+      while ((newlineIndex = buffer.indexOf('\n')) >= 0) {
+        const line = buffer.slice(0, newlineIndex).trim();
+        buffer = buffer.slice(newlineIndex + 1);
+        if (!line) continue;
+
+        let message;
+        try {
+          message = JSON.parse(line);
+        } catch (e) {
+          console.error('[Python] Invalid daemon output:', line.substring(0, 200));
+          continue;
+        }
+
+        if (message.type === 'ready') {
+          isReady = true;
+          inferenceIsReady = true;
+          clearTimeout(startupTimer);
+          console.log(`[Python] Inference daemon ready (PID: ${message.pid})`);
+          resolve(python);
+          continue;
+        }
+
+        if (message.type === 'fatal') {
+          clearTimeout(startupTimer);
+          reject(new Error(message.error));
+          continue;
+        }
+
+        const pending = pendingRequests.get(message.id);
+        if (!pending) continue;
+        pendingRequests.delete(message.id);
+        clearTimeout(pending.timer);
+
+        if (message.type === 'error') {
+          pending.reject(new Error('Python inference failed: ' + message.error));
+        } else {
+          pending.resolve(message.type === 'result' ? message.result : message);
+        }
+      }
     });
 
     python.stderr.on('data', (data) => {
-      const stderr = data.toString();
-      error += stderr;
       // Log Python stderr for debugging
-      console.error('[Python stderr]', stderr);
+      console.error('[Python stderr]', data.toString());
+    });
+
+    // Daemon chết → ghi vào stdin lỗi EPIPE; không có handler thì 'error' làm sập cả Node API
+    python.stdin.on('error', (err) => {
+      console.error('[Python] Inference daemon stdin error:', err.message);
+      clearTimeout(startupTimer);
+      if (!isReady) {
+        reject(err);
+      }
+      resetInferenceProcess(python, `Inference daemon stdin error: ${err.message}`);
     });
 
     python.on('close', (code) => {
-      console.log(`[Python] Process exited with code ${code}`);
-      console.log(`[Python stdout] ${result.substring(0, 500)}`);
-      console.log(`[Python stderr] ${error.substring(0, 500)}`);
-      
-      if (code === 0) {
-        try {
-          resolve(JSON.parse(result));
-        } catch (e) {
-          reject(new Error('Failed to parse Python output: ' + result));
-        }
-      } else {
-        reject(new Error('Python inference failed: ' + error));
+      console.log(`[Python] Inference daemon exited with code ${code}`);
+      clearTimeout(startupTimer);
+      if (!isReady) {
+        reject(new Error(`Inference daemon exited during startup (code ${code})`));
       }
+      resetInferenceProcess(python, 'Inference daemon exited');
     });
 
-    // Send base64 image via stdin (avoids command line length limit)
-    python.stdin.write(imageBase64);
-    python.stdin.end();
+    python.on('error', (err) => {
+      clearTimeout(startupTimer);
+      reject(err);
+    });
+  });
 
-    // Set timeout for model loading
-    setTimeout(() => {
-      python.kill();
-      reject(new Error('Inference timeout - Model loading may take time on first run'));
-    }, 120000); // 120 seconds timeout
+  // Startup lỗi → cho phép thử lại ở request sau
+  inferenceReady.catch(() => {
+    inferenceReady = null;
+  });
+
+  return inferenceReady;
+}
+
+/**
+ * Gửi 1 request tới inference daemon
+ * @param {object} payload - { type: 'detect' | 'health', ... }
+ * @returns {Promise<object>}
+ */
+async function sendInferenceRequest(payload) {
+  let python = await ensureInferenceProcess();
+  if (!isProcessAlive(python)) {
+    // Daemon chết giữa lúc chờ → spawn lại 1 lần
+    resetInferenceProcess(python, 'Inference daemon exited');
+    python = await ensureInferenceProcess();
+  }
+  const id = String(nextRequestId++);
+
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      pendingRequests.delete(id);
+      reject(new Error('Inference timeout'));
+    }, INFERENCE_REQUEST_TIMEOUT_MS);
+
+    pendingRequests.set(id, { resolve, reject, timer });
+    python.stdin.write(JSON.stringify({ id, ...payload }) + '\n');
+  });
+}
+
+/**
+ * Run Python inference qua persistent daemon
+ * @param {string} imageBase64 - Base64 encoded image
+ * @param {object} options - { multiPlate: boolean } đọc tất cả biển số trong ảnh
+ * @returns {Promise<object>} - Inference result
+ */
+function runInference(imageBase64, options = {}) {
+  // Fast path: allow disabling ML to avoid Python dependency in dev/CI
+  if (!process.env.USE_ML || String(process.env.USE_ML).toLowerCase() !== 'true') {
+    return Promise.resolve({
+      success: true,
+      plate_number: '49G1-11111',
+      confidence: 0.99,
+      bypassed: true,
+      message: 'ML disabled, returning demo result'
+    });
+  }
+  return sendInferenceRequest({
+    type: 'detect',
+    image_base64: imageBase64,
+    multi_plate: !!options.multiPlate
   });
 }
 
@@ -329,7 +457,7 @@ async function handleExit(vehicle, camera) {
  */
 router.post('/detect-plate', async (req, res) => {
   try {
-    const { image_base64, camera_id } = req.body;
+    const { image_base64, camera_id, multi_plate } = req.body;
     
     if (!image_base64) {
       return res.status(400).json({ 
@@ -348,7 +476,7 @@ router.post('/detect-plate', async (req, res) => {
     console.log(`[ML] Processing detection request for camera ${camera_id}`);
     
     // Run inference
-    const result = await runInference(image_base64);
+    const result = await runInference(image_base64, { multiPlate: multi_plate === true });
     
     console.log(`[ML] Detection result:`, {
       success: result.success,
@@ -483,16 +611,33 @@ router.post('/check-vehicle-status', async (req, res) => {
  * GET /api/ml/status
  * Check ML service status
  */
-router.get('/status', (req, res) => {
+router.get('/status', async (req, res) => {
+  let daemon = { status: inferenceProcess ? 'starting' : 'stopped' };
+  if (inferenceProcess && inferenceIsReady) {
+    try {
+      daemon = await sendInferenceRequest({ type: 'health' });
+    } catch (error) {
+      daemon = { status: 'error', error: error.message };
+    }
+  }
+
   res.json({
     status: 'online',
     message: 'ML service is running',
     models: {
       plate_detector: 'loaded',
       character_recognition: 'loaded'
-    }
+    },
+    inference_daemon: daemon
   });
 });
 
+// Warm up daemon khi server khởi động để request đầu tiên không phải chờ load model
+if (process.env.USE_ML && String(process.env.USE_ML).toLowerCase() === 'true') {
+  ensureInferenceProcess().catch((error) => {
+    console.error('[ML] Failed to start inference daemon:', error.message);
+  });
+}
+
 module.exports = router;
 
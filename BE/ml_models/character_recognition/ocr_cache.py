@@ -0,0 +1,148 @@
+"""
+OCR Result Cache Module
+Cache LRU kết quả OCR theo perceptual hash (pHash) của crop biển số + cameraId
+Xe đỗ / nhích chậm ở cổng cho crop gần như giống hệt qua nhiều frame → dùng lại kết quả
+thay vì chạy lại toàn bộ cascade OCR nhiều pass
+
+- Khớp khi khoảng cách Hamming giữa 2 hash <= max_distance (cùng camera)
+- Entry gắn với crop đã OCR: xe nhích dần → hash lệch dần → quá ngưỡng thì OCR lại
+- Giới hạn số entry (LRU) + TTL để kết quả không dùng mãi
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+# Cấu hình mặc định - có thể override trong character_recognition/config.json (key "ocr_cache")
+DEFAULT_OCR_CACHE_CONFIG = {
+    'enabled': True,
+    # Số entry tối đa (tất cả camera) - entry ít dùng nhất bị bỏ trước
+    'max_entries': 512,
+    # Thời gian sống của 1 kết quả (giây)
+    'ttl_s': 10.0,
+    # Hash = khối DCT tần số thấp hash_size x hash_size → hash_size² bit
+    'hash_size': 16,
+    # Số bit khác nhau tối đa để coi là cùng crop (256 bit với hash_size 16)
+    # Nhiễu / đổi sáng: ~2-6 bit; khác 1 ký tự: >= ~12 bit → giữ ngưỡng thấp, lệch bbox vài pixel
+    # (~20+ bit) sẽ OCR lại thay vì có nguy cơ trả nhầm biển của xe kế tiếp
+    'max_distance': 6,
+}
+
+
+def perceptual_hash(gray, hash_size=16):
+    """
+    pHash của ảnh grayscale: thu nhỏ (4·hash_size)² → DCT → khối tần số thấp so với median → int
+
+    Ít nhạy với thay đổi sáng nhẹ, nhiễu, thay đổi kích thước crop (xe tiến gần hơn vài pixel)
+    """
+    size = hash_size * 4
+    small = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size].ravel()
+    # Bỏ hệ số DC (độ sáng trung bình) khỏi median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class OCRResultCache:
+    """
+    LRU cache (cameraId, pHash) → raw OCR text - thread-safe
+
+    - lookup(camera_id, phash): (True, text) nếu có entry cùng camera đủ gần và còn hạn
+    - store(camera_id, phash, text): lưu kết quả OCR của crop
+    """
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_OCR_CACHE_CONFIG)
+        if config:
+            self.config.update(config)
+
+        self.enabled = self.config['enabled']
+        self.hash_size = self.config['hash_size']
+
+        self._entries = OrderedDict()  # (camera_id, phash) → (text, stored_at)
+        self._by_camera = {}           # camera_id → set phash (tìm gần đúng trong 1 camera)
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def hash(self, gray):
+        return perceptual_hash(gray, self.hash_size)
+
+    def lookup(self, camera_id, phash, now=None):
+        """
+        Returns:
+            (hit, text) - text là raw OCR text đã lưu ('' nếu lần OCR đó không đọc được)
+        """
+        now = now if now is not None else time.time()
+        max_distance = self.config['max_distance']
+
+        with self._lock:
+            best_key, best_distance = None, max_distance + 1
+            if (camera_id, phash) in self._entries:
+                best_key, best_distance = (camera_id, phash), 0
+            else:
+                for candidate in self._by_camera.get(camera_id, ()):
+                    distance = hamming_distance(phash, candidate)
+                    if distance < best_distance:
+                        best_key, best_distance = (camera_id, candidate), distance
+
+            if best_key is None:
+                self.misses += 1
+                return False, None
+
+            text, stored_at = self._entries[best_key]
+            if now - stored_at > self.config['ttl_s']:
+                self._remove(best_key)
+                self.expired += 1
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return True, text
+
+    def store(self, camera_id, phash, text, now=None):
+        now = now if now is not None else time.time()
+        key = (camera_id, phash)
+
+        with self._lock:
+            self._entries[key] = (text, now)
+            self._entries.move_to_end(key)
+            self._by_camera.setdefault(camera_id, set()).add(phash)
+
+            while len(self._entries) > self.config['max_entries']:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        hashes = self._by_camera.get(key[0])
+        if hashes is not None:
+            hashes.discard(key[1])
+            if not hashes:
+                del self._by_camera[key[0]]
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups > 0 else 0.0,
+            'expired': self.expired,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,186 @@
+"""
+Recognition Cascade Module
+Chạy các pass tiền xử lý từ rẻ → đắt, dừng sớm khi đã có kết quả hợp lệ với confidence cao
+Có counter hit-rate cho từng pass để biết pass đắt (NLM denoise) có thực sự cần không
+"""
+
+import time
+
+from character_recognition.plate_preprocessing import (
+    PREPROCESS_METHODS,
+    preprocess_many,
+    preprocess_variants,
+)
+
+
+# Cấu hình mặc định - có thể override trong character_recognition/config.json (key "cascade")
+DEFAULT_CASCADE_CONFIG = {
+    'enabled': True,
+    # Thứ tự từ rẻ nhất → đắt nhất
+    'order': ['equalize', 'clahe', 'adaptive'],
+    # Confidence trung bình tối thiểu của các ký tự để dừng sớm
+    'min_char_confidence': 0.6,
+    # Số ký tự tối thiểu để 1 kết quả được coi là candidate
+    'min_length': 7,
+}
+
+
+class RecognitionCascade:
+    """
+    Cascade nhận diện ký tự biển số
+
+    - enabled=True: chạy lần lượt từng pass theo `order`, dừng ở candidate đầu tiên
+      hợp lệ (validate_fn) và có confidence >= min_char_confidence
+    - enabled=False: chạy tất cả pass trong 1 batch (như pipeline cũ)
+    """
+
+    def __init__(self, recognizer, validate_fn, config=None):
+        self.recognizer = recognizer
+        self.validate_fn = validate_fn
+
+        self.config = dict(DEFAULT_CASCADE_CONFIG)
+        if config:
+            self.config.update(config)
+
+        methods = dict(PREPROCESS_METHODS)
+        unknown = [name for name in self.config['order'] if name not in methods]
+        if unknown:
+            raise ValueError(f"Unknown preprocessing pass(es) in cascade order: {unknown}")
+        self.passes = [(name, methods[name]) for name in self.config['order']]
+
+        # Stats
+        self.total_plates = 0
+        self.fallbacks = 0
+        self.pass_runs = {name: 0 for name, _ in self.passes}
+        self.pass_hits = {name: 0 for name, _ in self.passes}
+
+    def run(self, gray):
+        """
+        Nhận diện biển số từ ảnh grayscale (đã qua prepare_gray)
+
+        Returns:
+            str: raw plate text tốt nhất ('' nếu không có candidate)
+        """
+        return self.run_many([gray])[0]
+
+    def run_many(self, grays, exclude=(), max_passes=None, pass_timer=None):
+        """
+        Nhận diện nhiều biển số cùng lúc - mỗi pass chạy 1 batch cho tất cả crop còn chưa chốt
+
+        Args:
+            exclude: tên các pass bỏ qua (quality tier khi quá tải, VD 'adaptive' - NLM denoise)
+            max_passes: chỉ chạy tối đa N pass đầu tiên (None = tất cả)
+            pass_timer: (tuỳ chọn) callable(pass_name, crop_indices, seconds) - thời gian
+                        preprocess + OCR của từng pass (cascade tắt: 1 lần với pass_name 'all')
+
+        Returns:
+            list[str]: raw plate text cho từng crop (cùng thứ tự)
+        """
+        if not grays:
+            return []
+
+        self.total_plates += len(grays)
+
+        passes = [(name, method) for name, method in self.passes if name not in exclude]
+        if max_passes is not None:
+            passes = passes[:max_passes]
+
+        if not self.config['enabled']:
+            return self._run_all(grays, passes, pass_timer)
+
+        min_conf = self.config['min_char_confidence']
+        candidates = [[] for _ in grays]
+        final = [None] * len(grays)
+
+        for name, method in passes:
+            pending = [i for i in range(len(grays)) if final[i] is None]
+            if not pending:
+                break
+
+            pass_start = time.perf_counter()
+            indices = pending
+            images = preprocess_many([grays[i] for i in pending], method)
+            pending = [(i, img) for i, img in zip(pending, images) if img is not None]
+            if not pending:
+                continue
+
+            self.pass_runs[name] += len(pending)
+            outputs = self.recognizer.recognize_batch([img for _, img in pending], return_conf=True)
+
+            for (i, _), (text, char_conf) in zip(pending, outputs):
+                if not text or len(text) < self.config['min_length']:
+                    continue
+
+                text = text.upper()
+                candidates[i].append(text)
+
+                is_valid, _ = self.validate_fn(text)
+                if is_valid and char_conf >= min_conf:
+                    self.pass_hits[name] += 1
+                    final[i] = text
+
+            if pass_timer is not None:
+                pass_timer(name, indices, time.perf_counter() - pass_start)
+
+        for i in range(len(grays)):
+            if final[i] is None:
+                self.fallbacks += 1
+                final[i] = self._select_best(candidates[i])
+
+        return final
+
+    def _run_all(self, grays, passes, pass_timer=None):
+        """Chạy tất cả pass song song + OCR 1 batch cho tất cả crop"""
+        start = time.perf_counter()
+        images, owners = [], []
+        for i, gray in enumerate(grays):
+            for name, img in preprocess_variants(gray, passes):
+                if img is None:
+                    continue
+                self.pass_runs[name] += 1
+                images.append(img)
+                owners.append(i)
+
+        texts = self.recognizer.recognize_batch(images)
+        candidates = [[] for _ in grays]
+        for i, text in zip(owners, texts):
+            if text and len(text) >= self.config['min_length']:
+                candidates[i].append(text.upper())
+
+        if pass_timer is not None:
+            pass_timer('all', list(range(len(grays))), time.perf_counter() - start)
+
+        self.fallbacks += len(grays)
+        return [self._select_best(c) for c in candidates]
+
+    def _select_best(self, candidates):
+        """Ưu tiên candidate hợp lệ đầu tiên, nếu không có thì chọn dài nhất"""
+        if not candidates:
+            return ''
+
+        for cand in candidates:
+            is_valid, _ = self.validate_fn(cand)
+            if is_valid:
+                return cand
+
+        return max(candidates, key=len)
+
+    def get_stats(self):
+        """
+        Hit-rate của từng pass - chia cho số crop pass đó thực sự chạy (runs), không chia
+        tổng số biển: pass sau chỉ chạy trên các biển pass trước đã trượt
+        """
+        return {
+            'enabled': self.config['enabled'],
+            'total_plates': self.total_plates,
+            'fallbacks': self.fallbacks,
+            'passes': {
+                name: {
+                    'runs': self.pass_runs[name],
+                    'hits': self.pass_hits[name],
+                    'hit_rate': (round(self.pass_hits[name] / self.pass_runs[name], 4)
+                                 if self.pass_runs[name] > 0 else 0.0)
+                }
+                for name, _ in self.passes
+            }
+        }
@@ -0,0 +1,161 @@
+"""
+Plate Grammar Decoder
+Giải mã chuỗi biển số Việt Nam từ điểm số từng ký tự, ràng buộc theo ngữ pháp biển số:
+    NN (mã tỉnh, 2 số) + seri (1-2 ký tự) + 4-5 số
+Sửa các lỗi nhầm chữ/số (0/O, 8/B, 1/I, ...) ngay trong 1 lần decode, không cần chạy thêm YOLO
+
+Cùng bộ template dùng cho validate_plate / format_plate → decoder, cascade, tracker và
+format hiển thị luôn thống nhất 1 định nghĩa biển hợp lệ
+"""
+
+import math
+
+
+DIGITS = '0123456789'
+
+# Các cặp ký tự hay bị nhầm giữa chữ và số
+CONFUSABLE_PAIRS = [
+    ('0', 'O'), ('0', 'D'), ('0', 'Q'),
+    ('1', 'I'), ('1', 'L'),
+    ('2', 'Z'),
+    ('4', 'A'),
+    ('5', 'S'),
+    ('6', 'G'),
+    ('7', 'T'),
+    ('8', 'B'),
+]
+
+# Seri: D = số, L = chữ. VD: 30A-12345 (L), 30AB-1234 (LL), 29T1-82843 (LD), 51 1F-12345 (DL)
+SERIES_PATTERNS = ['L', 'LL', 'LD', 'DL']
+
+
+def _build_confusable_map(pairs):
+    confusable = {}
+    for a, b in pairs:
+        confusable.setdefault(a, set()).add(b)
+        confusable.setdefault(b, set()).add(a)
+    return confusable
+
+
+def _build_templates(series_patterns, serial_lengths=(4, 5)):
+    """Sinh các template (class_string, head_len) - head_len là số ký tự dòng trên của biển 2 dòng"""
+    templates = []
+    seen = set()
+    for series in series_patterns:
+        for serial_len in serial_lengths:
+            pattern = 'DD' + series + 'D' * serial_len
+            key = (pattern, 2 + len(series))
+            if key not in seen:
+                seen.add(key)
+                templates.append(key)
+    return templates
+
+
+# Template mặc định theo thứ tự ưu tiên khi 1 chuỗi khớp nhiều template
+# VD 30A12345: 'L' + 5 số (30A-12345, biển ô tô) thắng 'LD' + 4 số (30A1-2345)
+PLATE_TEMPLATES = _build_templates(SERIES_PATTERNS)
+
+
+def normalize_plate_text(text):
+    """Bỏ khoảng trắng / '-' / '.' và viết hoa"""
+    return text.upper().replace(' ', '').replace('-', '').replace('.', '')
+
+
+def match_plate(text, templates=None):
+    """
+    Tách biển số theo template đầu tiên khớp
+
+    Returns:
+        (head, serial) - head = mã tỉnh + seri, serial = 4-5 số cuối; None nếu không khớp
+    """
+    text = normalize_plate_text(text)
+    for pattern, head_len in templates or PLATE_TEMPLATES:
+        if len(pattern) != len(text):
+            continue
+        if all(char in DIGITS if cls == 'D' else char.isalpha() and char.isascii()
+               for cls, char in zip(pattern, text)):
+            return text[:head_len], text[head_len:]
+    return None
+
+
+def validate_plate(text):
+    """
+    Returns:
+        (is_valid, cleaned_text)
+    """
+    return match_plate(text) is not None, normalize_plate_text(text)
+
+
+def format_plate(text):
+    """Format hiển thị: 30A-12345, 30AB-1234, 29T1-82843 (không khớp → chuỗi đã chuẩn hoá)"""
+    parts = match_plate(text)
+    if parts is None:
+        return normalize_plate_text(text)
+    return f"{parts[0]}-{parts[1]}"
+
+
+class PlateGrammarDecoder:
+    """
+    Tìm chuỗi có điểm cao nhất thoả ngữ pháp biển số
+
+    Mỗi slot (1 vị trí ký tự) là dict {char: score}. Với mỗi template cùng độ dài,
+    mỗi slot chọn ký tự điểm cao nhất thuộc lớp cho phép (số/chữ); tổng log-score lớn nhất thắng.
+    Biển 2 dòng: số ký tự dòng trên phải bằng mã tỉnh + seri.
+    """
+
+    def __init__(self, charset, confusion_penalty=0.5, series_patterns=None):
+        self.digits = set(DIGITS) & set(charset)
+        self.letters = set(charset) - self.digits
+        self.confusion_penalty = confusion_penalty
+        self.confusable = _build_confusable_map(CONFUSABLE_PAIRS)
+        self.templates = _build_templates(series_patterns or SERIES_PATTERNS)
+
+    def expand_scores(self, scores):
+        """Thêm các ký tự dễ nhầm với điểm bị giảm (confusion_penalty)"""
+        expanded = dict(scores)
+        for char, score in scores.items():
+            for alt in self.confusable.get(char, ()):
+                alt_score = score * self.confusion_penalty
+                if alt_score > expanded.get(alt, 0.0):
+                    expanded[alt] = alt_score
+        return expanded
+
+    def decode(self, rows):
+        """
+        Args:
+            rows: list các dòng (1 hoặc 2), mỗi dòng là list slot {char: score} đã sắp trái → phải
+
+        Returns:
+            (text, mean_score) hoặc None nếu không template nào khả thi
+        """
+        slots = [self.expand_scores(slot) for row in rows for slot in row]
+        top_len = len(rows[0]) if len(rows) == 2 else None
+
+        best = None
+        for pattern, head_len in self.templates:
+            if len(pattern) != len(slots):
+                continue
+            if top_len is not None and top_len != head_len:
+                continue
+
+            chars = []
+            total = 0.0
+            for cls, slot in zip(pattern, slots):
+                allowed = self.digits if cls == 'D' else self.letters
+                choice = max(((c, s) for c, s in slot.items() if c in allowed and s > 0),
+                             key=lambda item: item[1], default=None)
+                if choice is None:
+                    break
+                chars.append(choice)
+                total += math.log(choice[1])
+            else:
+                if best is None or total > best[0]:
+                    best = (total, chars)
+
+        if best is None:
+            return None
+
+        chars = best[1]
+        text = ''.join(c for c, _ in chars)
+        mean_score = sum(s for _, s in chars) / len(chars)
+        return text, mean_score
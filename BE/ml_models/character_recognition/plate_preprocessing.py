@@ -0,0 +1,92 @@
+"""
+Plate Preprocessing Module
+Các phương pháp tiền xử lý ảnh biển số dùng chung cho LicensePlateDetector và PersistentDetector
+Các biến thể được tính song song bằng thread (OpenCV nhả GIL khi xử lý)
+"""
+
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Kích thước tối thiểu (chiều rộng) trước khi đưa vào recognizer
+MIN_PLATE_WIDTH = 300
+
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+
+
+def prepare_gray(cropped_plate, min_width=MIN_PLATE_WIDTH):
+    """Chuyển crop biển số sang grayscale và phóng to tới chiều rộng tối thiểu"""
+    gray = cv2.cvtColor(cropped_plate, cv2.COLOR_BGR2GRAY)
+
+    if gray.shape[1] < min_width:
+        scale = min_width / gray.shape[1]
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+    return gray
+
+
+def preprocess_clahe(gray):
+    """Method 1: CLAHE + Bilateral Filter + Sharpen (tốt cho hầu hết trường hợp)"""
+    denoised = cv2.bilateralFilter(gray, 11, 17, 17)
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    enhanced = clahe.apply(denoised)
+    return cv2.filter2D(enhanced, -1, SHARPEN_KERNEL)
+
+
+def preprocess_adaptive(gray):
+    """Method 2: NLM Denoise + Adaptive Threshold (tốt cho ánh sáng không đều)"""
+    denoised = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
+    return cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY, 11, 2)
+
+
+def preprocess_equalize(gray):
+    """Method 3: Simple contrast enhancement (backup)"""
+    return cv2.equalizeHist(gray)
+
+
+# Thứ tự giữ nguyên như pipeline cũ
+PREPROCESS_METHODS = [
+    ('clahe', preprocess_clahe),
+    ('adaptive', preprocess_adaptive),
+    ('equalize', preprocess_equalize),
+]
+
+_executor = ThreadPoolExecutor(max_workers=len(PREPROCESS_METHODS), thread_name_prefix='preprocess')
+
+
+def _safe_apply(method, gray):
+    try:
+        return method(gray)
+    except Exception as e:
+        print(f"[Preprocess] {method.__name__} failed: {e}")
+        return None
+
+
+def preprocess_variants(gray, methods=None):
+    """
+    Tính tất cả biến thể tiền xử lý song song
+
+    Args:
+        gray: ảnh biển số grayscale (từ prepare_gray)
+        methods: list (name, fn) - mặc định PREPROCESS_METHODS
+
+    Returns:
+        list of (name, image) - image là None nếu method bị lỗi
+    """
+    if methods is None:
+        methods = PREPROCESS_METHODS
+
+    futures = [(name, _executor.submit(_safe_apply, fn, gray)) for name, fn in methods]
+    return [(name, future.result()) for name, future in futures]
+
+
+def preprocess_many(grays, method):
+    """
+    Áp dụng 1 phương pháp cho nhiều crop song song (multi-plate / batch cascade)
+
+    Returns:
+        list image (None nếu bị lỗi), cùng thứ tự với grays
+    """
+    return list(_executor.map(lambda gray: _safe_apply(method, gray), grays))
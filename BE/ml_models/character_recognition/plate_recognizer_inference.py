@@ -7,8 +7,12 @@ Detect từng ký tự riêng lẻ rồi ghép lại theo thứ tự vị trí
 import cv2
 import numpy as np
 import os
+import sys
 
-from ultralytics import YOLO
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from character_recognition.plate_grammar import PlateGrammarDecoder
+from utils.model_backend import load_model_config, load_yolo
 
 
 class PlateRecognizer:
@@ -18,19 +22,39 @@ class PlateRecognizer:
     Hỗ trợ biển số 1 dòng và 2 dòng
     """
 
-    def __init__(self, model_dir=None):
+    def __init__(self, model_dir=None, backend=None, precision=None):
         if model_dir is None:
             model_dir = os.path.dirname(os.path.abspath(__file__))
 
         self.model_path = os.path.join(model_dir, 'plate_recognizer.pt')
+        self.config = load_model_config(model_dir)
 
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model not found: {self.model_path}")
 
-        print(f"[PlateRecognizer] Loading YOLO character model from {self.model_path}")
-        self.model = YOLO(self.model_path)
+        # Backend / precision: tham số > config.json ("backend", "precision") > pytorch fp32
+        backend = backend or self.config.get('backend', 'pytorch')
+        precision = precision or self.config.get('precision', 'fp32')
+        print(f"[PlateRecognizer] Loading YOLO character model from {self.model_path} "
+              f"(backend: {backend}, precision: {precision})")
+        self.model, self.backend, self.precision = load_yolo(self.model_path, backend=backend,
+                                                             task='detect', precision=precision)
         print(f"[PlateRecognizer] Model loaded - {len(self.model.names)} classes: {list(self.model.names.values())}")
 
+        # Character model chạy ở kích thước lúc train (config không đặt input_size)
+        # Input nhỏ theo tỉ lệ biển (VD [192, 320]) chưa được đo read_rate → chưa bật; muốn thử thì đặt
+        # "input_size": [h, w] trong config.json + export lại, chỉ giữ nếu bench_pipeline.py --compare không regression
+        self.imgsz = self.config.get('input_size')
+
+        # Grammar-constrained decoding (cấu hình trong config.json, key "grammar_decoding")
+        grammar_config = self.config.get('grammar_decoding', {})
+        self.decoder = None
+        if grammar_config.get('enabled', True):
+            self.decoder = PlateGrammarDecoder(
+                ''.join(self.model.names.values()),
+                confusion_penalty=grammar_config.get('confusion_penalty', 0.5)
+            )
+
     def recognize(self, image, conf=0.25):
         """
         Nhận diện ký tự trên ảnh biển số đã crop
@@ -42,83 +66,160 @@ class PlateRecognizer:
         Returns:
             str: Recognized plate text
         """
+        return self.recognize_batch([image], conf=conf)[0]
+
+    def recognize_batch(self, images, conf=0.25, return_conf=False):
+        """
+        Nhận diện nhiều ảnh biển số trong 1 lần forward pass (batch)
+
+        Args:
+            images: list numpy array (BGR or grayscale)
+            conf: confidence threshold
+            return_conf: trả thêm confidence trung bình của các ký tự
+
+        Returns:
+            list[str]: Recognized plate text cho từng ảnh (cùng thứ tự)
+            hoặc list[(str, float)] nếu return_conf=True
+        """
+        if not images:
+            return []
+
+        empty = ("", 0.0) if return_conf else ""
+
         try:
             # Đảm bảo ảnh là 3 channels cho YOLO
-            if len(image.shape) == 2:
-                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-            elif image.shape[2] == 1:
-                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            images = [self._to_bgr(image) for image in images]
 
-            results = self.model(image, conf=conf, verbose=False)
+            kwargs = {'conf': conf, 'verbose': False}
+            if self.imgsz:
+                kwargs['imgsz'] = list(self.imgsz)
+            results = self.model(images, **kwargs)
 
             if not results or len(results) == 0:
-                return ""
-
-            result = results[0]
-            if result.boxes is None or len(result.boxes) == 0:
-                return ""
-
-            # Thu thập detections: (x_center, y_center, class_name, conf)
-            detections = []
-            for box in result.boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                cls_id = int(box.cls[0])
-                char = self.model.names[cls_id]
-                c = float(box.conf[0])
-                cx = (x1 + x2) / 2
-                cy = (y1 + y2) / 2
-                detections.append((cx, cy, char, c))
-
-            if not detections:
-                return ""
-
-            # Sắp xếp ký tự theo vị trí (hỗ trợ biển 2 dòng)
-            text = self._sort_and_assemble(detections, image.shape[0])
-            return text
+                return [empty] * len(images)
+
+            parsed = [self._parse_result(result, image.shape[0])
+                      for result, image in zip(results, images)]
+            if return_conf:
+                return parsed
+            return [text for text, _ in parsed]
 
         except Exception as e:
             print(f"[PlateRecognizer] Recognition error: {e}")
-            return ""
+            return [empty] * len(images)
+
+    def _to_bgr(self, image):
+        """Chuyển ảnh grayscale sang 3 channels"""
+        if len(image.shape) == 2 or image.shape[2] == 1:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
+
+    def _parse_result(self, result, img_height):
+        """Chuyển 1 YOLO result thành (chuỗi ký tự, confidence trung bình)"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return "", 0.0
+
+        # Copy tensor → numpy 1 lần cho toàn bộ box (không copy từng box)
+        xyxy = boxes.xyxy.cpu().numpy()
+        cls_ids = boxes.cls.cpu().numpy().astype(int)
+        confs = boxes.conf.cpu().numpy()
+        chars = [self.model.names[c] for c in cls_ids]
+        centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+
+        # Decode theo ngữ pháp biển số (sửa nhầm 0/O, 8/B, 1/I...)
+        if self.decoder is not None:
+            decoded = self._decode_with_grammar(xyxy, centers, chars, confs, img_height)
+            if decoded is not None:
+                return decoded
+
+        # Fallback: sắp xếp ký tự theo vị trí (hỗ trợ biển 2 dòng)
+        rows = self._split_rows(centers, img_height)
+        text = ''.join(chars[i] for row in rows for i in row)
+        return text, float(confs.mean())
+
+    def _decode_with_grammar(self, xyxy, centers, chars, confs, img_height, iou_threshold=0.5):
+        """
+        Gom các box chồng nhau (khác class) thành 1 slot với nhiều ứng viên,
+        sau đó để PlateGrammarDecoder chọn chuỗi hợp lệ có điểm cao nhất.
+        NMS của YOLO theo từng class nên cùng 1 vị trí có thể có nhiều box khác class.
+        """
+        iou = _pairwise_iou(xyxy)
+        slot_heads = []
+        slot_scores = []
+
+        for i in np.argsort(-confs, kind='stable'):
+            for head, scores in zip(slot_heads, slot_scores):
+                if iou[head, i] >= iou_threshold:
+                    if confs[i] > scores.get(chars[i], 0.0):
+                        scores[chars[i]] = float(confs[i])
+                    break
+            else:
+                slot_heads.append(i)
+                slot_scores.append({chars[i]: float(confs[i])})
+
+        rows = self._split_rows(centers[slot_heads], img_height)
+        return self.decoder.decode([[slot_scores[k] for k in row] for row in rows])
+
+    def _split_rows(self, centers, img_height):
+        """
+        Chia các box (mảng centers N x 2) thành 1 hoặc 2 dòng, mỗi dòng sắp trái → phải.
+        Biển 2 dòng: dòng trên chứa mã tỉnh + seri, dòng dưới chứa số.
+
+        Returns:
+            list mảng index (1 hoặc 2 dòng)
+        """
+        cx, cy = centers[:, 0], centers[:, 1]
+
+        # Nếu y_range > 30% chiều cao → biển 2 dòng
+        if len(cy) >= 4:
+            y_min, y_max = cy.min(), cy.max()
+            if y_max - y_min > img_height * 0.3:
+                idx = np.arange(len(cy))
+                top = cy < (y_min + y_max) / 2
+                top_row = idx[top][np.argsort(cx[top], kind='stable')]
+                bot_row = idx[~top][np.argsort(cx[~top], kind='stable')]
+                return [top_row, bot_row]
+
+        # 1 dòng: sắp xếp trái → phải
+        return [np.argsort(cx, kind='stable')]
 
     def _sort_and_assemble(self, detections, img_height):
         """
-        Sắp xếp detections theo vị trí và ghép thành chuỗi.
+        Sắp xếp detections (x_center, y_center, class_name, ...) theo vị trí và ghép thành chuỗi.
         Hỗ trợ biển số 1 dòng và 2 dòng (Việt Nam).
 
         Biển 2 dòng: dòng trên chứa mã tỉnh + seri, dòng dưới chứa số.
         Phân biệt bằng y_center so với chiều cao ảnh.
         """
-        if len(detections) <= 1:
-            return detections[0][2] if detections else ""
+        if not detections:
+            return ""
 
-        # Tính median y để phân chia dòng
-        ys = [d[1] for d in detections]
-        y_min, y_max = min(ys), max(ys)
-        y_range = y_max - y_min
+        centers = np.array([(d[0], d[1]) for d in detections], dtype=np.float32)
+        rows = self._split_rows(centers, img_height)
+        return ''.join(detections[i][2] for row in rows for i in row)
 
-        # Nếu y_range > 30% chiều cao → biển 2 dòng
-        if y_range > img_height * 0.3 and len(detections) >= 4:
-            y_mid = (y_min + y_max) / 2
-            top_row = sorted([d for d in detections if d[1] < y_mid], key=lambda d: d[0])
-            bot_row = sorted([d for d in detections if d[1] >= y_mid], key=lambda d: d[0])
-            chars = [d[2] for d in top_row] + [d[2] for d in bot_row]
-        else:
-            # 1 dòng: sắp xếp trái → phải
-            sorted_dets = sorted(detections, key=lambda d: d[0])
-            chars = [d[2] for d in sorted_dets]
 
-        return ''.join(chars)
+def _pairwise_iou(xyxy):
+    """Ma trận IoU N x N của các box (x1, y1, x2, y2)"""
+    x1, y1, x2, y2 = xyxy[:, 0], xyxy[:, 1], xyxy[:, 2], xyxy[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    iw = np.clip(np.minimum(x2[:, None], x2[None]) - np.maximum(x1[:, None], x1[None]), 0, None)
+    ih = np.clip(np.minimum(y2[:, None], y2[None]) - np.maximum(y1[:, None], y1[None]), 0, None)
+    inter = iw * ih
+    union = areas[:, None] + areas[None] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
 
 
 # Global singleton
 _recognizer = None
 
 
-def get_recognizer():
-    """Singleton accessor"""
+def get_recognizer(backend=None, precision=None):
+    """Singleton accessor - backend/precision chỉ có tác dụng ở lần gọi đầu tiên"""
     global _recognizer
     if _recognizer is None:
-        _recognizer = PlateRecognizer()
+        _recognizer = PlateRecognizer(backend=backend, precision=precision)
     return _recognizer
 
 
@@ -0,0 +1,9 @@
+"""
+Pytest config - cho phép import như các script trong ml_models (from utils.X / from character_recognition.X)
+Chạy: cd BE/ml_models && python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -0,0 +1,87 @@
+import threading
+
+from utils.frame_mailbox import LatestFrameMailbox
+
+
+def test_latest_frame_wins_and_counts_drops():
+    mailbox = LatestFrameMailbox()
+    mailbox.put('cam1', 'f1')
+    mailbox.put('cam1', 'f2')
+
+    key, item, age = mailbox.get(timeout=0)
+    assert (key, item) == ('cam1', 'f2')
+    assert age >= 0
+
+    stats = mailbox.get_key_stats('cam1')
+    assert stats['received'] == 2
+    assert stats['dropped'] == 1
+    assert stats['processed'] == 1
+    assert stats['drop_rate'] == 0.5
+    assert not stats['pending']
+    assert mailbox.get_key_stats('unknown') is None
+    assert mailbox.get_stats() == {'cam1': stats}
+
+
+def test_oldest_waiting_camera_served_first():
+    mailbox = LatestFrameMailbox()
+    mailbox.put('cam1', 'a1')
+    mailbox.put('cam2', 'b1')
+    # Frame mới của cam1 giữ nguyên vị trí trong hàng
+    mailbox.put('cam1', 'a2')
+
+    assert [(k, item) for k, item, _ in mailbox.get_batch(8)] == [('cam1', 'a2'), ('cam2', 'b1')]
+
+
+def test_get_batch_respects_max_items_and_timeout():
+    mailbox = LatestFrameMailbox()
+    for i in range(3):
+        mailbox.put(f'cam{i}', i)
+
+    assert len(mailbox.get_batch(2)) == 2
+    assert len(mailbox.get_batch(2)) == 1
+    assert mailbox.get_batch(2, timeout=0.01) == []
+
+
+def test_discard_and_close():
+    mailbox = LatestFrameMailbox()
+    mailbox.put('cam1', 'f1')
+    mailbox.discard('cam1')
+    assert mailbox.get(timeout=0) is None
+    assert mailbox.get_stats() == {}
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(mailbox.get_batch(4)))
+    waiter.start()
+    mailbox.close()
+    waiter.join(timeout=2)
+    assert results == [[]]
+    assert mailbox.put('cam1', 'f2') is False
+
+
+def test_exclusive_skips_in_flight_key_until_release():
+    mailbox = LatestFrameMailbox(exclusive=True)
+    mailbox.put('cam1', 'a1')
+    assert [k for k, _, _ in mailbox.get_batch(4)] == ['cam1']
+
+    # cam1 đang xử lý → frame mới của cam1 chờ, cam2 vẫn được lấy
+    mailbox.put('cam1', 'a2')
+    mailbox.put('cam2', 'b1')
+    assert [(k, item) for k, item, _ in mailbox.get_batch(4, timeout=0.01)] == [('cam2', 'b1')]
+    assert mailbox.get(timeout=0.01) is None
+
+    mailbox.release(['cam1', 'cam2'])
+    assert mailbox.get(timeout=0)[:2] == ('cam1', 'a2')
+
+
+def test_release_wakes_waiting_worker():
+    mailbox = LatestFrameMailbox(exclusive=True)
+    mailbox.put('cam1', 'a1')
+    mailbox.get(timeout=0)
+    mailbox.put('cam1', 'a2')
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(mailbox.get(timeout=2)))
+    waiter.start()
+    mailbox.release(['cam1'])
+    waiter.join(timeout=2)
+    assert results[0][:2] == ('cam1', 'a2')
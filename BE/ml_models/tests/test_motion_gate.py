@@ -0,0 +1,35 @@
+import numpy as np
+
+from utils.motion_gate import MotionGate
+
+
+def frame(box=None):
+    """Frame 480x640 nền xám, box (x1, y1, x2, y2) trắng = 'xe'"""
+    image = np.full((480, 640, 3), 90, dtype=np.uint8)
+    if box is not None:
+        x1, y1, x2, y2 = box
+        image[y1:y2, x1:x2] = 255
+    return image
+
+
+def test_static_frames_skipped_until_refresh():
+    gate = MotionGate({'max_static_frames': 3})
+    assert gate.should_process(frame())          # frame đầu: khởi tạo background
+    assert [gate.should_process(frame()) for _ in range(4)] == [False, False, False, True]
+    stats = gate.get_stats()
+    assert stats['frames_checked'] == 5 and stats['inference_skipped'] == 3
+
+
+def test_motion_triggers_detection():
+    gate = MotionGate()
+    gate.should_process(frame())
+    assert not gate.should_process(frame())
+    assert gate.should_process(frame((200, 200, 360, 300)))
+
+
+def test_motion_outside_roi_ignored():
+    # ROI nửa trái frame (toạ độ chuẩn hoá)
+    gate = MotionGate({'roi': {'polygon': [[0, 0], [0.5, 0], [0.5, 1], [0, 1]]}})
+    gate.should_process(frame())
+    assert not gate.should_process(frame((480, 100, 620, 300)))
+    assert gate.should_process(frame((50, 100, 200, 300)))
@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+
+from character_recognition.ocr_cache import OCRResultCache, hamming_distance, perceptual_hash
+
+
+def plate(text, noise=0, seed=0):
+    """Crop biển số giả: chữ đen trên nền sáng (+ nhiễu Gaussian tuỳ chọn)"""
+    image = np.full((80, 320), 200, dtype=np.uint8)
+    cv2.putText(image, text, (10, 58), cv2.FONT_HERSHEY_SIMPLEX, 1.6, 20, 4)
+    if noise:
+        rng = np.random.default_rng(seed)
+        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    return image
+
+
+def test_phash_tolerates_noise_but_not_a_different_digit():
+    base = perceptual_hash(plate('51F-12345'))
+    assert hamming_distance(base, perceptual_hash(plate('51F-12345', noise=4))) <= 6
+    assert hamming_distance(base, perceptual_hash(plate('51F-12845'))) > 6
+
+
+def test_exact_and_near_match_per_camera():
+    cache = OCRResultCache({'max_distance': 2})
+    cache.store('gate_1', 0b1010, '51F12345', now=0.0)
+
+    assert cache.lookup('gate_1', 0b1010, now=1.0) == (True, '51F12345')
+    assert cache.lookup('gate_1', 0b1011, now=1.0) == (True, '51F12345')
+    assert cache.lookup('gate_1', 0b0101, now=1.0) == (False, None)
+    # Camera khác không dùng chung kết quả
+    assert cache.lookup('gate_2', 0b1010, now=1.0) == (False, None)
+    assert cache.get_stats()['hits'] == 2
+
+
+def test_ttl_expires_entries():
+    cache = OCRResultCache({'ttl_s': 10.0})
+    cache.store('gate_1', 1, '51F12345', now=0.0)
+    assert cache.lookup('gate_1', 1, now=9.0)[0]
+    assert cache.lookup('gate_1', 1, now=11.0) == (False, None)
+    stats = cache.get_stats()
+    assert stats['expired'] == 1 and stats['entries'] == 0
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = OCRResultCache({'max_entries': 2, 'max_distance': 0})
+    cache.store('gate_1', 1, 'A', now=0.0)
+    cache.store('gate_1', 2, 'B', now=0.0)
+    cache.lookup('gate_1', 1, now=0.0)     # 1 vừa dùng → 2 bị bỏ trước
+    cache.store('gate_1', 4, 'C', now=0.0)
+
+    assert cache.lookup('gate_1', 2, now=0.0) == (False, None)
+    assert cache.lookup('gate_1', 1, now=0.0) == (True, 'A')
+    assert cache.get_stats()['evictions'] == 1
@@ -0,0 +1,72 @@
+import numpy as np
+
+from character_recognition.plate_cascade import RecognitionCascade
+
+
+class ScriptedRecognizer:
+    """Trả kết quả theo kịch bản: mỗi lần gọi recognize_batch lấy 1 danh sách (text, conf)"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.batch_sizes = []
+
+    def recognize_batch(self, images, return_conf=False):
+        self.batch_sizes.append(len(images))
+        outputs = self.script.pop(0)
+        assert len(outputs) == len(images)
+        return outputs if return_conf else [text for text, _ in outputs]
+
+
+def validate(text):
+    return len(text) >= 8 and text[:2].isdigit(), text
+
+
+def grays(n):
+    return [np.full((60, 300), 100 + i, dtype=np.uint8) for i in range(n)]
+
+
+def test_early_exit_only_runs_later_passes_on_misses():
+    recognizer = ScriptedRecognizer([
+        [('51F12345', 0.9), ('XX', 0.9)],  # equalize: crop 0 chốt
+        [('30A99887', 0.3)],               # clahe: hợp lệ nhưng confidence thấp
+        [('30A99887', 0.8)],               # adaptive: chốt
+    ])
+    cascade = RecognitionCascade(recognizer, validate)
+
+    assert cascade.run_many(grays(2)) == ['51F12345', '30A99887']
+    assert recognizer.batch_sizes == [2, 1, 1]
+    assert cascade.fallbacks == 0
+
+
+def test_max_passes_and_exclude_fall_back_to_best_candidate():
+    recognizer = ScriptedRecognizer([[('30A99887', 0.2)]])
+    cascade = RecognitionCascade(recognizer, validate)
+
+    assert cascade.run_many(grays(1), exclude=('clahe',), max_passes=1) == ['30A99887']
+    assert recognizer.batch_sizes == [1]
+    assert cascade.fallbacks == 1
+    assert cascade.pass_runs == {'equalize': 1, 'clahe': 0, 'adaptive': 0}
+
+
+def test_hit_rate_uses_runs_of_each_pass():
+    recognizer = ScriptedRecognizer([
+        [('51F12345', 0.9), ('', 0.0), ('', 0.0), ('', 0.0)],
+        [('30A99887', 0.9), ('', 0.0), ('', 0.0)],
+        [('', 0.0), ('', 0.0)],
+    ])
+    cascade = RecognitionCascade(recognizer, validate)
+    cascade.run_many(grays(4))
+
+    passes = cascade.get_stats()['passes']
+    assert passes['equalize']['hit_rate'] == 0.25
+    assert passes['clahe']['hit_rate'] == round(1 / 3, 4)
+    assert passes['adaptive'] == {'runs': 2, 'hits': 0, 'hit_rate': 0.0}
+
+
+def test_pass_timer_reports_crops_of_each_pass():
+    recognizer = ScriptedRecognizer([[('51F12345', 0.9), ('', 0.0)], [('', 0.0)], [('', 0.0)]])
+    cascade = RecognitionCascade(recognizer, validate)
+    calls = []
+    cascade.run_many(grays(2), pass_timer=lambda name, indices, seconds: calls.append((name, indices)))
+
+    assert calls == [('equalize', [0, 1]), ('clahe', [1]), ('adaptive', [1])]
@@ -0,0 +1,63 @@
+import pytest
+
+from character_recognition.plate_grammar import (
+    PlateGrammarDecoder,
+    format_plate,
+    match_plate,
+    validate_plate,
+)
+
+
+CHARSET = '0123456789ABCDEFGHKLMNPSTUVXYZ'
+
+
+def slots(text, score=0.9):
+    return [{char: score} for char in text]
+
+
+@pytest.mark.parametrize('text, formatted', [
+    ('30A12345', '30A-12345'),   # ô tô, seri 1 chữ
+    ('30A1234', '30A-1234'),
+    ('30AB1234', '30AB-1234'),
+    ('29T182843', '29T1-82843'),  # xe máy, seri chữ + số
+    ('511F12345', '511F-12345'),
+    ('30a-123.45', '30A-12345'),
+])
+def test_valid_plates_share_one_definition(text, formatted):
+    assert validate_plate(text)[0]
+    assert format_plate(text) == formatted
+
+
+@pytest.mark.parametrize('text', ['3OA12345', '30A123', '30A1234567', '3012345678', 'ABCDEFGH', ''])
+def test_invalid_plates(text):
+    assert not validate_plate(text)[0]
+    assert match_plate(text) is None
+
+
+def test_decoder_output_always_validates():
+    decoder = PlateGrammarDecoder(CHARSET)
+    for text in ('30A1234', '30A12345', '30AB1234', '29T182843'):
+        decoded, _ = decoder.decode([slots(text)])
+        assert decoded == text
+        assert validate_plate(decoded)[0]
+
+
+def test_decoder_fixes_confusable_characters():
+    decoder = PlateGrammarDecoder(CHARSET)
+    # O ở vị trí mã tỉnh → 0, 8 ở vị trí seri → B
+    text, score = decoder.decode([slots('3O812345')])
+    assert text == '30B12345'
+    assert 0 < score < 0.9
+
+
+def test_decoder_two_row_plate_uses_top_row_length():
+    decoder = PlateGrammarDecoder(CHARSET)
+    text, _ = decoder.decode([slots('29T1'), slots('82843')])
+    assert text == '29T182843'
+    # Dòng trên 3 ký tự → chỉ template seri 1 ký tự khả thi
+    assert decoder.decode([slots('29T'), slots('182843')]) is None
+
+
+def test_decoder_rejects_impossible_lengths():
+    decoder = PlateGrammarDecoder(CHARSET)
+    assert decoder.decode([slots('30A12')]) is None
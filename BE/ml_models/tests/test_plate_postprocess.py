@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from utils.plate_postprocess import downscale_for_detection, extract_obb_detections, is_valid_bbox
+
+
+class HostArray:
+    """Giả lập tensor ultralytics: .cpu().numpy()"""
+
+    def __init__(self, array):
+        self.array = np.asarray(array, dtype=np.float32)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeOBB:
+    def __init__(self, points, confs):
+        self.xyxyxyxy = HostArray(points)
+        self.conf = HostArray(confs) if confs is not None else None
+
+    def __len__(self):
+        return len(self.xyxyxyxy.array)
+
+
+def result(points, confs):
+    return SimpleNamespace(obb=FakeOBB(points, confs))
+
+
+def box(x1, y1, x2, y2):
+    return [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+
+
+def test_sorted_by_confidence_and_clipped_to_frame():
+    detections = extract_obb_detections(
+        result([box(10, 10, 50, 30), box(-5, 90, 130, 120)], [0.4, 0.9]),
+        frame_shape=(100, 120, 3))
+
+    assert [d['confidence'] for d in detections] == pytest.approx([0.9, 0.4])
+    assert detections[0]['bbox'] == (0, 90, 120, 100)
+    assert detections[1]['bbox'] == (10, 10, 50, 30)
+    assert detections[1]['points'].shape == (4, 2)
+
+
+def test_scale_maps_back_to_original_frame():
+    detections = extract_obb_detections(result([box(10, 20, 30, 40)], [0.8]), (400, 400), scale=0.5)
+    assert detections[0]['bbox'] == (20, 40, 60, 80)
+
+
+def test_empty_and_missing_confidence():
+    assert extract_obb_detections(SimpleNamespace(obb=None), (10, 10)) == []
+    assert extract_obb_detections(result(np.zeros((0, 4, 2)), []), (10, 10)) == []
+    detections = extract_obb_detections(result([box(1, 1, 5, 5)], None), (10, 10))
+    assert detections[0]['confidence'] == 0.0
+
+
+def test_degenerate_bbox_is_invalid():
+    detections = extract_obb_detections(result([box(150, 10, 160, 20)], [0.9]), (100, 120))
+    assert not is_valid_bbox(detections[0]['bbox'])
+
+
+def test_downscale_for_detection():
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    small, scale = downscale_for_detection(frame, 640)
+    assert small.shape == (360, 640, 3) and scale == 0.5
+    assert downscale_for_detection(frame, None) == (frame, 1.0)
+    assert downscale_for_detection(frame, 2000)[1] == 1.0
@@ -0,0 +1,96 @@
+from character_recognition.plate_grammar import validate_plate
+from utils.plate_tracker import PlateTracker
+
+
+def det(x1, y1, x2, y2):
+    return {'bbox': (x1, y1, x2, y2)}
+
+
+def locked_tracker(text='51F12345', now=0.0, **config):
+    tracker = PlateTracker(validate_plate, config)
+    for frame in range(3):
+        track, = tracker.update([det(100, 100, 200, 200)], now=now)
+        assert tracker.needs_ocr(track)
+        tracker.record_read(track, text, now=now)
+    assert track.locked_text == text
+    return tracker, track
+
+
+def test_iou_and_centroid_matching():
+    tracker = PlateTracker(validate_plate)
+    first, = tracker.update([det(100, 100, 200, 200)], now=0.0)
+    # Dịch nhẹ → IoU cao
+    assert tracker.update([det(105, 100, 205, 200)], now=0.0) == [first]
+    # Xe chạy nhanh: IoU thấp nhưng tâm gần → vẫn cùng track (chưa khoá)
+    assert tracker.update([det(160, 100, 260, 200)], now=0.0) == [first]
+    # Xa hẳn → track mới
+    other, = tracker.update([det(600, 400, 700, 500)], now=0.0)
+    assert other is not first
+    assert tracker.get_stats()['active_tracks'] == 2
+
+
+def test_lock_after_consistent_votes():
+    tracker = PlateTracker(validate_plate)
+    track, = tracker.update([det(100, 100, 200, 200)], now=0.0)
+    for text in ('51F12345', '51F12845'):
+        tracker.record_read(track, text, now=0.0)
+    assert not track.locked
+
+    # 3 lần đọc, ký tự yếu nhất 2/3 vote → khoá
+    assert tracker.record_read(track, '51F12345', now=0.0) == '51F12345'
+    assert track.locked_text == '51F12345'
+    assert not tracker.needs_ocr(track)
+
+
+def test_locked_track_not_reassociated_by_centroid():
+    tracker, track = locked_tracker()
+    assigned, = tracker.update([det(160, 100, 260, 200)], now=0.0)
+    assert assigned is not track
+    assert not assigned.locked
+
+
+def test_lock_expires_by_wall_clock():
+    tracker, track = locked_tracker(lock_ttl_s=5.0, reverify_every=0)
+    tracker.update([det(100, 100, 200, 200)], now=4.0)
+    assert track.locked
+    tracker.update([det(100, 100, 200, 200)], now=5.5)
+    assert not track.locked
+    # Vote cũ bị bỏ → phải đồng thuận lại từ đầu
+    assert track.voted_text() == ('', 0, 0.0)
+    assert tracker.get_stats()['locks_expired'] == 1
+
+
+def test_reverify_every_n_frames_renews_or_breaks_lock():
+    tracker, track = locked_tracker(reverify_every=3)
+    for _ in range(2):
+        tracker.update([det(100, 100, 200, 200)], now=1.0)
+        assert not tracker.needs_ocr(track)
+    tracker.update([det(100, 100, 200, 200)], now=1.0)
+    assert tracker.needs_ocr(track)
+
+    # Đọc lại cùng biển → gia hạn khoá
+    assert tracker.record_read(track, '51F12345', now=1.0) == '51F12345'
+    assert track.locked_at == 1.0 and not tracker.needs_ocr(track)
+
+    # Đọc lại ra biển khác → mở khoá, chỉ còn vote của lần đọc mới
+    for _ in range(3):
+        tracker.update([det(100, 100, 200, 200)], now=2.0)
+    assert tracker.needs_ocr(track)
+    assert tracker.record_read(track, '30A99887', now=2.0) == '30A99887'
+    assert not track.locked
+    assert tracker.get_stats()['locks_broken'] == 1
+
+
+def test_crop_hash_change_unlocks():
+    tracker, track = locked_tracker(reverify_every=0, reverify_hash_distance=32)
+    base = (1 << 200) - 1
+    tracker.update([det(100, 100, 200, 200)], now=1.0)
+    assert not tracker.needs_ocr(track, base)  # lần đầu có hash: chỉ ghi nhận
+    assert track.locked
+
+    tracker.update([det(100, 100, 200, 200)], now=1.0)
+    assert not tracker.needs_ocr(track, base ^ 0b1111)  # nhiễu nhỏ → vẫn khoá
+
+    tracker.update([det(100, 100, 200, 200)], now=1.0)
+    assert tracker.needs_ocr(track, base >> 100)  # crop khác hẳn → mở khoá
+    assert not track.locked and track.voted_text()[1] == 0
@@ -0,0 +1,65 @@
+from utils.quality_tiers import DeadlineTracker, QualityController
+
+
+def controller(**config):
+    return QualityController(dict({'smoothing': 1.0, 'min_dwell_s': 3.0}, **config))
+
+
+def test_degrade_respects_min_dwell():
+    quality = controller()
+    quality.record(0.5, now=10.0)
+    assert quality.current['name'] == 'no_nlm'
+    # Vẫn quá tải nhưng chưa đủ min_dwell_s → giữ bậc
+    quality.record(0.5, now=11.0)
+    assert quality.tier == 1
+    quality.record(0.5, now=13.5)
+    quality.record(0.5, now=17.0)
+    assert quality.current['name'] == 'low_res'
+    # Bậc thấp nhất → không giảm tiếp
+    quality.record(0.5, now=30.0)
+    assert quality.tier == 3
+    assert quality.tier_changes == 3
+
+
+def test_hysteresis_band_holds_tier():
+    quality = controller()
+    quality.record(0.5, now=10.0)
+    # Giữa recover (150ms) và degrade (400ms) → không đổi
+    for t in range(20, 40, 5):
+        quality.record(0.3, now=float(t))
+    assert quality.tier == 1
+
+    quality.record(0.1, now=50.0)
+    assert quality.tier == 0
+    assert quality.get_stats()['tier_changes'] == 2
+
+
+def test_disabled_never_changes_tier():
+    quality = controller(enabled=False)
+    quality.record(5.0, now=10.0)
+    assert quality.tier == 0
+
+
+def test_low_res_detector_resolution():
+    quality = controller(low_res_scale=0.75)
+    assert quality.detector_resolution([384, 640], 1280) == ([384, 640], 1280)
+    quality.tier = 3
+    assert quality.detector_resolution([384, 640], 1280) == ([288, 480], 960)
+    assert quality.detector_resolution(None, None) == (None, None)
+
+
+def test_deadline_tracker_uses_clock_offset():
+    tracker = DeadlineTracker(1000)
+    # Chưa có timestamp nào → không bỏ frame
+    assert not tracker.expired(1_000, now=500.0)
+
+    # Đồng hồ client chậm 100s so với server: offset ước lượng từ frame nhanh nhất
+    tracker.observe(1_000_000, received_at=1100.2)
+    tracker.observe(1_000_500, received_at=1100.6)
+    assert abs(tracker.offset - 100.1) < 1e-9
+
+    assert not tracker.expired(1_001_000, now=1101.5)
+    assert tracker.expired(1_001_000, now=1102.5)
+    assert tracker.misses == 1
+
+    assert not DeadlineTracker(0).expired(1, now=1e9)
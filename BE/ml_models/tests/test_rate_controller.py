@@ -0,0 +1,63 @@
+import pytest
+
+from utils.rate_controller import RateController
+
+
+def test_multiplicative_decrease_down_to_min_fps():
+    controller = RateController({'max_fps': 10.0, 'min_fps': 2.0, 'decrease_factor': 0.5})
+    controller.record_latency(1.2, queue_delay=1.0)
+    assert controller.target_fps == pytest.approx(5.0)
+    for _ in range(5):
+        controller.record_latency(1.2, queue_delay=1.0)
+    assert controller.target_fps == 2.0
+
+
+def test_slow_service_time_without_queue_keeps_fps():
+    # CPU chậm: 1 lần inference 800ms nhưng frame không phải chờ → giảm FPS không giúp gì
+    controller = RateController({'max_fps': 10.0, 'queue_delay_budget_ms': 100})
+    for _ in range(20):
+        controller.record_latency(0.8, queue_delay=0.01)
+    assert controller.target_fps == 10.0
+    stats = controller.get_stats()
+    assert stats['latency_ms'] == 800.0 and stats['queue_delay_ms'] == 10.0
+
+
+def test_additive_increase_only_with_headroom():
+    controller = RateController({'max_fps': 10.0, 'queue_delay_budget_ms': 100, 'headroom_ratio': 0.6,
+                                 'increase_step': 0.5, 'smoothing': 1.0})
+    controller.target_fps = 4.0
+    # Trong budget nhưng chưa đủ headroom → giữ nguyên
+    controller.record_latency(0.5, queue_delay=0.08)
+    assert controller.target_fps == 4.0
+    controller.record_latency(0.5, queue_delay=0.03)
+    assert controller.target_fps == 4.5
+    for _ in range(20):
+        controller.record_latency(0.5, queue_delay=0.03)
+    assert controller.target_fps == 10.0
+
+
+def test_accept_drops_frames_above_target_fps():
+    controller = RateController({'max_fps': 5.0})
+    accepted = [controller.accept(now=i * 0.1) for i in range(10)]  # client gửi 10 FPS
+    assert accepted == [True, False] * 5
+    assert controller.get_stats()['skip_ratio'] == 0.5
+
+    disabled = RateController({'enabled': False, 'max_fps': 5.0})
+    assert all(disabled.accept(now=i * 0.1) for i in range(10))
+
+
+def test_advice_slow_down_then_speed_up():
+    controller = RateController({'max_fps': 10.0, 'min_fps': 1.0, 'decrease_factor': 0.5,
+                                 'advise_interval_s': 2.0, 'smoothing': 1.0})
+    for i in range(5):
+        controller.accept(now=i * 0.05)  # 20 FPS
+    controller.record_latency(1.2, queue_delay=1.0)  # → target 5 FPS
+    assert controller.advice(now=10.0) == 5.0
+    # Không gửi lại khi chưa hết advise_interval_s / chưa đổi
+    assert controller.advice(now=11.0) is None
+    assert controller.advice(now=13.0) is None
+
+    # Hết hàng đợi → target về max_fps → báo client tăng lại
+    for _ in range(20):
+        controller.record_latency(0.2, queue_delay=0.005)
+    assert controller.advice(now=20.0) == 10.0
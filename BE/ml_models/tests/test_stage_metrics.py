@@ -0,0 +1,54 @@
+from utils.stage_metrics import StageMetrics, merge_snapshots, render_prometheus
+
+
+def test_observe_buckets_and_discard():
+    metrics = StageMetrics([10, 100])
+    metrics.observe('gate_1', 'detect', 0.005)
+    metrics.observe('gate_1', 'detect', 0.05)
+    metrics.observe('gate_1', 'detect', 2.0)
+    metrics.observe_many(['gate_1', 'gate_1', 'gate_2'], 'ocr_clahe', 0.001)
+
+    snapshot = metrics.snapshot()
+    assert snapshot['gate_1']['detect']['counts'] == [1, 1, 1]
+    assert snapshot['gate_1']['detect']['count'] == 3
+    assert snapshot['gate_1']['ocr_clahe']['count'] == 1
+    assert snapshot['gate_2']['ocr_clahe']['counts'] == [1, 0, 0]
+
+    metrics.discard('gate_1')
+    assert set(metrics.snapshot()) == {'gate_2'}
+
+
+def test_merge_snapshots_adds_counts():
+    a, b = StageMetrics([10]), StageMetrics([10])
+    a.observe('gate_1', 'total', 0.001)
+    b.observe('gate_1', 'total', 1.0)
+    b.observe('gate_2', 'total', 0.001)
+
+    merged = merge_snapshots([a.snapshot(), None, b.snapshot()])
+    assert merged['gate_1']['total']['counts'] == [1, 1]
+    assert merged['gate_1']['total']['sum'] == 1.001
+    assert merged['gate_2']['total']['count'] == 1
+    # Không sửa snapshot gốc
+    assert a.snapshot()['gate_1']['total']['counts'] == [1, 0]
+
+
+def test_render_prometheus_cumulative_buckets_and_gauges():
+    metrics = StageMetrics([10, 100])
+    metrics.observe('gate "1"', 'detect', 0.005)
+    metrics.observe('gate "1"', 'detect', 0.05)
+
+    text = render_prometheus(metrics.snapshot(), metrics.buckets, [
+        ('eparking_quality_tier', 'Current quality tier.', 'gauge', [({}, 2)]),
+        ('eparking_frames_dropped_total', 'Dropped frames.', 'counter', [({'camera': 'gate_2'}, 5)]),
+    ])
+    lines = text.splitlines()
+    labels = 'camera="gate \\"1\\"",stage="detect"'
+    assert '# TYPE eparking_stage_latency_seconds histogram' in lines
+    assert f'eparking_stage_latency_seconds_bucket{{{labels},le="0.01"}} 1' in lines
+    assert f'eparking_stage_latency_seconds_bucket{{{labels},le="0.1"}} 2' in lines
+    assert f'eparking_stage_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f'eparking_stage_latency_seconds_sum{{{labels}}} 0.055000' in lines
+    assert f'eparking_stage_latency_seconds_count{{{labels}}} 2' in lines
+    assert 'eparking_quality_tier 2' in lines
+    assert 'eparking_frames_dropped_total{camera="gate_2"} 5' in lines
+    assert text.endswith('\n')
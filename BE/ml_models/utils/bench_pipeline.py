@@ -0,0 +1,371 @@
+"""
+Replay benchmark cho pipeline nhận diện biển số
+Phát lại video / thư mục ảnh qua LicensePlateDetector.detect_and_recognize (inference.py)
+và PersistentDetector.detect_and_annotate (websocket_detector) ở tốc độ cố định, đo:
+throughput, latency p50/p95/p99 từng stage, peak RSS, độ chính xác (nếu có ground truth)
+
+Mỗi pipeline chạy trong 1 process riêng (spawn) → peak RSS không lẫn model của pipeline kia
+
+Usage:
+    python bench_pipeline.py --source ./gate_clip.mp4 --fps 10 --output run_main.json
+    python bench_pipeline.py --source ./eval_frames --ground-truth ./eval_frames/labels.csv \\
+        --pipelines persistent --metadata --output run_branch.json
+    python bench_pipeline.py --compare run_main.json run_branch.json --threshold 10
+
+Ground truth CSV: 2 cột `filename,plate` - ảnh dùng tên file, video dùng `frame_000123` (số thứ tự frame)
+--compare trả exit code 1 nếu có regression (latency / throughput vượt ngưỡng %, accuracy giảm)
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from queue import Empty
+
+import cv2
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.export_models import DETECTOR_PATH, list_images
+from utils.quantize_models import load_ground_truth, normalize_plate
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PIPELINES = ('inference', 'persistent')
+PERCENTILES = (50, 95, 99)
+
+
+def iter_frames(source, max_frames=None):
+    """Frame từ video hoặc thư mục ảnh → (name, BGR frame)"""
+    count = 0
+    if os.path.isdir(source):
+        for path in list_images(source):
+            if max_frames is not None and count >= max_frames:
+                return
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            count += 1
+            yield os.path.basename(path), frame
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {source}")
+    try:
+        index = 0
+        while max_frames is None or count < max_frames:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield f'frame_{index:06d}', frame
+            index += 1
+            count += 1
+    finally:
+        cap.release()
+
+
+def peak_rss_mb():
+    """Peak RSS của process hiện tại (MB) - None nếu không đo được"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux: KB, macOS: bytes
+        return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+    except (ImportError, AttributeError):
+        return None
+
+
+def summarize(samples_ms):
+    """Thống kê latency (ms) của 1 stage"""
+    if not samples_ms:
+        return None
+    values = np.asarray(samples_ms, dtype=np.float64)
+    summary = {f'p{p}': round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+    summary['mean'] = round(float(values.mean()), 2)
+    summary['max'] = round(float(values.max()), 2)
+    summary['count'] = int(values.size)
+    return summary
+
+
+class StageRecorder:
+    """
+    Thay StageMetrics của PersistentDetector (cùng interface observe / observe_many)
+    nhưng giữ từng mẫu → tính percentile chính xác thay vì theo bucket histogram
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    def observe(self, camera_id, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds * 1000)
+
+    def observe_many(self, camera_ids, stage, seconds):
+        self.observe(None, stage, seconds)
+
+    def snapshot(self):
+        return {}
+
+
+def _make_inference_runner(args):
+    from utils.inference import LicensePlateDetector
+
+    detector = LicensePlateDetector(backend=args.backend, precision=args.precision)
+    recorder = StageRecorder()
+
+    def run(frame, stages, warmup=False):
+        result = detector.detect_and_recognize(frame, conf_threshold=0.25, multi_plate=args.multi_plate,
+                                               metrics=recorder)
+        for stage, samples in recorder.samples.items():
+            stages.setdefault(stage, []).extend(samples)
+        recorder.samples.clear()
+        return result.get('plate_number')
+
+    info = {
+        'detector': f"{detector.backend}/{detector.precision}",
+        'recognizer': f"{detector.recognizer.backend}/{detector.recognizer.precision}"
+    }
+    return run, info, lambda: {}
+
+
+def _make_persistent_runner(args):
+    from utils.persistent_detector import PersistentDetector, encode_annotated
+
+    detector = PersistentDetector(DETECTOR_PATH, backend=args.backend, precision=args.precision)
+    recorder = detector.metrics = StageRecorder()
+
+    def run(frame, stages, warmup=False):
+        # Warmup dùng cameraId riêng → không để lại track / background motion cho lần đo
+        camera_id = f'{args.camera_id}_warmup' if warmup else args.camera_id
+        annotated, plate_info = detector.detect_and_annotate(frame, multi_plate=args.multi_plate,
+                                                             camera_id=camera_id, annotate=not args.metadata)
+        encode_annotated(annotated, recorder, camera_id)
+        for stage, samples in recorder.samples.items():
+            stages.setdefault(stage, []).extend(samples)
+        recorder.samples.clear()
+        return plate_info['text'] if plate_info else None
+
+    def extra_stats():
+        stats = detector.get_stats()
+        return {key: stats[key] for key in ('ocr_cascade', 'tracking', 'motion_gate', 'quality') if key in stats}
+
+    info = {
+        'detector': f"{detector.backend}/{detector.precision}",
+        'recognizer': f"{detector.recognizer.backend}/{detector.recognizer.precision}"
+    }
+    return run, info, extra_stats
+
+
+def run_pipeline(pipeline, args):
+    """
+    Phát lại source qua 1 pipeline ở tốc độ args.fps (0 = nhanh nhất có thể)
+
+    Returns:
+        dict kết quả của pipeline
+    """
+    factory = _make_inference_runner if pipeline == 'inference' else _make_persistent_runner
+    run, info, extra_stats = factory(args)
+    ground_truth = load_ground_truth(args.ground_truth) if args.ground_truth else None
+
+    # Warmup (không tính) - lazy init, cudnn autotune...
+    for _, frame in iter_frames(args.source, args.warmup):
+        run(frame, {}, warmup=True)
+
+    stages = {}
+    reads = {}
+    lag_ms = []
+    interval = 1.0 / args.fps if args.fps > 0 else 0.0
+    start = time.perf_counter()
+
+    for index, (name, frame) in enumerate(iter_frames(args.source, args.max_frames)):
+        # Lịch phát cố định: frame i tới lúc start + i / fps (pipeline chậm hơn → frame trễ, đo lag)
+        scheduled = start + index * interval
+        now = time.perf_counter()
+        if now < scheduled:
+            time.sleep(scheduled - now)
+        lag_ms.append(max(0.0, time.perf_counter() - scheduled) * 1000)
+
+        frame_start = time.perf_counter()
+        text = run(frame, stages)
+        stages.setdefault('total', []).append((time.perf_counter() - frame_start) * 1000)
+        reads[name] = normalize_plate(text)
+
+    elapsed = time.perf_counter() - start
+    frames = len(reads)
+
+    report = {
+        **info,
+        'frames': frames,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_fps': round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': {stage: summarize(samples) for stage, samples in sorted(stages.items())},
+        'schedule_lag_ms': summarize(lag_ms),
+        'peak_rss_mb': peak_rss_mb(),
+        'read_rate': round(sum(1 for text in reads.values() if text) / frames, 4) if frames else 0.0,
+    }
+    if ground_truth:
+        labelled = [name for name in reads if name in ground_truth]
+        correct = sum(1 for name in labelled if reads[name] == ground_truth[name])
+        report['labelled_frames'] = len(labelled)
+        report['exact_plate_accuracy'] = round(correct / len(labelled), 4) if labelled else None
+    report.update(extra_stats())
+    return report
+
+
+def _pipeline_process(pipeline, args, queue):
+    try:
+        queue.put(('ok', run_pipeline(pipeline, args)))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        queue.put(('error', str(e)))
+
+
+def run_isolated(pipeline, args):
+    """Chạy 1 pipeline trong process con (spawn) - peak RSS chỉ của pipeline đó"""
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_pipeline_process, args=(pipeline, args, queue), name=f'bench-{pipeline}')
+    process.start()
+    try:
+        while True:
+            try:
+                status, payload = queue.get(timeout=1.0)
+                break
+            except Empty:
+                if not process.is_alive():
+                    return {'error': f'Benchmark process exited (code {process.exitcode})'}
+    finally:
+        process.join()
+    return payload if status == 'ok' else {'error': payload}
+
+
+def compare_reports(base, new, threshold):
+    """
+    So sánh 2 file kết quả
+
+    Returns:
+        (rows, regressions) - rows: (pipeline, metric, base, new, change %, regression?)
+    """
+    rows, regressions = [], []
+    for pipeline in sorted(set(base['pipelines']) & set(new['pipelines'])):
+        b, n = base['pipelines'][pipeline], new['pipelines'][pipeline]
+        if 'error' in b or 'error' in n:
+            continue
+
+        metrics = [('throughput_fps', b.get('throughput_fps'), n.get('throughput_fps'), False),
+                   ('peak_rss_mb', b.get('peak_rss_mb'), n.get('peak_rss_mb'), True)]
+        for stage in sorted(set(b['latency_ms']) & set(n['latency_ms'])):
+            for p in PERCENTILES:
+                metrics.append((f'{stage}.p{p}_ms', (b['latency_ms'][stage] or {}).get(f'p{p}'),
+                                (n['latency_ms'][stage] or {}).get(f'p{p}'), True))
+
+        for name, old, cur, lower_is_better in metrics:
+            if old is None or cur is None:
+                continue
+            change = (cur - old) / old * 100 if old else 0.0
+            worse = change > threshold if lower_is_better else change < -threshold
+            rows.append((pipeline, name, old, cur, change, worse))
+            if worse:
+                regressions.append(f'{pipeline} {name}: {old} → {cur} ({change:+.1f}%)')
+
+        old_acc, cur_acc = b.get('exact_plate_accuracy'), n.get('exact_plate_accuracy')
+        if old_acc is not None and cur_acc is not None:
+            worse = cur_acc < old_acc
+            rows.append((pipeline, 'exact_plate_accuracy', old_acc, cur_acc,
+                         (cur_acc - old_acc) * 100, worse))
+            if worse:
+                regressions.append(f'{pipeline} exact_plate_accuracy: {old_acc} → {cur_acc}')
+    return rows, regressions
+
+
+def print_report(report):
+    for pipeline, result in report['pipelines'].items():
+        print("\n" + "=" * 60)
+        print(f"{pipeline}: {result.get('detector', '')} + {result.get('recognizer', '')}")
+        print("=" * 60)
+        if 'error' in result:
+            print(f"ERROR: {result['error']}")
+            continue
+        print(f"Frames: {result['frames']}  Throughput: {result['throughput_fps']} FPS  "
+              f"Peak RSS: {result['peak_rss_mb']} MB")
+        if 'exact_plate_accuracy' in result:
+            print(f"Accuracy: {result['exact_plate_accuracy']} ({result['labelled_frames']} labelled frames)")
+        print(f"{'stage':<20} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}  (ms)")
+        for stage, s in result['latency_ms'].items():
+            if s:
+                print(f"{stage:<20} {s['p50']:>9.2f} {s['p95']:>9.2f} {s['p99']:>9.2f} {s['mean']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay benchmark cho pipeline nhận diện biển số')
+    parser.add_argument('--source', help='File video hoặc thư mục ảnh')
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument('--fps', type=float, default=0.0, help='Tốc độ phát lại (0 = nhanh nhất có thể)')
+    parser.add_argument('--max-frames', type=int, help='Số frame tối đa')
+    parser.add_argument('--warmup', type=int, default=3, help='Số frame chạy trước khi đo')
+    parser.add_argument('--backend', help='pytorch | onnx | openvino (mặc định theo config.json)')
+    parser.add_argument('--precision', help='fp32 | quantized (mặc định theo config.json)')
+    parser.add_argument('--multi-plate', action='store_true')
+    parser.add_argument('--metadata', action='store_true',
+                        help='PersistentDetector ở chế độ metadata (không vẽ / encode)')
+    parser.add_argument('--camera-id', default='bench', help='cameraId cho PersistentDetector (ROI, tracking)')
+    parser.add_argument('--ground-truth', help='CSV filename,plate')
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='So sánh 2 file kết quả')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Ngưỡng regression (%%) cho --compare')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        rows, regressions = compare_reports(base, new, args.threshold)
+        print(f"{'pipeline':<12} {'metric':<28} {'base':>10} {'new':>10} {'change':>9}")
+        for pipeline, name, old, cur, change, worse in rows:
+            print(f"{pipeline:<12} {name:<28} {old:>10} {cur:>10} {change:>+8.1f}%{'  ← REGRESSION' if worse else ''}")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) (threshold {args.threshold}%)")
+            return 1
+        print("\nNo regressions")
+        return 0
+
+    if not args.source:
+        parser.error('--source is required unless --compare')
+    if not os.path.exists(args.source):
+        parser.error(f'Source not found: {args.source}')
+
+    report = {
+        'source': os.path.abspath(args.source),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {
+            'fps': args.fps, 'max_frames': args.max_frames, 'warmup': args.warmup,
+            'backend': args.backend, 'precision': args.precision,
+            'multi_plate': args.multi_plate, 'metadata': args.metadata
+        },
+        'pipelines': {}
+    }
+    for pipeline in args.pipelines:
+        print(f"\n▶ Running {pipeline} pipeline...")
+        report['pipelines'][pipeline] = run_isolated(pipeline, args)
+
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+    return 0 if all('error' not in r for r in report['pipelines'].values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
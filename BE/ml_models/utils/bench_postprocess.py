@@ -0,0 +1,129 @@
+"""
+Microbenchmark: post-processing OBB + character boxes
+So sánh cách cũ (copy từng box .cpu() + vòng lặp Python) với cách vectorized hiện tại
+
+Usage:
+    python bench_postprocess.py
+    python bench_postprocess.py --plates 3 --chars 9 --iters 2000 --device cuda
+"""
+
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from ultralytics.engine.results import OBB, Boxes
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.plate_postprocess import extract_obb_detections
+from character_recognition.plate_grammar import PlateGrammarDecoder
+from character_recognition.plate_recognizer_inference import PlateRecognizer
+
+CHARSET = '0123456789ABCDEFGHIKLMNOPQRSTUVWXYZ'
+FRAME_SHAPE = (720, 1280, 3)
+PLATE_SHAPE = (100, 300)
+
+
+def make_obb_result(n_plates, device):
+    """Kết quả OBB giả: [x, y, w, h, rotation, conf, cls]"""
+    rng = np.random.default_rng(0)
+    data = np.column_stack([
+        rng.uniform(100, 1100, n_plates), rng.uniform(100, 600, n_plates),
+        rng.uniform(80, 160, n_plates), rng.uniform(30, 60, n_plates),
+        rng.uniform(-0.2, 0.2, n_plates), rng.uniform(0.3, 0.95, n_plates),
+        np.zeros(n_plates),
+    ])
+    return SimpleNamespace(obb=OBB(torch.tensor(data, dtype=torch.float32, device=device), FRAME_SHAPE[:2]))
+
+
+def make_char_result(n_chars, device):
+    """Kết quả character boxes giả: [x1, y1, x2, y2, conf, cls]"""
+    rng = np.random.default_rng(1)
+    x1 = np.arange(n_chars) * (PLATE_SHAPE[1] / n_chars)
+    data = np.column_stack([
+        x1, np.full(n_chars, 20.0), x1 + 25, np.full(n_chars, 80.0),
+        rng.uniform(0.5, 0.99, n_chars), rng.integers(0, len(CHARSET), n_chars),
+    ])
+    return SimpleNamespace(boxes=Boxes(torch.tensor(data, dtype=torch.float32, device=device), PLATE_SHAPE))
+
+
+def legacy_obb(result, frame_shape):
+    """Cách cũ: copy từng box, giữ box confidence cao nhất"""
+    best_detection = None
+    best_conf = 0.0
+    h, w = frame_shape[:2]
+    for obb in result.obb:
+        conf = float(obb.conf[0]) if obb.conf is not None else 0.0
+        if conf > best_conf:
+            best_conf = conf
+            points = obb.xyxyxyxy[0].cpu().numpy().astype(int)
+            x1, x2 = max(0, int(points[:, 0].min())), min(w, int(points[:, 0].max()))
+            y1, y2 = max(0, int(points[:, 1].min())), min(h, int(points[:, 1].max()))
+            best_detection = {'bbox': (x1, y1, x2, y2), 'points': points, 'confidence': conf}
+    return best_detection
+
+
+def legacy_chars(recognizer, result, img_height):
+    """Cách cũ: copy từng box xyxy/cls/conf rồi sắp xếp bằng tuple"""
+    detections = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+        char = recognizer.model.names[int(box.cls[0])]
+        c = float(box.conf[0])
+        detections.append(((x1 + x2) / 2, (y1 + y2) / 2, char, c))
+    return recognizer._sort_and_assemble(detections, img_height)
+
+
+def bench(fn, iters):
+    for _ in range(min(50, iters)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - start) / iters * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark post-processing per frame')
+    parser.add_argument('--plates', type=int, default=3, help='Số OBB mỗi frame')
+    parser.add_argument('--chars', type=int, default=9, help='Số character box mỗi biển')
+    parser.add_argument('--iters', type=int, default=1000)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    # Recognizer không load model - chỉ cần names + decoder để đo post-processing
+    recognizer = object.__new__(PlateRecognizer)
+    recognizer.model = SimpleNamespace(names=dict(enumerate(CHARSET)))
+    recognizer.decoder = None
+
+    obb_result = make_obb_result(args.plates, args.device)
+    char_result = make_char_result(args.chars, args.device)
+
+    rows = [
+        ('OBB (legacy per-box)', bench(lambda: legacy_obb(obb_result, FRAME_SHAPE), args.iters)),
+        ('OBB (vectorized)', bench(lambda: extract_obb_detections(obb_result, FRAME_SHAPE), args.iters)),
+        ('Chars (legacy per-box)', bench(lambda: legacy_chars(recognizer, char_result, PLATE_SHAPE[0]), args.iters)),
+        ('Chars (vectorized)', bench(lambda: recognizer._parse_result(char_result, PLATE_SHAPE[0]), args.iters)),
+    ]
+    recognizer.decoder = PlateGrammarDecoder(CHARSET)
+    rows.append(('Chars (vectorized + grammar)',
+                 bench(lambda: recognizer._parse_result(char_result, PLATE_SHAPE[0]), args.iters)))
+
+    print(f"\nPost-processing per frame ({args.plates} plates, {args.chars} chars/plate, "
+          f"device={args.device}, {args.iters} iters)")
+    print("-" * 56)
+    for name, us in rows:
+        print(f"{name:<34} {us:>10.1f} µs")
+
+    # Mỗi frame: 1 lần OBB + (số biển × số pass OCR) lần parse ký tự
+    print("-" * 56)
+    print(f"Speedup OBB:   {rows[0][1] / rows[1][1]:.1f}x")
+    print(f"Speedup chars: {rows[2][1] / rows[3][1]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Camera ROI Module
+Vùng quan tâm (ROI) theo từng camera: detector chỉ chạy trên vùng làn xe thay vì cả frame
+Hỗ trợ tiled mode cho camera độ phân giải cao: chia ROI thành các tile ở độ phân giải gốc
+để biển số nhỏ vẫn detect được mà không phải phóng to cả frame
+
+Cấu hình trong plate_detector/config.json (key "camera_rois") hoặc gửi kèm register_camera:
+    "camera_rois": {
+        "camera_1": {
+            "polygon": [[0.25, 0.4], [0.8, 0.4], [0.9, 1.0], [0.15, 1.0]],   # toạ độ 0-1 hoặc pixel
+            "tiled": false,
+            "tile_size": 640,
+            "tile_overlap": 0.2
+        }
+    }
+"""
+
+import cv2
+import numpy as np
+
+from utils.plate_postprocess import detect_plates_batch, extract_obb_detections
+
+
+class CameraROI:
+    """ROI polygon của 1 camera"""
+
+    def __init__(self, polygon, tiled=False, tile_size=640, tile_overlap=0.2):
+        self.polygon = np.array(polygon, dtype=np.float32)
+        if self.polygon.ndim != 2 or self.polygon.shape[0] < 3 or self.polygon.shape[1] != 2:
+            raise ValueError(f"ROI polygon needs at least 3 [x, y] points, got {polygon}")
+
+        # Toàn bộ toạ độ <= 1 → toạ độ chuẩn hoá theo kích thước frame
+        self.normalized = bool(self.polygon.max() <= 1.0)
+        self.tiled = bool(tiled)
+        self.tile_size = int(tile_size)
+        self.tile_overlap = float(tile_overlap)
+
+        self._cached_shape = None
+        self._cached_polygon = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['polygon'],
+            tiled=config.get('tiled', False),
+            tile_size=config.get('tile_size', 640),
+            tile_overlap=config.get('tile_overlap', 0.2)
+        )
+
+    def pixel_polygon(self, frame_shape):
+        """Polygon theo pixel cho frame_shape (cache theo kích thước frame)"""
+        h, w = frame_shape[:2]
+        if self._cached_shape != (h, w):
+            polygon = self.polygon * np.array([w, h], dtype=np.float32) if self.normalized else self.polygon
+            self._cached_polygon = polygon.astype(np.int32)
+            self._cached_shape = (h, w)
+        return self._cached_polygon
+
+    def bounds(self, frame_shape):
+        """Hình chữ nhật bao polygon (x1, y1, x2, y2), clip trong frame"""
+        h, w = frame_shape[:2]
+        polygon = self.pixel_polygon(frame_shape)
+        x1, y1 = np.maximum(polygon.min(axis=0), 0)
+        x2, y2 = polygon.max(axis=0)
+        return int(x1), int(y1), int(min(w, x2)), int(min(h, y2))
+
+    def contains(self, frame_shape, point):
+        """Điểm (x, y) có nằm trong polygon không"""
+        polygon = self.pixel_polygon(frame_shape)
+        return cv2.pointPolygonTest(polygon, (float(point[0]), float(point[1])), False) >= 0
+
+    def tiles(self, bounds):
+        """Các tile (x1, y1, x2, y2) phủ kín bounds, chồng lấn tile_overlap"""
+        x1, y1, x2, y2 = bounds
+        size = self.tile_size
+        step = max(1, int(size * (1 - self.tile_overlap)))
+
+        def starts(lo, hi):
+            if hi - lo <= size:
+                return [lo]
+            positions = list(range(lo, hi - size, step))
+            positions.append(hi - size)
+            return positions
+
+        return [(tx, ty, min(tx + size, x2), min(ty + size, y2))
+                for ty in starts(y1, y2) for tx in starts(x1, x2)]
+
+
+def load_camera_rois(config):
+    """Đọc "camera_rois" từ config detector → {camera_id: CameraROI}"""
+    rois = {}
+    for camera_id, roi_config in (config.get('camera_rois') or {}).items():
+        try:
+            rois[camera_id] = CameraROI.from_config(roi_config)
+        except (KeyError, ValueError) as e:
+            print(f"[CameraROI] Invalid ROI for {camera_id}: {e}")
+    return rois
+
+
+def _offset(detection, dx, dy):
+    """Dịch detection từ toạ độ crop về toạ độ frame"""
+    x1, y1, x2, y2 = detection['bbox']
+    return {
+        'bbox': (x1 + dx, y1 + dy, x2 + dx, y2 + dy),
+        'points': detection['points'] + np.array([dx, dy]),
+        'confidence': detection['confidence']
+    }
+
+
+def _merge_tiles(detections, iou_threshold=0.5):
+    """NMS giữa các tile chồng lấn (giữ box confidence cao hơn)"""
+    kept = []
+    for det in sorted(detections, key=lambda d: d['confidence'], reverse=True):
+        ax1, ay1, ax2, ay2 = det['bbox']
+        duplicate = False
+        for other in kept:
+            bx1, by1, bx2, by2 = other['bbox']
+            iw = max(0, min(ax2, bx2) - max(ax1, bx1))
+            ih = max(0, min(ay2, by2) - max(ay1, by1))
+            inter = iw * ih
+            union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+            if union > 0 and inter / union >= iou_threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(det)
+    return kept
+
+
+def detect_plates_in_roi(model, frame, conf, roi=None, imgsz=None, max_side=None):
+    """
+    Detect biển số chỉ trong ROI của camera, kết quả theo toạ độ frame gốc
+
+    - Không có ROI: như detect_plates (cả frame)
+    - ROI thường: crop hình chữ nhật bao polygon (view, không copy) rồi detect
+    - ROI tiled: chia thành các tile tile_size ở độ phân giải gốc, chạy 1 batch, NMS giữa tile
+    Detection có tâm nằm ngoài polygon bị loại.
+    """
+    return detect_plates_in_rois(model, [frame], [roi], conf, imgsz=imgsz, max_side=max_side)[0]
+
+
+def detect_plates_in_rois(model, frames, rois, conf, imgsz=None, max_side=None):
+    """
+    Như detect_plates_in_roi cho nhiều frame (nhiều camera):
+    tất cả frame / ROI không tiled đi chung 1 batch detector, ROI tiled chạy batch tile riêng
+
+    Returns:
+        list (cùng thứ tự frames) các list detections
+    """
+    outputs = [[] for _ in frames]
+
+    batch_index, batch_crops, batch_offsets = [], [], []
+    for i, (frame, roi) in enumerate(zip(frames, rois)):
+        if roi is None:
+            batch_index.append(i)
+            batch_crops.append(frame)
+            batch_offsets.append((0, 0))
+            continue
+
+        bx1, by1, bx2, by2 = roi.bounds(frame.shape)
+        if bx2 <= bx1 or by2 <= by1:
+            continue
+
+        if roi.tiled:
+            outputs[i] = _detect_tiled(model, frame, conf, roi, (bx1, by1, bx2, by2))
+        else:
+            batch_index.append(i)
+            batch_crops.append(frame[by1:by2, bx1:bx2])
+            batch_offsets.append((bx1, by1))
+
+    batch_results = detect_plates_batch(model, batch_crops, conf, imgsz=imgsz, max_side=max_side)
+    for i, (dx, dy), detections in zip(batch_index, batch_offsets, batch_results):
+        outputs[i] = [_offset(d, dx, dy) for d in detections] if (dx or dy) else detections
+
+    for i, (frame, roi) in enumerate(zip(frames, rois)):
+        if roi is None or not outputs[i]:
+            continue
+        detections = [d for d in outputs[i]
+                      if roi.contains(frame.shape, ((d['bbox'][0] + d['bbox'][2]) / 2,
+                                                    (d['bbox'][1] + d['bbox'][3]) / 2))]
+        detections.sort(key=lambda d: d['confidence'], reverse=True)
+        outputs[i] = detections
+
+    return outputs
+
+
+def _detect_tiled(model, frame, conf, roi, bounds):
+    """Chạy các tile của ROI ở độ phân giải gốc trong 1 batch, NMS giữa tile"""
+    tiles = roi.tiles(bounds)
+    crops = [frame[ty1:ty2, tx1:tx2] for tx1, ty1, tx2, ty2 in tiles]
+    results = model(crops, conf=conf, imgsz=roi.tile_size, verbose=False)
+    detections = []
+    for (tx1, ty1, _, _), crop, result in zip(tiles, crops, results or []):
+        detections.extend(_offset(d, tx1, ty1) for d in extract_obb_detections(result, crop.shape))
+    return _merge_tiles(detections)
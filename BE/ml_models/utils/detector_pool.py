@@ -0,0 +1,537 @@
+"""
+Detector Pool Module
+Pool nhiều process detector (mỗi process giữ model riêng, không chung GIL / torch threads)
+
+- Camera được chia shard cho các worker (websocket_detector gán camera → worker ít camera nhất)
+- Frame đã decode chuyển sang worker qua ring buffer multiprocessing.shared_memory
+  (mỗi worker 1 ring, mỗi slot chứa 1 frame) - chỉ metadata nhỏ đi qua Queue, không pickle ảnh
+- Worker detect + vẽ + encode JPEG, trả về JPEG bytes + plate_info + stats + histogram stage của worker
+- Profile theo yêu cầu: sampling profiler trong worker / torch op profile của 1 batch (utils/profiler)
+- Worker chết (crash, OOM kill): batch đang chờ của worker đó báo lỗi ngay, worker được khởi động lại
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.stage_metrics import merge_snapshots
+from utils.profiler import profile_for, torch_op_profile
+
+
+# 1920x1080 BGR
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3
+
+# Khoảng kiểm tra worker còn sống + backoff tối đa giữa các lần khởi động lại (giây)
+MONITOR_INTERVAL = 1.0
+MAX_RESTART_BACKOFF = 60.0
+
+
+class SharedFrameRing:
+    """Ring buffer các slot frame trong 1 block shared memory (phía process chính)"""
+
+    def __init__(self, slots, slot_bytes):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self._free = list(range(slots))
+        self._cond = threading.Condition()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self, count):
+        """Chờ tới khi có đủ `count` slot trống (backpressure khi worker chậm)"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._free) >= count)
+            taken, self._free = self._free[:count], self._free[count:]
+            return taken
+
+    def release(self, slots):
+        with self._cond:
+            self._free.extend(slots)
+            self._cond.notify_all()
+
+    def write(self, slot, frame):
+        """Copy frame vào slot (1 memcpy), trả về shape để worker dựng lại view"""
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f'Frame too large for shared buffer: {frame.nbytes} > {self.slot_bytes} bytes')
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, frame)
+        return frame.shape
+
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _worker_main(worker_id, shm_name, slot_bytes, task_queue, result_queue, detector_kwargs, num_threads):
+    """Process worker: load PersistentDetector 1 lần, xử lý từng batch frame trong shared memory"""
+    # Chia core cho các worker - tránh N process x toàn bộ core torch threads
+    cv2.setNumThreads(num_threads)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        from utils.persistent_detector import PersistentDetector, encode_annotated
+        detector = PersistentDetector(**detector_kwargs)
+    except Exception as e:
+        result_queue.put(('fatal', worker_id, str(e)))
+        shm.close()
+        return
+
+    result_queue.put(('ready', worker_id, detector.get_stats()))
+    roi_overrides = {}
+
+    def run_profile(request_id, seconds, interval):
+        text = profile_for(seconds, interval, prefix=f'detector-worker-{worker_id}')
+        result_queue.put(('profile', worker_id, (request_id, text)))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        if task[0] == 'profile':
+            # Sampling profiler chạy thread riêng - worker vẫn xử lý batch trong lúc lấy mẫu
+            _, request_id, seconds, interval = task
+            threading.Thread(target=run_profile, args=(request_id, seconds, interval),
+                             name='sampling-profiler', daemon=True).start()
+            continue
+
+        if task[0] == 'discard':
+            # Camera ngắt kết nối → bỏ histogram của camera, gửi lại snapshot cho process chính
+            detector.metrics.discard(task[1])
+            result_queue.put(('metrics', worker_id, detector.get_metrics()))
+            continue
+
+        _, batch_id, items, op_profile = task
+        try:
+            requests = []
+            for item in items:
+                camera_id = item['camera_id']
+                # ROI gửi kèm register_camera (ghi đè config) - chỉ đặt lại khi thay đổi
+                if item.get('roi') is not None and roi_overrides.get(camera_id) != item['roi']:
+                    detector.set_camera_roi(camera_id, item['roi'])
+                    roi_overrides[camera_id] = item['roi']
+
+                frame = np.ndarray(item['shape'], dtype=np.uint8, buffer=shm.buf,
+                                   offset=item['slot'] * slot_bytes)
+                requests.append({
+                    'frame': frame,
+                    'multi_plate': item['multi_plate'],
+                    'camera_id': camera_id,
+                    'annotate': item['annotate'],
+                    'received_at': item.get('received_at')
+                })
+
+            results, op_table, op_error = None, None, None
+            if op_profile:
+                try:
+                    results, op_table = torch_op_profile(lambda: detector.detect_and_annotate_batch(requests))
+                except RuntimeError as e:
+                    op_error = str(e)
+            if results is None:
+                results = detector.detect_and_annotate_batch(requests)
+
+            outputs = [(encode_annotated(annotated, detector.metrics, req['camera_id']), plate_info)
+                       for req, (annotated, plate_info) in zip(requests, results)]
+
+            result_queue.put(('result', worker_id,
+                              (batch_id, outputs, detector.get_stats(), detector.get_metrics(),
+                               (op_table, op_error))))
+        except Exception as e:
+            result_queue.put(('error', worker_id, (batch_id, str(e))))
+
+    try:
+        shm.close()
+    except BufferError:
+        # Còn view numpy trỏ vào buffer - process sắp thoát nên bỏ qua
+        pass
+
+
+class _Worker:
+    def __init__(self, worker_id, process, ring, task_queue):
+        self.worker_id = worker_id
+        self.process = process
+        self.ring = ring
+        self.task_queue = task_queue
+        self.stats = None
+        self.metrics = None
+        self.ready = threading.Event()
+        self.error = None
+        self.restarts = 0
+        self.failures = 0  # Số lần chết liên tiếp chưa ready lại (backoff)
+        self.next_restart_at = 0.0
+
+
+class DetectorPool:
+    """
+    Pool N process detector
+
+    Args:
+        size: số process worker
+        detector_kwargs: tham số cho PersistentDetector (model_path, backend, precision)
+        max_batch_size: số frame tối đa mỗi batch (kích thước ring = max_batch_size * pipeline_depth)
+        pipeline_depth: số batch tối đa đang chờ / đang xử lý cho mỗi worker
+        slot_bytes: dung lượng 1 slot frame (frame lớn hơn bị từ chối)
+    """
+
+    def __init__(self, size, detector_kwargs=None, max_batch_size=8, pipeline_depth=2,
+                 slot_bytes=DEFAULT_SLOT_BYTES, timeout=30.0):
+        self.size = size
+        self.detector_kwargs = detector_kwargs or {}
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+
+        # spawn: process con không thừa kế torch threads / CUDA context của process chính
+        self._ctx = mp.get_context('spawn')
+        self._result_queue = self._ctx.Queue()
+        self._pending = {}  # batch / request id → (worker_id, Future)
+        self._pending_lock = threading.Lock()
+        self._batch_ids = itertools.count()
+        self._num_threads = max(1, (os.cpu_count() or 1) // max(1, size))
+        self._closing = threading.Event()
+
+        self.workers = []
+        for worker_id in range(size):
+            ring = SharedFrameRing(max_batch_size * pipeline_depth, slot_bytes)
+            task_queue = self._ctx.Queue()
+            process = self._new_process(worker_id, ring, task_queue)
+            self.workers.append(_Worker(worker_id, process, ring, task_queue))
+
+        self._collector = threading.Thread(target=self._collect_results, name='detector-pool-results', daemon=True)
+        self._monitor = threading.Thread(target=self._monitor_workers, name='detector-pool-monitor', daemon=True)
+
+    def _new_process(self, worker_id, ring, task_queue):
+        return self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, ring.name, self.slot_bytes, task_queue, self._result_queue,
+                  self.detector_kwargs, self._num_threads),
+            name=f'detector-worker-{worker_id}',
+            daemon=True
+        )
+
+    def start(self, startup_timeout=300.0):
+        """Khởi động tất cả worker và chờ model load xong"""
+        print(f"[DetectorPool] Starting {self.size} worker process(es)...")
+        start_time = time.time()
+        for worker in self.workers:
+            worker.process.start()
+        self._collector.start()
+
+        for worker in self.workers:
+            while not worker.ready.wait(1.0):
+                if not worker.process.is_alive():
+                    raise RuntimeError(f'Detector worker {worker.worker_id} exited during startup '
+                                       f'(exit code {worker.process.exitcode})')
+                if time.time() - start_time > startup_timeout:
+                    raise RuntimeError(f'Detector worker {worker.worker_id} did not start in {startup_timeout:.0f}s')
+            if worker.error:
+                raise RuntimeError(f'Detector worker {worker.worker_id} failed: {worker.error}')
+
+        print(f"[DetectorPool] ✅ {self.size} worker(s) ready in {time.time() - start_time:.2f}s")
+        self._monitor.start()
+
+    def _monitor_workers(self):
+        """Thread phát hiện worker chết → báo lỗi batch đang chờ của nó + khởi động lại (backoff)"""
+        while not self._closing.wait(MONITOR_INTERVAL):
+            for worker in self.workers:
+                if worker.process.is_alive() or self._closing.is_set():
+                    continue
+                if worker.ready.is_set():
+                    worker.ready.clear()
+                    self._fail_pending(worker, f'Detector worker {worker.worker_id} died '
+                                               f'(exit code {worker.process.exitcode})')
+                if time.time() >= worker.next_restart_at:
+                    self._restart(worker)
+
+    def _fail_pending(self, worker, reason):
+        """Báo lỗi ngay cho các batch / profile đang chờ worker (không đợi hết timeout)"""
+        with self._pending_lock:
+            failed = [key for key, (worker_id, _) in self._pending.items() if worker_id == worker.worker_id]
+            futures = [self._pending.pop(key)[1] for key in failed]
+        print(f"[DetectorPool] ⚠️ {reason} - failing {len(futures)} pending batch(es)")
+        for future in futures:
+            future.set_exception(RuntimeError(reason))
+
+    def _restart(self, worker):
+        backoff = min(MAX_RESTART_BACKOFF, 2.0 ** worker.failures)
+        worker.failures += 1
+        worker.restarts += 1
+        worker.next_restart_at = time.time() + backoff
+        worker.error = None
+        # Queue mới: task cũ (của batch đã báo lỗi) không được worker mới xử lý lại
+        worker.task_queue = self._ctx.Queue()
+        worker.process = self._new_process(worker.worker_id, worker.ring, worker.task_queue)
+        print(f"[DetectorPool] 🔄 Restarting detector worker {worker.worker_id} (restart #{worker.restarts})")
+        worker.process.start()
+
+    def _collect_results(self):
+        """Thread nhận kết quả từ tất cả worker → resolve Future của batch tương ứng"""
+        while True:
+            message = self._result_queue.get()
+            if message is None:
+                break
+
+            kind, worker_id, payload = message
+            worker = self.workers[worker_id]
+
+            if kind in ('ready', 'fatal'):
+                if kind == 'ready':
+                    worker.stats = payload
+                    worker.failures = 0
+                    worker.ready.set()
+                else:
+                    worker.error = payload
+                    print(f"[DetectorPool] ❌ Detector worker {worker_id} failed to start: {payload}")
+                    # Lúc khởi động pool: start() chờ ready để báo lỗi; sau đó monitor khởi động lại
+                    if not self._monitor.is_alive():
+                        worker.ready.set()
+                continue
+
+            if kind == 'metrics':
+                worker.metrics = payload
+                continue
+
+            batch_id = payload[0]
+            with self._pending_lock:
+                _, future = self._pending.pop(batch_id, (None, None))
+            if future is None:
+                continue
+
+            if kind == 'result':
+                _, outputs, stats, metrics, op_result = payload
+                worker.stats = stats
+                worker.metrics = metrics
+                future.set_result((outputs, op_result))
+            elif kind == 'profile':
+                future.set_result(payload[1])
+            else:
+                future.set_exception(RuntimeError(payload[1]))
+
+    def run_batch(self, worker_id, requests, op_profile=False):
+        """
+        Gửi 1 batch frame cho worker và chờ kết quả (thread-safe, nhiều batch có thể chờ song song)
+
+        Args:
+            worker_id: shard của các camera trong batch
+            requests: list dict {'frame', 'multi_plate', 'camera_id', 'annotate', 'roi', 'received_at'}
+            op_profile: True → worker chạy batch dưới torch.profiler
+
+        Returns:
+            list (jpeg_bytes | None, plate_info) cùng thứ tự requests
+            (op_profile=True: (list đó, bảng op torch dạng text, lỗi profile hoặc None))
+        """
+        worker = self.workers[worker_id]
+        if not worker.ready.is_set() or not worker.process.is_alive():
+            raise RuntimeError(f'Detector worker {worker_id} is restarting')
+        ring = worker.ring
+        slots = ring.acquire(len(requests))
+        try:
+            items = []
+            for slot, req in zip(slots, requests):
+                items.append({
+                    'slot': slot,
+                    'shape': ring.write(slot, req['frame']),
+                    'multi_plate': req.get('multi_plate', False),
+                    'camera_id': req.get('camera_id'),
+                    'annotate': req.get('annotate', True),
+                    'roi': req.get('roi'),
+                    'received_at': req.get('received_at')
+                })
+        except Exception:
+            ring.release(slots)
+            raise
+
+        batch_id = next(self._batch_ids)
+        future = Future()
+        # Slot chỉ trả lại ring khi worker đã xong batch (kết quả / lỗi / worker chết - _fail_pending),
+        # không phải khi hết timeout: worker có thể vẫn đang đọc frame trong slot
+        future.add_done_callback(lambda _: ring.release(slots))
+        with self._pending_lock:
+            self._pending[batch_id] = (worker_id, future)
+        if worker.ready.is_set():
+            worker.task_queue.put(('batch', batch_id, items, op_profile))
+        else:
+            # Monitor vừa báo lỗi các batch của worker trước khi batch này được đăng ký
+            with self._pending_lock:
+                not_failed = self._pending.pop(batch_id, None) is not None
+            if not_failed:
+                future.set_exception(RuntimeError(f'Detector worker {worker_id} is restarting'))
+
+        try:
+            outputs, (op_table, op_error) = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Worker treo → dừng hẳn: monitor báo lỗi batch còn chờ (trả slot) rồi khởi động lại
+            print(f"[DetectorPool] ⚠️ Detector worker {worker_id} timed out after {self.timeout:g}s - terminating")
+            worker.process.terminate()
+            raise RuntimeError(f'Detector worker {worker_id} timed out')
+        return (outputs, op_table, op_error) if op_profile else outputs
+
+    def get_stats(self):
+        """Stats gộp tất cả worker + stats từng worker"""
+        worker_stats = [w.stats for w in self.workers if w.stats]
+        stats = merge_detector_stats(worker_stats)
+        stats['workers'] = [
+            {
+                'worker_id': w.worker_id,
+                'pid': w.process.pid,
+                'alive': w.process.is_alive(),
+                'ready': w.ready.is_set(),
+                'restarts': w.restarts,
+                'total_frames': (w.stats or {}).get('total_frames', 0),
+                'avg_fps': (w.stats or {}).get('avg_fps', 0.0)
+            }
+            for w in self.workers
+        ]
+        return stats
+
+    def profile(self, seconds, interval=0.005):
+        """
+        Sampling profile tất cả worker song song trong `seconds` giây
+
+        Returns:
+            list collapsed stack text của từng worker (frame gốc 'detector-worker-N')
+        """
+        futures = []
+        for worker in self.workers:
+            if not worker.ready.is_set():
+                continue
+            request_id = next(self._batch_ids)
+            future = Future()
+            with self._pending_lock:
+                self._pending[request_id] = (worker.worker_id, future)
+            worker.task_queue.put(('profile', request_id, seconds, interval))
+            futures.append((request_id, future))
+
+        texts = []
+        try:
+            for request_id, future in futures:
+                texts.append(future.result(timeout=seconds + self.timeout))
+        finally:
+            with self._pending_lock:
+                for request_id, _ in futures:
+                    self._pending.pop(request_id, None)
+        return texts
+
+    def get_metrics(self):
+        """Histogram latency từng stage gộp tất cả worker"""
+        return merge_snapshots(w.metrics for w in self.workers)
+
+    def discard_camera(self, camera_id):
+        """Camera ngắt kết nối → bỏ histogram stage của camera ở tất cả worker"""
+        for worker in self.workers:
+            if worker.ready.is_set():
+                worker.task_queue.put(('discard', camera_id))
+
+    def shutdown(self):
+        """Dừng worker + giải phóng shared memory"""
+        self._closing.set()
+        for worker in self.workers:
+            worker.task_queue.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.ring.close()
+        self._result_queue.put(None)
+
+
+def merge_detector_stats(stats_list):
+    """Gộp PersistentDetector.get_stats() của nhiều worker"""
+    if not stats_list:
+        return {'total_frames': 0, 'total_detections': 0, 'runtime_seconds': 0, 'avg_fps': 0.0}
+
+    merged = {
+        'total_frames': sum(s['total_frames'] for s in stats_list),
+        'total_detections': sum(s['total_detections'] for s in stats_list),
+        'runtime_seconds': max(s['runtime_seconds'] for s in stats_list),
+        'avg_fps': round(sum(s['avg_fps'] for s in stats_list), 2),
+        'backend': stats_list[0].get('backend'),
+        'precision': stats_list[0].get('precision'),
+        'camera_rois': {}
+    }
+    for s in stats_list:
+        merged['camera_rois'].update(s.get('camera_rois', {}))
+
+    trackings = [s['tracking'] for s in stats_list if s.get('tracking')]
+    if trackings:
+        merged['tracking'] = {
+            'enabled': trackings[0]['enabled'],
+            'ocr_skipped': sum(t['ocr_skipped'] for t in trackings),
+            'cameras': {}
+        }
+        for t in trackings:
+            merged['tracking']['cameras'].update(t['cameras'])
+
+    qualities = [s['quality'] for s in stats_list if s.get('quality')]
+    if qualities:
+        # Tier tệ nhất trong các worker + tier từng worker
+        merged['quality'] = dict(max(qualities, key=lambda q: q['tier']))
+        merged['quality']['worker_tiers'] = [q['tier_name'] for q in qualities]
+
+    motions = [s['motion_gate'] for s in stats_list if s.get('motion_gate')]
+    if motions:
+        checked = sum(m['frames_checked'] for m in motions)
+        skipped = sum(m['inference_skipped'] for m in motions)
+        merged['motion_gate'] = {
+            'enabled': motions[0]['enabled'],
+            'frames_checked': checked,
+            'inference_skipped': skipped,
+            'skip_ratio': round(skipped / checked, 4) if checked > 0 else 0.0,
+            'cameras': {}
+        }
+        for m in motions:
+            merged['motion_gate']['cameras'].update(m['cameras'])
+
+    cascades = [s['ocr_cascade'] for s in stats_list if s.get('ocr_cascade')]
+    if cascades:
+        total = sum(c['total_plates'] for c in cascades)
+        passes = {}
+        for c in cascades:
+            for name, p in c['passes'].items():
+                entry = passes.setdefault(name, {'runs': 0, 'hits': 0})
+                entry['runs'] += p['runs']
+                entry['hits'] += p['hits']
+        for entry in passes.values():
+            entry['hit_rate'] = round(entry['hits'] / entry['runs'], 4) if entry['runs'] > 0 else 0.0
+        merged['ocr_cascade'] = {
+            'enabled': cascades[0]['enabled'],
+            'total_plates': total,
+            'fallbacks': sum(c['fallbacks'] for c in cascades),
+            'passes': passes
+        }
+
+    caches = [s['ocr_cache'] for s in stats_list if s.get('ocr_cache')]
+    if caches:
+        hits = sum(c['hits'] for c in caches)
+        lookups = hits + sum(c['misses'] for c in caches)
+        merged['ocr_cache'] = {
+            'enabled': caches[0]['enabled'],
+            'entries': sum(c['entries'] for c in caches),
+            'hits': hits,
+            'misses': lookups - hits,
+            'hit_rate': round(hits / lookups, 4) if lookups > 0 else 0.0,
+            'expired': sum(c['expired'] for c in caches),
+            'evictions': sum(c['evictions'] for c in caches)
+        }
+
+    return merged
@@ -0,0 +1,183 @@
+"""
+Export plate detector + character recognizer sang ONNX / OpenVINO và kiểm tra parity với PyTorch
+
+Usage:
+    python export_models.py --backend onnx
+    python export_models.py --backend onnx --detector-imgsz 384,640
+    python export_models.py --backend openvino --images ./samples
+    python export_models.py --backend onnx --skip-export --images ./samples   (chỉ chạy parity check)
+
+Sau khi export, đặt "backend": "onnx" | "openvino" trong plate_detector/config.json
+và character_recognition/config.json để detector dùng runtime mới.
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.model_backend import export_yolo, load_model_config, load_yolo
+from character_recognition.plate_recognizer_inference import PlateRecognizer
+from character_recognition.plate_preprocessing import prepare_gray
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DETECTOR_PATH = os.path.join(MODELS_DIR, 'plate_detector', 'best.pt')
+RECOGNIZER_DIR = os.path.join(MODELS_DIR, 'character_recognition')
+RECOGNIZER_PATH = os.path.join(RECOGNIZER_DIR, 'plate_recognizer.pt')
+
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+
+
+def list_images(image_dir):
+    """Liệt kê ảnh trong thư mục"""
+    paths = []
+    for ext in IMAGE_EXTENSIONS:
+        paths.extend(glob.glob(os.path.join(image_dir, ext)))
+    return sorted(paths)
+
+
+def parse_imgsz(value):
+    """'640' → 640, '384,640' → [384, 640] (h, w)"""
+    sides = [int(side) for side in str(value).replace('x', ',').split(',') if side.strip()]
+    if len(sides) not in (1, 2) or min(sides) <= 0:
+        raise argparse.ArgumentTypeError(f"imgsz must be N or H,W - got '{value}'")
+    return sides[0] if len(sides) == 1 else sides
+
+
+def resolve_imgsz(value, model_dir):
+    """imgsz từ CLI hoặc input_size trong config.json (cùng shape runtime sẽ dùng), mặc định 640"""
+    if value:
+        return value
+    return load_model_config(model_dir).get('input_size') or 640
+
+
+def _top_box(model, image, conf=0.25):
+    """Box OBB có confidence cao nhất: ((x1, y1, x2, y2), conf) hoặc None"""
+    results = model(image, conf=conf, verbose=False)
+    if not results or results[0].obb is None or len(results[0].obb) == 0:
+        return None
+    obb = results[0].obb
+    idx = int(obb.conf.argmax())
+    points = obb.xyxyxyxy[idx].cpu().numpy()
+    x1, y1 = points.min(axis=0)
+    x2, y2 = points.max(axis=0)
+    return (float(x1), float(y1), float(x2), float(y2)), float(obb.conf[idx])
+
+
+def _iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def check_parity(backend, image_paths, conf_tol=0.05, min_iou=0.9, min_text_agreement=0.95):
+    """
+    So sánh output của backend export với PyTorch trên cùng bộ ảnh
+
+    Returns:
+        (passed, report)
+    """
+    ref_detector, _, _ = load_yolo(DETECTOR_PATH, backend='pytorch', task='obb')
+    test_detector, used, _ = load_yolo(DETECTOR_PATH, backend=backend, task='obb')
+    if used != backend:
+        return False, {'error': f'Could not load {backend} detector'}
+
+    ref_recognizer = PlateRecognizer(RECOGNIZER_DIR, backend='pytorch', precision='fp32')
+    test_recognizer = PlateRecognizer(RECOGNIZER_DIR, backend=backend, precision='fp32')
+    if test_recognizer.backend != backend:
+        return False, {'error': f'Could not load {backend} recognizer'}
+
+    conf_diffs, ious, text_matches = [], [], []
+    presence_mismatch = 0
+
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"[WARN] Cannot read {path}")
+            continue
+
+        ref = _top_box(ref_detector, image)
+        test = _top_box(test_detector, image)
+        if (ref is None) != (test is None):
+            presence_mismatch += 1
+            continue
+        if ref is None:
+            continue
+
+        conf_diffs.append(abs(ref[1] - test[1]))
+        ious.append(_iou(ref[0], test[0]))
+
+        # Recognizer parity trên cùng 1 crop (lấy từ box PyTorch)
+        x1, y1, x2, y2 = [int(v) for v in ref[0]]
+        h, w = image.shape[:2]
+        crop = image[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+        if crop.size == 0:
+            continue
+        gray = prepare_gray(crop)
+        text_matches.append(ref_recognizer.recognize(gray) == test_recognizer.recognize(gray))
+
+    report = {
+        'backend': backend,
+        'images': len(image_paths),
+        'presence_mismatch': presence_mismatch,
+        'max_conf_diff': float(max(conf_diffs)) if conf_diffs else 0.0,
+        'mean_iou': float(np.mean(ious)) if ious else 1.0,
+        'min_iou': float(min(ious)) if ious else 1.0,
+        'text_agreement': float(np.mean(text_matches)) if text_matches else 1.0,
+    }
+    passed = (presence_mismatch == 0
+              and report['max_conf_diff'] <= conf_tol
+              and report['min_iou'] >= min_iou
+              and report['text_agreement'] >= min_text_agreement)
+    return passed, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export YOLO models to ONNX / OpenVINO and check parity')
+    parser.add_argument('--backend', choices=['onnx', 'openvino'], required=True)
+    parser.add_argument('--detector-imgsz', type=parse_imgsz,
+                        help='N hoặc H,W - mặc định input_size trong plate_detector/config.json')
+    parser.add_argument('--recognizer-imgsz', type=parse_imgsz,
+                        help='N hoặc H,W - mặc định input_size trong character_recognition/config.json')
+    parser.add_argument('--images', help='Thư mục ảnh để kiểm tra parity với PyTorch')
+    parser.add_argument('--skip-export', action='store_true', help='Chỉ chạy parity check')
+    parser.add_argument('--conf-tol', type=float, default=0.05)
+    parser.add_argument('--min-iou', type=float, default=0.9)
+    parser.add_argument('--min-text-agreement', type=float, default=0.95)
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        detector_imgsz = resolve_imgsz(args.detector_imgsz, os.path.dirname(DETECTOR_PATH))
+        recognizer_imgsz = resolve_imgsz(args.recognizer_imgsz, RECOGNIZER_DIR)
+        print(f"[1/2] Exporting plate detector → {args.backend} (imgsz {detector_imgsz})...")
+        print(f"      {export_yolo(DETECTOR_PATH, args.backend, imgsz=detector_imgsz)}")
+        print(f"[2/2] Exporting character recognizer → {args.backend} (imgsz {recognizer_imgsz})...")
+        print(f"      {export_yolo(RECOGNIZER_PATH, args.backend, imgsz=recognizer_imgsz)}")
+
+    if not args.images:
+        print("No --images given, skipping parity check")
+        return 0
+
+    image_paths = list_images(args.images)
+    if not image_paths:
+        print(f"No images found in {args.images}")
+        return 1
+
+    print(f"\nParity check on {len(image_paths)} images...")
+    passed, report = check_parity(args.backend, image_paths, args.conf_tol,
+                                  args.min_iou, args.min_text_agreement)
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+    print("✅ PARITY OK" if passed else "❌ PARITY FAILED")
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Frame Mailbox Module
+Mailbox 1 slot cho mỗi camera (latest-frame-wins): frame mới thay thế frame chưa xử lý
+→ worker luôn xử lý frame mới nhất, không có backlog khi browser gửi nhanh hơn tốc độ detect
+
+exclusive=True (nhiều worker thread cùng lấy từ 1 mailbox): mỗi key chỉ có tối đa 1 frame đang
+xử lý - key đã lấy ra bị bỏ qua tới khi release(keys) → kết quả của 1 camera luôn đúng thứ tự
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LatestFrameMailbox:
+    """
+    Mailbox latest-frame-wins
+
+    - put(key, item): ghi đè slot của key (frame cũ chưa xử lý bị drop)
+    - get(): lấy slot chờ lâu nhất (camera nào cũng tới lượt, camera gửi nhanh không chiếm worker)
+    - release(keys): (exclusive) key xử lý xong → frame kế tiếp của key được lấy
+    """
+
+    def __init__(self, exclusive=False):
+        self._slots = OrderedDict()  # key → (item, enqueued_at)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.exclusive = exclusive
+        self._in_flight = set()
+
+        # Stats theo key
+        self._received = {}
+        self._dropped = {}
+        self._processed = {}
+        self._age_sum = {}
+        self._age_max = {}
+        self._age_last = {}
+
+    def put(self, key, item):
+        """Đặt frame mới cho key - thay thế frame chưa xử lý (giữ nguyên vị trí trong hàng)"""
+        with self._cond:
+            if self._closed:
+                return False
+            self._received[key] = self._received.get(key, 0) + 1
+            if key in self._slots:
+                self._dropped[key] = self._dropped.get(key, 0) + 1
+            self._slots[key] = (item, time.time())
+            self._cond.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Lấy frame chờ lâu nhất
+
+        Returns:
+            (key, item, queue_age_seconds) hoặc None nếu hết timeout / mailbox đã đóng
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready_count(1) or self._closed, timeout=timeout):
+                return None
+            batch = self._take(1)
+            return batch[0] if batch else None
+
+    def get_batch(self, max_items, window=0.0, timeout=None):
+        """
+        Micro-batch: chờ frame đầu tiên, sau đó gom thêm frame của các camera khác
+        trong tối đa `window` giây hoặc tới khi đủ max_items
+
+        Returns:
+            list (key, item, queue_age_seconds) - rỗng nếu hết timeout / mailbox đã đóng
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready_count(1) or self._closed, timeout=timeout):
+                return []
+
+            deadline = time.time() + window
+            while not self._closed and self._ready_count(max_items) < max_items:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            return self._take(max_items)
+
+    def release(self, keys):
+        """(exclusive) Các key đã xử lý xong - frame đang chờ của chúng được lấy ở lần get kế tiếp"""
+        with self._cond:
+            self._in_flight.difference_update(keys)
+            self._cond.notify_all()
+
+    def _ready_count(self, limit):
+        """Số slot lấy được ngay (bỏ qua key đang xử lý ở chế độ exclusive), tối đa limit"""
+        if not self.exclusive:
+            return min(len(self._slots), limit)
+        count = 0
+        for key in self._slots:
+            if key not in self._in_flight:
+                count += 1
+                if count >= limit:
+                    break
+        return count
+
+    def _take(self, max_items):
+        """Lấy tối đa max_items slot chờ lâu nhất (đã giữ lock)"""
+        keys = [key for key in self._slots if not (self.exclusive and key in self._in_flight)][:max_items]
+        batch = []
+        for key in keys:
+            item, enqueued_at = self._slots.pop(key)
+            batch.append((key, item, self._record_age(key, enqueued_at)))
+        if self.exclusive:
+            self._in_flight.update(keys)
+        return batch
+
+    def discard(self, key):
+        """Bỏ frame đang chờ + stats của key (client ngắt kết nối)"""
+        with self._cond:
+            self._slots.pop(key, None)
+            self._in_flight.discard(key)
+            for counter in (self._received, self._dropped, self._processed,
+                            self._age_sum, self._age_max, self._age_last):
+                counter.pop(key, None)
+
+    def close(self):
+        """Đánh thức tất cả worker đang chờ để dừng"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _record_age(self, key, enqueued_at):
+        age = time.time() - enqueued_at
+        self._processed[key] = self._processed.get(key, 0) + 1
+        self._age_sum[key] = self._age_sum.get(key, 0.0) + age
+        self._age_max[key] = max(self._age_max.get(key, 0.0), age)
+        self._age_last[key] = age
+        return age
+
+    def get_stats(self):
+        """Dropped-frame + queue-age theo key"""
+        with self._cond:
+            return {key: self._key_stats(key) for key in self._received}
+
+    def get_key_stats(self, key):
+        """Stats của 1 key (None nếu key chưa gửi frame nào)"""
+        with self._cond:
+            return self._key_stats(key) if key in self._received else None
+
+    def _key_stats(self, key):
+        received = self._received[key]
+        processed = self._processed.get(key, 0)
+        dropped = self._dropped.get(key, 0)
+        return {
+            'received': received,
+            'processed': processed,
+            'dropped': dropped,
+            'drop_rate': round(dropped / received, 4) if received > 0 else 0.0,
+            'pending': key in self._slots,
+            'queue_age_ms': {
+                'last': round(self._age_last.get(key, 0.0) * 1000, 1),
+                'avg': round(self._age_sum.get(key, 0.0) / processed * 1000, 1) if processed > 0 else 0.0,
+                'max': round(self._age_max.get(key, 0.0) * 1000, 1)
+            }
+        }
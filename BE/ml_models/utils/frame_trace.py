@@ -0,0 +1,155 @@
+"""
+Frame Trace Module
+Ring buffer cố định trong RAM chứa trace từng frame / request (camera, thời gian từng bước, kết quả)
+thay cho print() trên hot path:
+- Ghi record: 1 lần append deque, không I/O
+- Log console lấy mẫu: 1 dòng mỗi `log_every` record, lỗi giới hạn 1 dòng / `error_log_interval_s`
+- Xem lại khi cần (post-mortem): snapshot() cho endpoint, dump() ra file JSON-lines (VD khi nhận SIGUSR1)
+"""
+
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+
+# Cấu hình mặc định - có thể override trong plate_detector/config.json (key "trace")
+DEFAULT_TRACE_CONFIG = {
+    # Số record giữ lại (record cũ nhất bị ghi đè)
+    'capacity': 2048,
+    # In 1 dòng tóm tắt mỗi N record (0 = không in)
+    'log_every': 100,
+    # Khoảng cách tối thiểu giữa 2 dòng log lỗi (lỗi bị nén còn đếm trong dòng kế tiếp)
+    'error_log_interval_s': 5.0,
+    # Thư mục ghi file dump
+    'dump_dir': 'logs',
+}
+
+
+class FrameTraceBuffer:
+    """Ring buffer trace - thread-safe (deque.append / next(count) atomic)"""
+
+    def __init__(self, config=None, name='trace'):
+        self.config = dict(DEFAULT_TRACE_CONFIG)
+        if config:
+            self.config.update(config)
+
+        self.name = name
+        self._records = deque(maxlen=max(1, int(self.config['capacity'])))
+        self._seq = itertools.count(1)
+        self._error_lock = threading.Lock()
+        self._last_error_log = 0.0
+        self._suppressed_errors = 0
+
+        # Stats
+        self.errors = 0
+
+    def record(self, **fields):
+        """
+        Ghi 1 record (VD camera=..., timings_ms={...}, plates=[...], error=...)
+
+        Returns:
+            dict record đã ghi (có thêm seq, ts)
+        """
+        record = {'seq': next(self._seq), 'ts': round(time.time(), 3)}
+        record.update(fields)
+        self._records.append(record)
+
+        if record.get('error'):
+            self.errors += 1
+            self._log_error(record)
+        elif self.config['log_every'] and record['seq'] % self.config['log_every'] == 0:
+            print(f"[{self.name}] {self._summary(record)}", file=sys.stderr)
+        return record
+
+    def _log_error(self, record):
+        with self._error_lock:
+            now = time.time()
+            if now - self._last_error_log < self.config['error_log_interval_s']:
+                self._suppressed_errors += 1
+                return
+            suppressed, self._suppressed_errors = self._suppressed_errors, 0
+            self._last_error_log = now
+        suffix = f" (+{suppressed} lỗi khác)" if suppressed else ''
+        print(f"[{self.name}] ERROR {self._summary(record)}{suffix}", file=sys.stderr)
+
+    @staticmethod
+    def _summary(record):
+        """1 dòng ngắn gọn: #seq key=value (bỏ các field lớn)"""
+        parts = [f"#{record['seq']}"]
+        for key, value in record.items():
+            if key in ('seq', 'ts', 'traceback') or value is None:
+                continue
+            if isinstance(value, float):
+                value = f'{value:.1f}'
+            elif isinstance(value, dict):
+                value = ','.join(f'{k}:{v:.1f}' if isinstance(v, float) else f'{k}:{v}' for k, v in value.items())
+            parts.append(f'{key}={value}')
+        return ' '.join(parts)
+
+    def snapshot(self, limit=None, **filters):
+        """
+        Các record gần nhất (cũ → mới)
+
+        Args:
+            limit: chỉ lấy N record cuối
+            filters: field=value phải khớp (VD camera='gate_1')
+        """
+        records = list(self._records)
+        if filters:
+            records = [r for r in records if all(r.get(k) == v for k, v in filters.items())]
+        if limit is not None:
+            records = records[-limit:] if limit > 0 else []
+        return records
+
+    def dump(self, path=None):
+        """
+        Ghi toàn bộ buffer ra file JSON-lines
+
+        Returns:
+            đường dẫn file đã ghi
+        """
+        if path is None:
+            stamp = time.strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(self.config['dump_dir'], f'{self.name}_{os.getpid()}_{stamp}.jsonl')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        records = self.snapshot()
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        return path
+
+    def get_stats(self):
+        return {
+            'records': len(self._records),
+            'capacity': self._records.maxlen,
+            'errors': self.errors
+        }
+
+
+def install_dump_signal(buffer, signum=None):
+    """
+    Dump buffer ra file khi nhận signal (mặc định SIGUSR1: kill -USR1 <pid>)
+    Chỉ gọi từ main thread; Windows không có SIGUSR1 → bỏ qua
+
+    Returns:
+        True nếu đã đăng ký handler
+    """
+    signum = signum if signum is not None else getattr(signal, 'SIGUSR1', None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handle(_signum, _frame):
+        try:
+            path = buffer.dump()
+            print(f"[{buffer.name}] Dumped {len(buffer.snapshot())} record(s) → {path}", file=sys.stderr)
+        except OSError as e:
+            print(f"[{buffer.name}] Dump failed: {e}", file=sys.stderr)
+
+    signal.signal(signum, handle)
+    return True
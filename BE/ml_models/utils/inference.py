@@ -1,6 +1,8 @@
 """
 Inference script for license plate detection and recognition
 Usage: python inference.py --image <base64_encoded_image>
+       python inference.py --stdin
+       python inference.py --server   (daemon: load model 1 lần, nhận request JSON-lines qua stdin)
 
 Tích hợp YOLOv8 OBB + YOLO character detector cho hệ thống eParking
 """
@@ -14,16 +16,22 @@ import io
 import time
 import cv2
 import os
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.frame_trace import FrameTraceBuffer, install_dump_signal
 
 # Import các thư viện ML
 try:
-    from ultralytics import YOLO
-    from character_recognition.plate_recognizer_inference import get_recognizer
+    from utils.model_backend import load_model_config, load_yolo
+    from character_recognition.plate_recognizer_inference import PlateRecognizer, get_recognizer
+    from character_recognition.plate_preprocessing import prepare_gray
+    from character_recognition.plate_cascade import RecognitionCascade
+    from character_recognition.plate_grammar import format_plate, validate_plate
+    from utils.plate_postprocess import detect_plates, is_valid_bbox
     ML_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: ML libraries not available: {e}", file=sys.stderr)
@@ -33,60 +41,89 @@ except ImportError as e:
 class LicensePlateDetector:
     """Class nhận diện biển số xe - Sử dụng YOLO character detector với preprocessing cải tiến"""
     
-    def __init__(self):
-        """Khởi tạo detector với YOLOv8 OBB và PlateRecognizer"""
+    def __init__(self, backend=None, precision=None):
+        """
+        Khởi tạo detector với YOLOv8 OBB và PlateRecognizer
+        
+        Args:
+            backend: 'pytorch' | 'onnx' | 'openvino' - mặc định đọc từ config.json của từng model
+            precision: 'fp32' | 'quantized' (INT8) - mặc định đọc từ config.json của từng model
+        """
         if not ML_AVAILABLE:
             raise RuntimeError("ML libraries not available. Please install: ultralytics, torch, opencv-python")
         
         # Đường dẫn model
-        model_path = os.path.join(os.path.dirname(__file__), '..', 'plate_detector', 'best.pt')
+        model_dir = os.path.join(os.path.dirname(__file__), '..', 'plate_detector')
+        model_path = os.path.join(model_dir, 'best.pt')
         
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model not found at: {model_path}")
         
         # Load YOLOv8 OBB model
+        self.config = load_model_config(model_dir)
         try:
-            self.plate_model = YOLO(model_path)
-            print(f"[INFO] Loaded plate detector model: {model_path}", file=sys.stderr)
+            self.plate_model, self.backend, self.precision = load_yolo(
+                model_path,
+                backend=backend or self.config.get('backend'),
+                task='obb',
+                precision=precision or self.config.get('precision')
+            )
+            print(f"[INFO] Loaded plate detector model: {model_path} "
+                  f"(backend: {self.backend}, precision: {self.precision})", file=sys.stderr)
         except Exception as e:
             raise RuntimeError(f"Failed to load YOLO model: {e}")
         
+        # Độ phân giải detection: frame thu nhỏ về detection_max_side, YOLO chạy ở input_size [h, w]
+        self.detect_imgsz = self.config.get('input_size')
+        self.detect_max_side = self.config.get('detection_max_side')
+        
         # Initialize PlateRecognizer (YOLO character detector)
         print("[INFO] Loading PlateRecognizer (YOLO char detector)...", file=sys.stderr)
-        self.recognizer = get_recognizer()
+        if backend or precision:
+            # Override tường minh → instance riêng, không dùng chung singleton
+            self.recognizer = PlateRecognizer(backend=backend, precision=precision)
+        else:
+            self.recognizer = get_recognizer()
         print("[INFO] PlateRecognizer loaded successfully", file=sys.stderr)
+        
+        # OCR cascade (cấu hình trong character_recognition/config.json)
+        self.cascade = RecognitionCascade(self.recognizer, self.validate_plate_format,
+                                          self.recognizer.config.get('cascade'))
     
     def validate_plate_format(self, text):
         """
-        Kiểm tra format biển số Việt Nam
-        Format: 30A-12345, 51F1-12345, 29AB-12345, etc.
+        Kiểm tra format biển số Việt Nam (template của plate_grammar)
+        Format: 30A-12345, 51F1-12345, 29AB-1234, etc.
         Returns: (is_valid, cleaned_text)
         """
-        text = text.upper().replace(' ', '').replace('-', '').replace('.', '')
-        # Pattern linh hoạt hơn: 2 số + 1-2 ký tự (chữ hoặc kết hợp) + 4-5 số
-        pattern = r'^(\d{2})([A-Z]{1,2}|[A-Z]\d|\d[A-Z])(\d{4,5})$'
-        match = re.match(pattern, text)
-        return match is not None, text
+        return validate_plate(text)
     
     def format_plate_text(self, text):
         """Format lại text biển số cho đẹp: 30A-12345"""
-        text = text.upper().replace(' ', '').replace('-', '').replace('.', '')
-        match = re.search(r'(\d{2})([A-Z]{1,2})(\d{4,5})', text)
-        if match:
-            return f"{match.group(1)}{match.group(2)}-{match.group(3)}"
-        return text
+        return format_plate(text)
     
-    def detect_and_recognize(self, image, conf_threshold=0.3):
+    def detect_and_recognize(self, image, conf_threshold=0.3, multi_plate=False, metrics=None):
         """
         Nhận diện biển số và đọc ký tự
         
         Args:
             image: numpy array (BGR format from OpenCV or RGB from PIL)
             conf_threshold: Ngưỡng confidence cho detection
+            multi_plate: True → đọc TẤT CẢ biển số trong ảnh (trả thêm key 'plates'),
+                         các field top-level vẫn là biển có confidence cao nhất
+            metrics: (tuỳ chọn) StageMetrics hoặc object cùng interface observe(camera_id, stage, seconds)
+                     - ghi thời gian từng stage: detect, crop, ocr_<pass>, annotate, encode
         
         Returns:
             dict: Kết quả detection và OCR
         """
+        def observe(stage, stage_start):
+            if metrics is not None:
+                metrics.observe(None, stage, time.perf_counter() - stage_start)
+        
+        def pass_timer(name, indices, seconds):
+            metrics.observe(None, f'ocr_{name}', seconds)
+        
         try:
             # Đảm bảo image là BGR cho OpenCV
             if len(image.shape) == 3 and image.shape[2] == 3:
@@ -95,21 +132,14 @@ class LicensePlateDetector:
                     # Kiểm tra xem có phải RGB không bằng cách thử detect
                     pass  # YOLO tự xử lý
             
-            # Detect biển số với YOLOv8 OBB
-            results = self.plate_model(image, conf=conf_threshold, verbose=False)
-            
-            if not results or len(results) == 0:
-                return {
-                    'success': False,
-                    'message': 'No license plate detected',
-                    'plate_number': None,
-                    'confidence': 0.0
-                }
-            
-            result = results[0]
+            # Detect biển số với YOLOv8 OBB ở độ phân giải giảm, OBB map về ảnh gốc
+            # Xử lý OBB (Oriented Bounding Box) - sắp xếp confidence giảm dần
+            stage_start = time.perf_counter()
+            detections = detect_plates(self.plate_model, image, conf_threshold,
+                                       imgsz=self.detect_imgsz, max_side=self.detect_max_side)
+            observe('detect', stage_start)
             
-            # Xử lý OBB (Oriented Bounding Box)
-            if result.obb is None or len(result.obb) == 0:
+            if not detections:
                 return {
                     'success': False,
                     'message': 'No license plate detected',
@@ -117,142 +147,81 @@ class LicensePlateDetector:
                     'confidence': 0.0
                 }
             
-            # Lấy detection có confidence cao nhất
-            best_detection = None
-            best_conf = 0.0
-            
-            for obb in result.obb:
-                conf = float(obb.conf[0]) if obb.conf is not None else 0.0
-                
-                if conf > best_conf:
-                    best_conf = conf
-                    
-                    # Lấy tọa độ OBB (4 điểm)
-                    points = obb.xyxyxyxy[0].cpu().numpy().astype(int)
-                    
-                    # Tính bounding box
-                    x_coords = points[:, 0]
-                    y_coords = points[:, 1]
-                    x1, x2 = int(x_coords.min()), int(x_coords.max())
-                    y1, y2 = int(y_coords.min()), int(y_coords.max())
-                    
-                    # Đảm bảo trong giới hạn
-                    h, w = image.shape[:2]
-                    x1 = max(0, x1)
-                    y1 = max(0, y1)
-                    x2 = min(w, x2)
-                    y2 = min(h, y2)
-                    
-                    best_detection = {
-                        'bbox': (x1, y1, x2, y2),
-                        'confidence': conf,
-                        'points': points
-                    }
-            
-            if best_detection is None:
-                return {
-                    'success': False,
-                    'message': 'No valid detection found',
-                    'plate_number': None,
-                    'confidence': 0.0
-                }
-            
-            # Crop biển số
-            x1, y1, x2, y2 = best_detection['bbox']
+            if multi_plate:
+                detections = [d for d in detections if is_valid_bbox(d['bbox'])]
+            else:
+                # Chỉ lấy detection có confidence cao nhất
+                detections = detections[:1]
             
-            if x2 <= x1 or y2 <= y1:
+            if not detections or not is_valid_bbox(detections[0]['bbox']):
                 return {
                     'success': False,
                     'message': 'Invalid bounding box',
                     'plate_number': None,
-                    'confidence': best_detection['confidence']
+                    'confidence': detections[0]['confidence'] if detections else 0.0
                 }
             
-            cropped_plate = image[y1:y2, x1:x2]
+            # Crop biển số
+            stage_start = time.perf_counter()
+            grays = []
+            for detection in detections:
+                x1, y1, x2, y2 = detection['bbox']
+                grays.append(prepare_gray(image[y1:y2, x1:x2]))
+            observe('crop', stage_start)
             
             # MULTI-PASS Recognition với preprocessing cải tiến
-            gray = cv2.cvtColor(cropped_plate, cv2.COLOR_BGR2GRAY)
-            
-            # Resize to optimal size
-            if gray.shape[1] < 300:
-                scale = 300 / gray.shape[1]
-                gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-            
-            candidates = []
-            
-            # Method 1: CLAHE + Bilateral Filter
-            try:
-                denoised1 = cv2.bilateralFilter(gray, 11, 17, 17)
-                clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-                enhanced1 = clahe.apply(denoised1)
-                kernel_sharpen = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-                sharpened1 = cv2.filter2D(enhanced1, -1, kernel_sharpen)
-                
-                text1 = self.recognizer.recognize(sharpened1)
-                if text1 and len(text1) >= 7:
-                    candidates.append(text1.upper())
-            except:
-                pass
-            
-            # Method 2: Adaptive Threshold
-            try:
-                denoised2 = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
-                thresh2 = cv2.adaptiveThreshold(denoised2, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                               cv2.THRESH_BINARY, 11, 2)
-                
-                text2 = self.recognizer.recognize(thresh2)
-                if text2 and len(text2) >= 7:
-                    candidates.append(text2.upper())
-            except:
-                pass
-            
-            # Method 3: Simple enhancement
-            try:
-                enhanced3 = cv2.equalizeHist(gray)
-                text3 = self.recognizer.recognize(enhanced3)
-                if text3 and len(text3) >= 7:
-                    candidates.append(text3.upper())
-            except:
-                pass
-            
-            # Chọn kết quả tốt nhất
-            plate_text_raw = ''
-            if candidates:
-                for cand in candidates:
-                    is_valid, _ = self.validate_plate_format(cand)
-                    if is_valid:
-                        plate_text_raw = cand
-                        break
-                
-                if not plate_text_raw:
-                    plate_text_raw = max(candidates, key=len)
+            # Cascade rẻ → đắt, dừng sớm khi đã có kết quả hợp lệ với confidence cao
+            # Tất cả crop đi chung 1 batch ở mỗi pass
+            raw_texts = self.cascade.run_many(grays, pass_timer=pass_timer if metrics is not None else None)
             
-            # Validate và format
-            is_valid, plate_text = self.validate_plate_format(plate_text_raw)
-            plate_text_formatted = self.format_plate_text(plate_text) if is_valid else plate_text_raw
+            plates = []
+            labels = []
+            for detection, plate_text_raw in zip(detections, raw_texts):
+                # Validate và format
+                is_valid, plate_text = self.validate_plate_format(plate_text_raw)
+                plate_text_formatted = self.format_plate_text(plate_text) if is_valid else plate_text_raw
+                x1, y1, x2, y2 = detection['bbox']
+                plates.append({
+                    'plate_number': plate_text_formatted if is_valid else None,
+                    'confidence': detection['confidence'],
+                    'bbox': {
+                        'x': x1,
+                        'y': y1,
+                        'width': x2 - x1,
+                        'height': y2 - y1
+                    },
+                    'points': detection['points'].tolist(),
+                    'raw_text': plate_text_raw,
+                    'is_valid': is_valid
+                })
+                labels.append(plate_text_formatted)
             
             # Vẽ kết quả lên ảnh
-            annotated_image = self._draw_result(image, best_detection, plate_text_formatted)
+            stage_start = time.perf_counter()
+            annotated_image = self._draw_results(image, list(zip(detections, labels)))
+            observe('annotate', stage_start)
             
             # Encode annotated image to base64 for transmission
+            stage_start = time.perf_counter()
             _, buffer = cv2.imencode('.jpg', annotated_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
             annotated_base64 = base64.b64encode(buffer).decode('utf-8')
+            observe('encode', stage_start)
             
-            return {
+            # Compatibility view: field top-level = biển có confidence cao nhất
+            best = plates[0]
+            response = {
                 'success': True,
-                'plate_number': plate_text_formatted if is_valid else None,
-                'confidence': best_detection['confidence'],
-                'bbox': {
-                    'x': x1,
-                    'y': y1,
-                    'width': x2 - x1,
-                    'height': y2 - y1
-                },
-                'raw_text': plate_text_raw,
-                'is_valid': is_valid,
+                'plate_number': best['plate_number'],
+                'confidence': best['confidence'],
+                'bbox': best['bbox'],
+                'raw_text': best['raw_text'],
+                'is_valid': best['is_valid'],
                 'annotated_image': annotated_image,
                 'annotated_image_base64': f"data:image/jpeg;base64,{annotated_base64}"
             }
+            if multi_plate:
+                response['plates'] = plates
+            return response
             
         except Exception as e:
             return {
@@ -264,58 +233,66 @@ class LicensePlateDetector:
     
     def _draw_result(self, image, detection, plate_text):
         """Vẽ kết quả lên ảnh - style giống dự án test với khung xanh lá"""
+        return self._draw_results(image, [(detection, plate_text)])
+    
+    def _draw_results(self, image, items):
+        """Vẽ nhiều biển số lên 1 bản copy của ảnh - items: list (detection, plate_text)"""
         try:
             annotated = image.copy()
-            points = detection['points']
-            x1, y1, x2, y2 = detection['bbox']
-            conf = detection['confidence']
-            
-            # Vẽ OBB polygon với màu xanh lá đậm (BGR format)
-            cv2.polylines(annotated, [points], True, (0, 255, 0), 3)
-            
-            # Vẽ thêm rectangle bounding box
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            # Tạo label
-            if plate_text:
-                label = f"{plate_text}"
-                conf_label = f"Conf: {conf*100:.1f}%"
-            else:
-                label = "License Plate"
-                conf_label = f"Conf: {conf*100:.1f}%"
-            
-            # Đo kích thước text
-            (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
-            (conf_w, conf_h), _ = cv2.getTextSize(conf_label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-            
-            # Vẽ background cho biển số (xanh lá)
-            box_height = label_h + conf_h + 20
-            box_width = max(label_w, conf_w) + 20
-            cv2.rectangle(annotated, (x1, y1 - box_height - 5), 
-                         (x1 + box_width, y1), (0, 255, 0), -1)
-            
-            # Vẽ text biển số (màu đen, đậm)
-            cv2.putText(annotated, label, (x1 + 10, y1 - conf_h - 15),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
-            
-            # Vẽ confidence (màu đen)
-            cv2.putText(annotated, conf_label, (x1 + 10, y1 - 5),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-            
+            for detection, plate_text in items:
+                self._draw_plate(annotated, detection, plate_text)
             return annotated
         except Exception as e:
             print(f"[ERROR] Drawing error: {e}", file=sys.stderr)
             return image
+    
+    def _draw_plate(self, annotated, detection, plate_text):
+        """Vẽ 1 biển số (in-place) - style giống dự án test với khung xanh lá"""
+        points = detection['points']
+        x1, y1, x2, y2 = detection['bbox']
+        conf = detection['confidence']
+        
+        # Vẽ OBB polygon với màu xanh lá đậm (BGR format)
+        cv2.polylines(annotated, [points], True, (0, 255, 0), 3)
+        
+        # Vẽ thêm rectangle bounding box
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        
+        # Tạo label
+        if plate_text:
+            label = f"{plate_text}"
+            conf_label = f"Conf: {conf*100:.1f}%"
+        else:
+            label = "License Plate"
+            conf_label = f"Conf: {conf*100:.1f}%"
+        
+        # Đo kích thước text
+        (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+        (conf_w, conf_h), _ = cv2.getTextSize(conf_label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+        
+        # Vẽ background cho biển số (xanh lá)
+        box_height = label_h + conf_h + 20
+        box_width = max(label_w, conf_w) + 20
+        cv2.rectangle(annotated, (x1, y1 - box_height - 5), 
+                     (x1 + box_width, y1), (0, 255, 0), -1)
+        
+        # Vẽ text biển số (màu đen, đậm)
+        cv2.putText(annotated, label, (x1 + 10, y1 - conf_h - 15),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
+        
+        # Vẽ confidence (màu đen)
+        cv2.putText(annotated, conf_label, (x1 + 10, y1 - 5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
 
 
 # Global detector instance (lazy loading)
 _detector = None
 
-def get_detector():
-    """Get or create detector instance"""
+def get_detector(backend=None, precision=None):
+    """Get or create detector instance (backend/precision chỉ có tác dụng ở lần gọi đầu tiên)"""
     global _detector
     if _detector is None:
-        _detector = LicensePlateDetector()
+        _detector = LicensePlateDetector(backend=backend, precision=precision)
     return _detector
 
 
@@ -386,21 +363,26 @@ def save_detection_image(image, plate_number, output_dir='detected_plates'):
         return None
 
 
-def detect_and_recognize(image):
+# Trace từng request (thời gian, kết quả) - thay cho log [INFO]/[DEBUG] mỗi request
+# Server mode: xem qua request {"type": "trace"} hoặc kill -USR1 <pid> (dump ra logs/)
+request_trace = FrameTraceBuffer(name='inference_trace')
+
+
+def detect_and_recognize(image, multi_plate=False):
     """
     Main inference pipeline
     
     Args:
         image: Input image as numpy array (BGR format)
+        multi_plate: Đọc tất cả biển số trong ảnh (thêm key 'plates')
         
     Returns:
         dict: Detection and recognition results
     """
     start_time = time.time()
+    timings = {}
     
     try:
-        print("[INFO] Starting detect_and_recognize", file=sys.stderr, flush=True)
-        
         if not ML_AVAILABLE:
             # Fallback for testing
             return {
@@ -411,14 +393,15 @@ def detect_and_recognize(image):
                 'processing_time_ms': int((time.time() - start_time) * 1000)
             }
         
-        # Get detector
-        print("[INFO] Getting detector instance", file=sys.stderr, flush=True)
+        # Get detector (lần đầu: load model)
+        stage_start = time.time()
         detector = get_detector()
+        timings['get_detector'] = (time.time() - stage_start) * 1000
         
         # Run detection and OCR
-        print("[INFO] Running detection and recognition", file=sys.stderr, flush=True)
-        result = detector.detect_and_recognize(image, conf_threshold=0.25)
-        print("[INFO] Detection completed", file=sys.stderr, flush=True)
+        stage_start = time.time()
+        result = detector.detect_and_recognize(image, conf_threshold=0.25, multi_plate=multi_plate)
+        timings['detect_and_recognize'] = (time.time() - stage_start) * 1000
         
         # Add processing time
         result['processing_time_ms'] = int((time.time() - start_time) * 1000)
@@ -430,13 +413,22 @@ def detect_and_recognize(image):
                 saved_path = save_detection_image(annotated_image, result['plate_number'])
                 if saved_path:
                     result['saved_image'] = saved_path
-                    print(f"[INFO] Saved detection image: {saved_path}", file=sys.stderr)
         
+        timings['total'] = (time.time() - start_time) * 1000
+        request_trace.record(
+            image_shape=list(image.shape),
+            timings_ms={k: round(v, 2) for k, v in timings.items()},
+            success=result['success'],
+            plate=result.get('plate_number'),
+            saved_image=result.get('saved_image'),
+            error=result.get('error')
+        )
         return result
         
     except Exception as e:
         import traceback
-        traceback.print_exc(file=sys.stderr)
+        request_trace.record(timings_ms={k: round(v, 2) for k, v in timings.items()},
+                             error=str(e), traceback=traceback.format_exc())
         return {
             'success': False,
             'error': str(e),
@@ -446,15 +438,124 @@ def detect_and_recognize(image):
         }
 
 
+def serve():
+    """
+    Server mode - process sống lâu, model load 1 lần duy nhất.
+
+    Protocol (JSON-lines, 1 object / dòng):
+        stdout <- {"type": "ready", "pid": ..., "ml_available": ...}   (handshake sau khi load model)
+        stdin  -> {"id": "1", "type": "detect", "image_base64": "...", "multi_plate": false}
+        stdout <- {"id": "1", "type": "result", "result": {...}}
+        stdin  -> {"id": "2", "type": "health"}
+        stdout <- {"id": "2", "type": "health", "status": "ready", ...}
+        stdin  -> {"id": "3", "type": "trace", "limit": 50}
+        stdout <- {"id": "3", "type": "trace", "stats": {...}, "records": [...]}
+
+    Request được nhận diện bằng `id` nên response có thể trả về không theo thứ tự.
+    Health được trả lời ngay trên reader thread, không phải chờ inference.
+    """
+    # Giữ stdout thật cho protocol, mọi print() khác (kể cả của thư viện) đi sang stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    write_lock = threading.Lock()
+
+    def send(message):
+        line = json.dumps(message)
+        with write_lock:
+            protocol_out.write(line + '\n')
+            protocol_out.flush()
+
+    started_at = time.time()
+    stats = {'requests': 0, 'errors': 0}
+
+    # Load model TRƯỚC khi báo ready
+    if ML_AVAILABLE:
+        try:
+            get_detector()
+        except Exception as e:
+            send({'type': 'fatal', 'error': f'Failed to load detector: {e}'})
+            return
+
+    send({'type': 'ready', 'pid': os.getpid(), 'ml_available': ML_AVAILABLE})
+    install_dump_signal(request_trace)
+
+    # Model không thread-safe → 1 worker duy nhất chạy inference
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def handle_detect(request_id, image_base64, multi_plate):
+        try:
+            image = decode_base64_image(image_base64)
+            if image is None:
+                result = {'success': False, 'error': 'Failed to decode base64 image'}
+            else:
+                result = detect_and_recognize(image, multi_plate=multi_plate)
+            result.pop('annotated_image', None)
+            stats['requests'] += 1
+            send({'id': request_id, 'type': 'result', 'result': result})
+        except Exception as e:
+            stats['errors'] += 1
+            send({'id': request_id, 'type': 'error', 'error': str(e)})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            send({'id': None, 'type': 'error', 'error': f'Invalid JSON request: {e}'})
+            continue
+
+        request_id = request.get('id')
+        request_type = request.get('type', 'detect')
+
+        if request_type == 'trace':
+            # Post-mortem: các request gần nhất trong ring buffer
+            send({
+                'id': request_id,
+                'type': 'trace',
+                'stats': request_trace.get_stats(),
+                'records': request_trace.snapshot(
+                    limit=request['limit'] if isinstance(request.get('limit'), int) else None)
+            })
+        elif request_type == 'health':
+            send({
+                'id': request_id,
+                'type': 'health',
+                'status': 'ready',
+                'pid': os.getpid(),
+                'uptime_seconds': int(time.time() - started_at),
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'trace': request_trace.get_stats(),
+                'ocr_cascade': get_detector().cascade.get_stats() if ML_AVAILABLE else None
+            })
+        elif request_type == 'detect':
+            image_base64 = request.get('image_base64', '')
+            if not image_base64:
+                send({'id': request_id, 'type': 'error', 'error': 'Missing image_base64'})
+                continue
+            executor.submit(handle_detect, request_id, image_base64, bool(request.get('multi_plate')))
+        elif request_type == 'shutdown':
+            break
+        else:
+            send({'id': request_id, 'type': 'error', 'error': f'Unknown request type: {request_type}'})
+
+    # stdin đóng (parent thoát) → chờ các request đang chạy rồi thoát
+    executor.shutdown(wait=True)
+
+
 def main():
     """Main entry point"""
-    print("[DEBUG] Script started", file=sys.stderr, flush=True)
-    
+    if '--server' in sys.argv:
+        serve()
+        return
+
     # Check if we should read from stdin
     use_stdin = '--stdin' in sys.argv
     
     if use_stdin:
-        print("[DEBUG] Reading image from STDIN", file=sys.stderr, flush=True)
         # Read base64 from stdin
         image_base64 = sys.stdin.read().strip()
     else:
@@ -466,13 +567,9 @@ def main():
             }), flush=True)
             return
         
-        print("[DEBUG] Reading image from command line argument", file=sys.stderr, flush=True)
         image_base64 = sys.argv[2]
     
-    print(f"[DEBUG] Image base64 length: {len(image_base64)}", file=sys.stderr, flush=True)
-    
     # Decode image
-    print("[DEBUG] Decoding image...", file=sys.stderr, flush=True)
     image = decode_base64_image(image_base64)
     
     if image is None:
@@ -482,21 +579,15 @@ def main():
         }), flush=True)
         return
     
-    print(f"[DEBUG] Image decoded: {image.shape}", file=sys.stderr, flush=True)
-    
     # Run inference
-    print("[DEBUG] Running inference...", file=sys.stderr, flush=True)
     result = detect_and_recognize(image)
     
-    print("[DEBUG] Inference completed", file=sys.stderr, flush=True)
-    
     # Remove annotated_image from output (too large for JSON)
     if 'annotated_image' in result:
         del result['annotated_image']
     
     # Print result as JSON
     print(json.dumps(result), flush=True)
-    print("[DEBUG] Result sent", file=sys.stderr, flush=True)
 
 
 if __name__ == '__main__':
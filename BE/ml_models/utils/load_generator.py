@@ -0,0 +1,331 @@
+"""
+Load test cho websocket_detector: giả lập N camera cổng gửi frame cùng lúc
+→ đo round-trip time video_frame → detection_result, tỉ lệ frame bị bỏ, stats phía server
+→ báo cáo capacity (số camera tối đa giữ được SLO latency / drop)
+
+Mỗi camera 1 Socket.IO client riêng: register_camera rồi gửi video_frame (JPEG binary)
+từ clip local ở FPS + chất lượng JPEG cố định (encode sẵn 1 lần, không tốn CPU client lúc chạy)
+
+Usage:
+    python load_generator.py --source ./gate_clip.mp4 --cameras 1 2 4 8 16 --fps 10 --duration 30
+    python load_generator.py --source ./frames --cameras 4 --result-mode metadata --obey-rate-advice \\
+        --slo-ms 300 --max-drop 0.2 --output capacity.json
+
+Server phải đang chạy: python websocket_detector.py [--workers N]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import cv2
+import numpy as np
+import socketio
+from socketio.exceptions import BadNamespaceError
+
+# Không import utils.export_models (kéo theo ultralytics/torch) - máy chạy load test không cần model
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+
+
+def list_images(image_dir):
+    return sorted(p for ext in IMAGE_EXTENSIONS for p in glob.glob(os.path.join(image_dir, ext)))
+
+
+def load_clip(source, max_frames, width, jpeg_quality):
+    """Đọc clip (video / thư mục ảnh), resize theo width, encode JPEG 1 lần → list bytes"""
+    if os.path.isdir(source):
+        frames = (cv2.imread(path) for path in list_images(source))
+    else:
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {source}")
+
+        def read_video():
+            try:
+                while True:
+                    ok, frame = cap.read()
+                    if not ok:
+                        return
+                    yield frame
+            finally:
+                cap.release()
+        frames = read_video()
+
+    encoded = []
+    for frame in frames:
+        if frame is None:
+            continue
+        if width and frame.shape[1] != width:
+            height = int(round(frame.shape[0] * width / frame.shape[1]))
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        if ok:
+            encoded.append(buffer.tobytes())
+        if len(encoded) >= max_frames:
+            break
+
+    if not encoded:
+        raise ValueError(f"No frames read from {source}")
+    return encoded
+
+
+class SimulatedCamera:
+    """1 camera giả lập: 1 Socket.IO client, gửi frame theo nhịp FPS, ghi RTT từng kết quả"""
+
+    def __init__(self, url, camera_id, frames, fps, result_mode, obey_rate_advice, offset=0):
+        self.url = url
+        self.camera_id = camera_id
+        self.frames = frames
+        self.fps = fps
+        self.result_mode = result_mode
+        self.obey_rate_advice = obey_rate_advice
+        # Mỗi camera bắt đầu ở 1 vị trí khác trong clip → các camera không gửi frame giống hệt nhau
+        self.offset = offset
+
+        self.client = socketio.Client(reconnection=False)
+        self.registered = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._last_timestamp = 0
+
+        # Kết quả
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.valid_reads = 0
+        self.rtt_ms = []
+        self.advised_fps = None
+        self.last_stats = None
+
+        self.client.on('camera_registered', self._on_registered)
+        self.client.on('detection_result', self._on_result)
+        self.client.on('detection_error', self._on_error)
+        self.client.on('rate_advice', self._on_rate_advice)
+
+    def _on_registered(self, data):
+        self.registered.set()
+
+    def _on_result(self, data):
+        now = time.perf_counter()
+        with self._lock:
+            sent_at = self._in_flight.pop(data.get('timestamp'), None)
+            self.received += 1
+            if sent_at is not None:
+                self.rtt_ms.append((now - sent_at) * 1000)
+            detection = data.get('detection')
+            if detection and detection.get('is_valid'):
+                self.valid_reads += 1
+            self.last_stats = data.get('stats')
+
+    def _on_error(self, data):
+        with self._lock:
+            self.errors += 1
+
+    def _on_rate_advice(self, data):
+        self.advised_fps = data.get('max_fps')
+
+    def connect(self, timeout=10.0):
+        self.client.connect(self.url, transports=['websocket'])
+        self.client.emit('register_camera', {'cameraId': self.camera_id, 'resultMode': self.result_mode})
+        if not self.registered.wait(timeout):
+            raise RuntimeError(f'{self.camera_id}: camera_registered not received')
+
+    def run(self, stop_at):
+        """Gửi frame tới thời điểm stop_at (perf_counter)"""
+        index = self.offset
+        next_send = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            if now < next_send:
+                time.sleep(min(next_send - now, stop_at - now))
+                continue
+
+            # timestamp (ms) làm khoá ghép kết quả - phải duy nhất trong camera
+            timestamp = max(int(time.time() * 1000), self._last_timestamp + 1)
+            self._last_timestamp = timestamp
+            with self._lock:
+                self._in_flight[timestamp] = time.perf_counter()
+                self.sent += 1
+            try:
+                self.client.emit('video_frame', {
+                    'cameraId': self.camera_id,
+                    'frame': self.frames[index % len(self.frames)],
+                    'timestamp': timestamp
+                })
+            except BadNamespaceError:
+                break
+            index += 1
+
+            fps = self.fps
+            if self.obey_rate_advice and self.advised_fps:
+                fps = min(fps, self.advised_fps)
+            next_send += 1.0 / fps
+            # Tụt quá xa lịch (client bị nghẽn) → không gửi dồn để đuổi kịp
+            next_send = max(next_send, time.perf_counter() - 1.0 / fps)
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+def percentile(values, p):
+    return round(float(np.percentile(values, p)), 1) if values else None
+
+
+def fetch_health(url, timeout=5.0):
+    try:
+        with urllib.request.urlopen(f'{url.rstrip("/")}/health', timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except (OSError, ValueError) as e:
+        return {'error': str(e)}
+
+
+def run_level(args, frames, num_cameras):
+    """Chạy 1 mức tải (num_cameras camera) trong args.duration giây"""
+    cameras = [
+        SimulatedCamera(args.url, f'{args.camera_prefix}_{i}', frames, args.fps, args.result_mode,
+                        args.obey_rate_advice, offset=(i * len(frames)) // max(1, num_cameras))
+        for i in range(num_cameras)
+    ]
+    try:
+        for camera in cameras:
+            camera.connect()
+
+        start = time.perf_counter()
+        stop_at = start + args.duration
+        threads = [threading.Thread(target=camera.run, args=(stop_at,), name=camera.camera_id, daemon=True)
+                   for camera in cameras]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Chờ kết quả của các frame cuối
+        time.sleep(args.drain)
+        elapsed = time.perf_counter() - start
+        health = fetch_health(args.url)
+    finally:
+        for camera in cameras:
+            camera.close()
+
+    rtt = [v for camera in cameras for v in camera.rtt_ms]
+    sent = sum(c.sent for c in cameras)
+    received = sum(c.received for c in cameras)
+    stats = health.get('stats', {}) if isinstance(health, dict) else {}
+
+    return {
+        'cameras': num_cameras,
+        'duration_s': round(elapsed, 1),
+        'sent': sent,
+        'received': received,
+        'errors': sum(c.errors for c in cameras),
+        'drop_ratio': round(1 - received / sent, 4) if sent else 0.0,
+        'sent_fps_per_camera': round(sent / num_cameras / args.duration, 2),
+        'result_fps_per_camera': round(received / num_cameras / elapsed, 2),
+        'valid_reads': sum(c.valid_reads for c in cameras),
+        'rtt_ms': {
+            'p50': percentile(rtt, 50),
+            'p95': percentile(rtt, 95),
+            'p99': percentile(rtt, 99),
+            'max': round(max(rtt), 1) if rtt else None
+        },
+        'advised_fps': {c.camera_id: c.advised_fps for c in cameras if c.advised_fps is not None},
+        'server': {
+            'quality_tier': health.get('quality_tier') if isinstance(health, dict) else None,
+            'deadline_misses': health.get('deadline_misses') if isinstance(health, dict) else None,
+            'avg_fps': stats.get('avg_fps'),
+            'frame_queue': {camera: q for camera, q in (stats.get('frame_queue') or {}).items()
+                            if camera.startswith(args.camera_prefix)},
+            'rate_control': {camera: r for camera, r in (stats.get('rate_control') or {}).items()
+                             if camera.startswith(args.camera_prefix)},
+            'error': health.get('error') if isinstance(health, dict) else None
+        }
+    }
+
+
+def meets_slo(level, args):
+    p95 = level['rtt_ms']['p95']
+    return p95 is not None and p95 <= args.slo_ms and level['drop_ratio'] <= args.max_drop
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO load test cho websocket_detector')
+    parser.add_argument('--url', default='http://localhost:5001')
+    parser.add_argument('--source', required=True, help='Clip video hoặc thư mục ảnh')
+    parser.add_argument('--cameras', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Số camera mỗi mức tải (tăng dần)')
+    parser.add_argument('--fps', type=float, default=10.0, help='FPS gửi của mỗi camera')
+    parser.add_argument('--jpeg-quality', type=int, default=80)
+    parser.add_argument('--width', type=int, default=1280, help='Resize frame theo chiều rộng (0 = giữ nguyên)')
+    parser.add_argument('--max-frames', type=int, default=300, help='Số frame tối đa đọc từ clip')
+    parser.add_argument('--duration', type=float, default=30.0, help='Thời gian mỗi mức tải (giây)')
+    parser.add_argument('--drain', type=float, default=2.0, help='Thời gian chờ kết quả cuối sau khi dừng gửi')
+    parser.add_argument('--pause', type=float, default=3.0, help='Nghỉ giữa 2 mức tải (server xả hàng đợi)')
+    parser.add_argument('--result-mode', choices=['annotated', 'metadata'], default='annotated')
+    parser.add_argument('--obey-rate-advice', action='store_true', help='Giảm FPS theo rate_advice như frontend')
+    parser.add_argument('--camera-prefix', default='loadtest')
+    parser.add_argument('--slo-ms', type=float, default=500.0, help='SLO p95 RTT (ms)')
+    parser.add_argument('--max-drop', type=float, default=0.1, help='Tỉ lệ drop tối đa chấp nhận')
+    parser.add_argument('--stop-on-fail', action='store_true', help='Dừng sweep ở mức đầu tiên vượt SLO')
+    parser.add_argument('--output', help='Ghi báo cáo ra file JSON')
+    args = parser.parse_args()
+
+    frames = load_clip(args.source, args.max_frames, args.width, args.jpeg_quality)
+    print(f"Loaded {len(frames)} frame(s), avg {sum(map(len, frames)) / len(frames) / 1024:.0f} KB/frame "
+          f"(JPEG q{args.jpeg_quality})")
+
+    levels = []
+    for num_cameras in sorted(set(args.cameras)):
+        print(f"\n▶ {num_cameras} camera(s) × {args.fps:g} FPS for {args.duration:g}s...")
+        level = run_level(args, frames, num_cameras)
+        level['meets_slo'] = meets_slo(level, args)
+        levels.append(level)
+        print(f"  RTT p50/p95/p99: {level['rtt_ms']['p50']}/{level['rtt_ms']['p95']}/{level['rtt_ms']['p99']} ms  "
+              f"drop: {level['drop_ratio'] * 100:.1f}%  results: {level['result_fps_per_camera']} FPS/camera  "
+              f"tier: {level['server']['quality_tier']}  {'OK' if level['meets_slo'] else 'FAIL'}")
+        if args.stop_on_fail and not level['meets_slo']:
+            break
+        time.sleep(args.pause)
+
+    passing = [level['cameras'] for level in levels if level['meets_slo']]
+    report = {
+        'url': args.url,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {
+            'fps': args.fps, 'jpeg_quality': args.jpeg_quality, 'width': args.width,
+            'duration_s': args.duration, 'result_mode': args.result_mode,
+            'obey_rate_advice': args.obey_rate_advice, 'slo_ms': args.slo_ms, 'max_drop': args.max_drop
+        },
+        'levels': levels,
+        'max_cameras_within_slo': max(passing) if passing else 0
+    }
+
+    print("\n" + "=" * 78)
+    print(f"Capacity vs latency (SLO: p95 RTT ≤ {args.slo_ms:g} ms, drop ≤ {args.max_drop * 100:g}%)")
+    print("=" * 78)
+    print(f"{'cameras':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'drop %':>8} {'res FPS/cam':>12} {'tier':>12}  SLO")
+    for level in levels:
+        rtt = level['rtt_ms']
+        print(f"{level['cameras']:>8} {str(rtt['p50']):>8} {str(rtt['p95']):>8} {str(rtt['p99']):>8} "
+              f"{level['drop_ratio'] * 100:>8.1f} {level['result_fps_per_camera']:>12} "
+              f"{str(level['server']['quality_tier']):>12}  {'OK' if level['meets_slo'] else 'FAIL'}")
+    print(f"\nMax cameras within SLO: {report['max_cameras_within_slo']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
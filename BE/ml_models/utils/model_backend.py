@@ -0,0 +1,113 @@
+"""
+Model Backend Module
+Chọn runtime cho các model YOLO: PyTorch (eager, mặc định), ONNX Runtime hoặc OpenVINO (CPU)
+
+Backend được đọc từ config.json cạnh model (key "backend"), precision từ key "precision"
+("fp32" | "quantized" - INT8, tạo bằng utils/quantize_models.py).
+Nếu model export chưa có hoặc load lỗi → fallback về FP32 rồi PyTorch.
+"""
+
+import json
+import os
+import sys
+
+from ultralytics import YOLO
+
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+PRECISIONS = ('fp32', 'quantized')
+
+
+def load_model_config(model_dir):
+    """Đọc config.json trong thư mục model (không bắt buộc)"""
+    config_path = os.path.join(model_dir, 'config.json')
+    if not os.path.exists(config_path):
+        return {}
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ModelBackend] Failed to read config {config_path}: {e}", file=sys.stderr)
+        return {}
+
+
+def exported_path(pt_path, backend, precision='fp32'):
+    """Đường dẫn model đã export (theo quy ước đặt tên của ultralytics)"""
+    stem, _ = os.path.splitext(pt_path)
+    int8 = '_int8' if precision == 'quantized' else ''
+    if backend == 'onnx':
+        return stem + int8 + '.onnx'
+    if backend == 'openvino':
+        return stem + int8 + '_openvino_model'
+    return pt_path
+
+
+def _try_load(path, backend, task):
+    if not os.path.exists(path):
+        print(f"[ModelBackend] Exported model not found: {path}", file=sys.stderr)
+        return None
+    try:
+        model = YOLO(path, task=task)
+        print(f"[ModelBackend] Loaded {backend} model: {path}", file=sys.stderr)
+        return model
+    except Exception as e:
+        print(f"[ModelBackend] Failed to load {backend} model {path}: {e}", file=sys.stderr)
+        return None
+
+
+def load_yolo(pt_path, backend='pytorch', task=None, precision='fp32'):
+    """
+    Load YOLO model với backend + precision chỉ định, fallback nếu không được:
+    quantized → fp32 cùng backend → pytorch
+
+    Args:
+        pt_path: đường dẫn file .pt gốc
+        backend: 'pytorch' | 'onnx' | 'openvino'
+        task: 'obb' | 'detect' - bắt buộc cho model export (không có trong metadata cũ)
+        precision: 'fp32' | 'quantized'
+
+    Returns:
+        (model, backend_used, precision_used)
+    """
+    backend = (backend or 'pytorch').lower()
+    if backend not in BACKENDS:
+        print(f"[ModelBackend] Unknown backend '{backend}', using pytorch", file=sys.stderr)
+        backend = 'pytorch'
+
+    precision = (precision or 'fp32').lower()
+    if precision not in PRECISIONS:
+        print(f"[ModelBackend] Unknown precision '{precision}', using fp32", file=sys.stderr)
+        precision = 'fp32'
+
+    if backend == 'pytorch' and precision == 'quantized':
+        print("[ModelBackend] Quantized precision needs backend onnx/openvino, using fp32", file=sys.stderr)
+        precision = 'fp32'
+
+    if backend != 'pytorch':
+        if precision == 'quantized':
+            model = _try_load(exported_path(pt_path, backend, 'quantized'), backend, task)
+            if model is not None:
+                return model, backend, 'quantized'
+            print("[ModelBackend] Falling back to fp32 (run utils/quantize_models.py)", file=sys.stderr)
+
+        model = _try_load(exported_path(pt_path, backend), backend, task)
+        if model is not None:
+            return model, backend, 'fp32'
+        print("[ModelBackend] Falling back to pytorch (run utils/export_models.py)", file=sys.stderr)
+
+    return YOLO(pt_path, task=task), 'pytorch', 'fp32'
+
+
+def export_yolo(pt_path, backend, imgsz=640):
+    """
+    Export model .pt sang ONNX / OpenVINO
+
+    Returns:
+        str: đường dẫn model đã export
+    """
+    if backend not in ('onnx', 'openvino'):
+        raise ValueError(f"Export backend must be 'onnx' or 'openvino', got '{backend}'")
+
+    model = YOLO(pt_path)
+    # Dynamic axes để chạy được batch nhiều crop (recognize_batch)
+    return model.export(format=backend, imgsz=imgsz, dynamic=True)
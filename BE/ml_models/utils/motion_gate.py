@@ -0,0 +1,104 @@
+"""
+Motion Gate Module
+Bộ lọc chuyển động rẻ đặt trước detector: frame thu nhỏ + so sánh với background (running average)
+→ làn xe trống / không thay đổi thì bỏ qua YOLO, trả lại kết quả gần nhất của camera
+"""
+
+import cv2
+import numpy as np
+
+from utils.camera_roi import CameraROI
+
+
+# Cấu hình mặc định - có thể override trong plate_detector/config.json (key "motion_gate"),
+# từng camera override thêm trong "motion_gate.cameras.<cameraId>"
+DEFAULT_MOTION_CONFIG = {
+    'enabled': True,
+    # Chiều rộng frame thu nhỏ dùng để so sánh
+    'downscale_width': 160,
+    # Chênh lệch mức xám tối thiểu để 1 pixel tính là thay đổi
+    'pixel_threshold': 25,
+    # Tỉ lệ pixel thay đổi (trong ROI) tối thiểu để coi là có chuyển động - độ nhạy của camera
+    'min_changed_ratio': 0.01,
+    # Tốc độ cập nhật background (xe đỗ lâu sẽ dần thành background)
+    'background_alpha': 0.05,
+    # Sau bấy nhiêu frame tĩnh liên tiếp vẫn chạy detector 1 lần (làm mới kết quả)
+    'max_static_frames': 50,
+}
+
+
+class MotionGate:
+    """Motion gate của 1 camera"""
+
+    def __init__(self, config=None, roi=None):
+        self.config = dict(DEFAULT_MOTION_CONFIG)
+        if config:
+            self.config.update(config)
+
+        # ROI riêng cho motion (config) - nếu không có dùng ROI detection của camera
+        self.roi = CameraROI.from_config(self.config['roi']) if self.config.get('roi') else roi
+
+        self.background = None
+        self.static_frames = 0
+        self._mask = None
+        self._mask_shape = None
+
+        # Stats
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+    def should_process(self, frame):
+        """
+        Returns:
+            True nếu frame có chuyển động (hoặc cần làm mới) → chạy detector
+        """
+        self.frames_checked += 1
+
+        h, w = frame.shape[:2]
+        small_w = min(w, self.config['downscale_width'])
+        small_h = max(1, int(round(h * small_w / w)))
+        small = cv2.resize(frame, (small_w, small_h), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.static_frames = 0
+            return True
+
+        changed = cv2.absdiff(gray, cv2.convertScaleAbs(self.background)) > self.config['pixel_threshold']
+        mask = self._roi_mask(gray.shape, (h, w))
+        ratio = float(changed[mask].mean()) if mask is not None else float(changed.mean())
+
+        cv2.accumulateWeighted(gray, self.background, self.config['background_alpha'])
+
+        if ratio >= self.config['min_changed_ratio'] or self.static_frames >= self.config['max_static_frames']:
+            self.static_frames = 0
+            return True
+
+        self.static_frames += 1
+        self.frames_skipped += 1
+        return False
+
+    def _roi_mask(self, small_shape, frame_shape):
+        """Mask ROI theo kích thước frame thu nhỏ (cache)"""
+        if self.roi is None:
+            return None
+        if self._mask_shape != small_shape:
+            sh, sw = small_shape
+            if self.roi.normalized:
+                polygon = self.roi.polygon * np.array([sw, sh], dtype=np.float32)
+            else:
+                polygon = self.roi.polygon * np.array([sw / frame_shape[1], sh / frame_shape[0]], dtype=np.float32)
+            mask = np.zeros(small_shape, dtype=np.uint8)
+            cv2.fillPoly(mask, [polygon.astype(np.int32)], 1)
+            self._mask = mask.astype(bool) if mask.any() else None
+            self._mask_shape = small_shape
+        return self._mask
+
+    def get_stats(self):
+        checked = self.frames_checked
+        return {
+            'frames_checked': checked,
+            'inference_skipped': self.frames_skipped,
+            'skip_ratio': round(self.frames_skipped / checked, 4) if checked > 0 else 0.0
+        }
@@ -0,0 +1,444 @@
+"""
+Persistent Detector Module
+YOLO plate detector + YOLO character recognizer load 1 lần, dùng cho realtime streaming
+(websocket_detector chạy in-process hoặc mỗi process trong DetectorPool giữ 1 instance riêng)
+"""
+
+import cv2
+import time
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from character_recognition.plate_recognizer_inference import PlateRecognizer
+from utils.model_backend import load_model_config, load_yolo
+from utils.plate_postprocess import is_valid_bbox
+from utils.camera_roi import CameraROI, detect_plates_in_rois, load_camera_rois
+from utils.plate_tracker import DEFAULT_TRACKING_CONFIG, PlateTracker
+from utils.motion_gate import DEFAULT_MOTION_CONFIG, MotionGate
+from utils.quality_tiers import QualityController
+from utils.stage_metrics import StageMetrics
+from character_recognition.plate_preprocessing import prepare_gray
+from character_recognition.plate_cascade import RecognitionCascade
+from character_recognition.plate_grammar import format_plate, validate_plate
+from character_recognition.ocr_cache import OCRResultCache
+
+
+class PersistentDetector:
+    """
+    Detector PERSISTENT - Model load 1 lần duy nhất!
+    Sử dụng YOLO character detector với preprocessing cải tiến cho độ chính xác cao
+    """
+    
+    def __init__(self, model_path='ml_models/plate_detector/best.pt', backend=None, precision=None):
+        print("\n" + "=" * 60)
+        print("🚀 INITIALIZING PERSISTENT DETECTOR")
+        print("=" * 60)
+        
+        # Check model path
+        if not os.path.exists(model_path):
+            print(f"[ERROR] Model not found: {model_path}")
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        
+        # Backend (pytorch / onnx / openvino) + precision (fp32 / quantized) từ plate_detector/config.json
+        self.config = load_model_config(os.path.dirname(model_path))
+        detector_backend = backend or self.config.get('backend', 'pytorch')
+        detector_precision = precision or self.config.get('precision', 'fp32')
+        
+        # Load YOLO model - 1 LẦN DUY NHẤT!
+        print(f"\n[1/2] 📦 Loading YOLO model from {model_path} "
+              f"(backend: {detector_backend}, precision: {detector_precision})...")
+        start_time = time.time()
+        self.model, self.backend, self.precision = load_yolo(model_path, backend=detector_backend,
+                                                             task='obb', precision=detector_precision)
+        print(f"[1/2] ✅ YOLO model loaded in {time.time() - start_time:.2f}s ({self.backend}, {self.precision})")
+        
+        # Độ phân giải detection: frame thu nhỏ về detection_max_side, YOLO chạy ở input_size [h, w]
+        self.detect_imgsz = self.config.get('input_size')
+        self.detect_max_side = self.config.get('detection_max_side')
+        
+        # ROI từng camera (cameraId → CameraROI) - cấu hình "camera_rois" hoặc gửi kèm register_camera
+        self.camera_rois = load_camera_rois(self.config)
+        
+        # Tracker theo camera (cameraId → PlateTracker) - track đã khoá kết quả chỉ OCR lại để xác nhận
+        self.tracking_config = dict(DEFAULT_TRACKING_CONFIG)
+        self.tracking_config.update(self.config.get('tracking') or {})
+        self.trackers = {}
+        
+        # Motion gate theo camera - frame tĩnh dùng lại kết quả gần nhất (cameraId → (detections, texts, tracks))
+        self.motion_config = self.config.get('motion_gate') or {}
+        self.motion_gates = {}
+        self.last_results = {}
+        
+        # Quality tier theo tải (bỏ NLM → 1 pass OCR → detector độ phân giải thấp)
+        self.quality = QualityController(self.config.get('quality'))
+        
+        # Histogram latency từng stage theo camera (endpoint /metrics)
+        self.metrics = StageMetrics((self.config.get('metrics') or {}).get('latency_buckets_ms'))
+        
+        # Load PlateRecognizer (YOLO char detector) - 1 LẦN DUY NHẤT!
+        print("\n[2/2] 📖 Initializing PlateRecognizer (YOLO char detector)...")
+        start_time = time.time()
+        self.recognizer = PlateRecognizer(backend=backend, precision=precision)
+        print(f"[2/2] ✅ PlateRecognizer loaded in {time.time() - start_time:.2f}s")
+        
+        # OCR cascade (cấu hình trong character_recognition/config.json)
+        self.cascade = RecognitionCascade(self.recognizer, self.validate_plate_format,
+                                          self.recognizer.config.get('cascade'))
+        # Cache kết quả OCR theo pHash crop + cameraId (xe đỗ / nhích chậm → không OCR lại)
+        self.ocr_cache = OCRResultCache(self.recognizer.config.get('ocr_cache'))
+        
+        print("\n" + "=" * 60)
+        print("🎉 DETECTOR READY FOR REALTIME DETECTION!")
+        print("=" * 60 + "\n")
+        
+        # Stats
+        self.total_frames = 0
+        self.total_detections = 0
+        self.start_time = time.time()
+        
+        self.ocr_skipped = 0  # Số biển dùng kết quả track đã khoá thay vì OCR
+    
+    def validate_plate_format(self, text):
+        """
+        Kiểm tra format biển số VN theo template của plate_grammar (cùng định nghĩa với decoder):
+        2 số mã tỉnh + seri (L, LL, LD, DL) + 4-5 số
+
+        VD hợp lệ: 30A-12345, 30AB-1234, 29T1-82843
+        Returns: (is_valid, cleaned_text)
+        """
+        return validate_plate(text)
+    
+    def format_plate_text(self, text):
+        """Format biển số: 30A-12345, 29T1-82843"""
+        return format_plate(text)
+    
+    def set_camera_roi(self, camera_id, roi_config):
+        """Đặt / xoá ROI cho camera (roi_config None → detect cả frame)"""
+        if roi_config is None:
+            self.camera_rois.pop(camera_id, None)
+            self.motion_gates.pop(camera_id, None)
+            return None
+        self.camera_rois[camera_id] = CameraROI.from_config(roi_config)
+        # Motion gate dùng ROI mới
+        self.motion_gates.pop(camera_id, None)
+        return self.camera_rois[camera_id]
+    
+    def detect_and_annotate(self, frame, multi_plate=False, camera_id=None, annotate=True):
+        """
+        DETECT VÀ VẼ NGAY - REALTIME!
+        Giống y hệt project test's process_frame()
+        
+        Args:
+            frame: BGR numpy array
+            multi_plate: True → đọc TẤT CẢ biển số trong frame (plate_info['plates'])
+            camera_id: cameraId - dùng ROI của camera (nếu có) thay vì detect cả frame
+            annotate: False → chế độ metadata: không copy frame, không vẽ (client tự vẽ overlay)
+            
+        Returns:
+            annotated_frame: Frame đã vẽ khung xanh lá + text (None nếu annotate=False)
+            plate_info: Dict chứa thông tin biển số (hoặc None)
+        """
+        return self.detect_and_annotate_batch([{
+            'frame': frame,
+            'multi_plate': multi_plate,
+            'camera_id': camera_id,
+            'annotate': annotate
+        }])[0]
+    
+    def detect_and_annotate_batch(self, requests):
+        """
+        Micro-batch nhiều frame (thường từ nhiều camera):
+        1 lần forward plate detector cho tất cả frame → 1 batch OCR cho tất cả crop biển số
+        
+        Args:
+            requests: list dict {'frame', 'multi_plate', 'camera_id', 'annotate'} (như detect_and_annotate),
+                      tuỳ chọn 'received_at' (time.time() lúc server nhận frame - tính latency cho quality tier)
+            
+        Returns:
+            list (annotated_frame, plate_info) cùng thứ tự requests
+        """
+        start_time = time.time()
+        outputs = [None] * len(requests)
+        active, static = [], []
+        
+        for i, req in enumerate(requests):
+            self.total_frames += 1
+            
+            # Motion gate - frame không đổi so với background → dùng lại kết quả gần nhất, không chạy YOLO
+            gate = self._motion_gate(req.get('camera_id'))
+            if gate is not None and not gate.should_process(req['frame']):
+                static.append(i)
+                continue
+            
+            active.append(i)
+        
+        # Detect với YOLO ở độ phân giải giảm - OBB map về frame gốc để crop giữ đủ chi tiết
+        # Chỉ trong ROI của camera (nếu có), tất cả frame đi chung 1 batch detector
+        tier = self.quality.current
+        imgsz, max_side = self.quality.detector_resolution(self.detect_imgsz, self.detect_max_side)
+        stage_start = time.perf_counter()
+        all_detections = detect_plates_in_rois(
+            self.model,
+            [requests[i]['frame'] for i in active],
+            [self.camera_rois.get(requests[i].get('camera_id')) for i in active],
+            0.25, imgsz=imgsz, max_side=max_side)
+        if active:
+            self.metrics.observe_many([requests[i].get('camera_id') for i in active], 'detect',
+                                      time.perf_counter() - stage_start)
+        
+        # Crop biển số của tất cả frame (bỏ qua biển thuộc track đã khoá kết quả / trúng OCR cache)
+        grays, owners, crop_hashes = [], [], []
+        frame_detections, frame_tracks, texts_by_frame = {}, {}, {}
+        for i, detections in zip(active, all_detections):
+            req = requests[i]
+            if req.get('multi_plate', False):
+                detections = [d for d in detections if is_valid_bbox(d['bbox'])]
+            else:
+                # Chỉ lấy detection TỐT NHẤT (highest confidence)
+                detections = detections[:1]
+            
+            if not detections or not is_valid_bbox(detections[0]['bbox']):
+                self._update_tracks(req.get('camera_id'), [])
+                self.last_results.pop(req.get('camera_id'), None)
+                outputs[i] = ((req['frame'] if req.get('annotate', True) else None), None)
+                continue
+            
+            tracks = self._update_tracks(req.get('camera_id'), detections)
+            frame_detections[i] = detections
+            frame_tracks[i] = tracks
+            texts_by_frame[i] = [''] * len(detections)
+            
+            stage_start = time.perf_counter()
+            tracker = self.trackers.get(req.get('camera_id'))
+            for k, (detection, track) in enumerate(zip(detections, tracks)):
+                x1, y1, x2, y2 = detection['bbox']
+                gray = prepare_gray(req['frame'][y1:y2, x1:x2])
+                # pHash crop: tra OCR cache + phát hiện crop của track đã khoá đổi khác hẳn
+                crop_hash = self.ocr_cache.hash(gray) if (self.ocr_cache.enabled or track is not None) else None
+                if track is not None and not tracker.needs_ocr(track, crop_hash):
+                    texts_by_frame[i][k] = track.locked_text
+                    self.ocr_skipped += 1
+                    continue
+                # Track khoá tới lượt xác nhận → luôn OCR thật, không lấy từ cache
+                if self.ocr_cache.enabled and not (track is not None and track.locked):
+                    hit, cached = self.ocr_cache.lookup(req.get('camera_id'), crop_hash)
+                    if hit:
+                        # Crop gần như không đổi → dùng lại kết quả cũ, không cộng vote
+                        # (cùng 1 lần đọc, không phải lần đọc độc lập mới)
+                        voted = track.voted_text()[0] if track is not None else ''
+                        texts_by_frame[i][k] = voted or cached
+                        continue
+                grays.append(gray)
+                owners.append((i, k))
+                crop_hashes.append(crop_hash)
+            self.metrics.observe(req.get('camera_id'), 'crop', time.perf_counter() - stage_start)
+        
+        # MULTI-PASS Recognition với preprocessing cải tiến - Độ chính xác cao!
+        # Cascade rẻ → đắt: dừng ngay khi pass rẻ đã cho kết quả hợp lệ, confidence cao
+        # Crop của tất cả camera đi chung 1 batch ở mỗi pass
+        # Quá tải → quality tier bỏ bớt pass đắt
+        def pass_timer(name, indices, seconds):
+            self.metrics.observe_many([requests[owners[j][0]].get('camera_id') for j in indices],
+                                      f'ocr_{name}', seconds)
+        
+        raw_texts = self.cascade.run_many(grays, exclude=tier['exclude_passes'], max_passes=tier['max_passes'],
+                                          pass_timer=pass_timer)
+        for (i, k), text, crop_hash in zip(owners, raw_texts, crop_hashes):
+            if self.ocr_cache.enabled:
+                self.ocr_cache.store(requests[i].get('camera_id'), crop_hash, text)
+            track = frame_tracks[i][k]
+            if track is not None:
+                # Vote ký tự qua các frame của track → text ổn định hơn 1 lần đọc
+                text = self.trackers[requests[i].get('camera_id')].record_read(track, text)
+            texts_by_frame[i][k] = text
+        
+        # Tính FPS (thời gian xử lý cả batch)
+        process_time = time.time() - start_time
+        fps = 1.0 / process_time if process_time > 0 else 0
+        
+        for i, detections in frame_detections.items():
+            req = requests[i]
+            self.last_results[req.get('camera_id')] = (detections, texts_by_frame[i], frame_tracks[i])
+            stage_start = time.perf_counter()
+            outputs[i] = self._build_result(req['frame'], detections, texts_by_frame[i], frame_tracks[i], fps,
+                                            req.get('multi_plate', False), req.get('annotate', True))
+            self.metrics.observe(req.get('camera_id'), 'annotate', time.perf_counter() - stage_start)
+        
+        # Frame tĩnh: vẽ lại kết quả gần nhất của camera lên frame hiện tại
+        for i in static:
+            req = requests[i]
+            last = self.last_results.get(req.get('camera_id'))
+            if last is None:
+                outputs[i] = ((req['frame'] if req.get('annotate', True) else None), None)
+                continue
+            outputs[i] = self._build_result(req['frame'], *last, fps, req.get('multi_plate', False),
+                                            req.get('annotate', True), count_detections=False)
+        
+        # Latency lớn nhất trong batch (kể cả thời gian chờ hàng đợi) → điều chỉnh quality tier
+        if requests:
+            now = time.time()
+            self.quality.record(max(now - (req.get('received_at') or start_time) for req in requests), now)
+        
+        return outputs
+    
+    def _motion_gate(self, camera_id):
+        """Motion gate của camera (None nếu tắt) - độ nhạy / ROI riêng trong motion_gate.cameras"""
+        if not self.motion_config.get('enabled', DEFAULT_MOTION_CONFIG['enabled']):
+            return None
+        
+        gate = self.motion_gates.get(camera_id)
+        if gate is None:
+            config = {k: v for k, v in self.motion_config.items() if k != 'cameras'}
+            config.update((self.motion_config.get('cameras') or {}).get(camera_id) or {})
+            gate = self.motion_gates[camera_id] = MotionGate(config, roi=self.camera_rois.get(camera_id))
+        return gate
+    
+    def _update_tracks(self, camera_id, detections):
+        """Cập nhật tracker của camera → track cho từng detection (None nếu tắt tracking)"""
+        if not self.tracking_config['enabled']:
+            return [None] * len(detections)
+        
+        tracker = self.trackers.get(camera_id)
+        if tracker is None:
+            tracker = self.trackers[camera_id] = PlateTracker(self.validate_plate_format, self.tracking_config)
+        return tracker.update(detections)
+    
+    def _build_result(self, frame, detections, raw_texts, tracks, fps, multi_plate, annotate,
+                      count_detections=True):
+        """Validate/format text + vẽ kết quả 1 frame → (annotated_frame, plate_info)"""
+        # VẼ KẾT QUẢ LÊN FRAME - KHUNG XANH LÁ! (bỏ qua ở chế độ metadata)
+        annotated = frame.copy() if annotate else None
+        plates = []
+        
+        for detection, plate_text_raw, track in zip(detections, raw_texts, tracks):
+            # Validate và format
+            is_valid, plate_text = self.validate_plate_format(plate_text_raw)
+            plate_text_formatted = self.format_plate_text(plate_text) if is_valid else plate_text_raw
+            
+            if annotate:
+                self._draw_plate(annotated, detection, plate_text_formatted if is_valid else None)
+            
+            x1, y1, x2, y2 = detection['bbox']
+            plates.append({
+                'text': plate_text_formatted if is_valid else plate_text_raw,
+                'confidence': float(detection['confidence']),
+                'is_valid': is_valid,
+                'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                'points': detection['points'].tolist(),
+                'track_id': track.track_id if track is not None else None,
+                'track_locked': track is not None and track.locked
+            })
+            
+            if is_valid and count_detections:
+                self.total_detections += 1
+        
+        # Vẽ FPS (góc trên bên trái)
+        if annotate:
+            cv2.putText(annotated, f"FPS: {fps:.1f}", (10, 30),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        
+        # Tạo plate_info - field top-level là biển có confidence cao nhất (compatibility view)
+        plate_info = dict(plates[0])
+        plate_info['fps'] = float(fps)
+        plate_info['motion_skipped'] = not count_detections
+        if multi_plate:
+            plate_info['plates'] = plates
+        
+        return annotated, plate_info
+    
+    def _draw_plate(self, annotated, detection, plate_text):
+        """Vẽ 1 biển số lên frame (in-place) - plate_text None nếu chưa đọc được biển hợp lệ"""
+        points = detection['points']
+        x1, y1, x2, y2 = detection['bbox']
+        conf = detection['confidence']
+        
+        # Vẽ OBB polygon (XANH LÁ - BGR: 0,255,0)
+        cv2.polylines(annotated, [points], True, (0, 255, 0), 3)
+        
+        # Vẽ rectangle
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        
+        # Tạo label
+        if plate_text:
+            label = f"{plate_text}"
+            conf_label = f"Conf: {conf*100:.1f}%"
+        else:
+            label = "License Plate"
+            conf_label = f"Conf: {conf*100:.1f}%"
+        
+        # Đo kích thước text
+        (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+        (conf_w, conf_h), _ = cv2.getTextSize(conf_label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+        
+        # Vẽ background xanh lá
+        box_height = label_h + conf_h + 20
+        box_width = max(label_w, conf_w) + 20
+        cv2.rectangle(annotated, (x1, y1 - box_height - 5), 
+                     (x1 + box_width, y1), (0, 255, 0), -1)
+        
+        # Vẽ text biển số (ĐEN ĐẬM)
+        cv2.putText(annotated, label, (x1 + 10, y1 - conf_h - 15),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
+        
+        # Vẽ confidence
+        cv2.putText(annotated, conf_label, (x1 + 10, y1 - 5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+    
+    def get_metrics(self):
+        """Snapshot histogram latency từng stage (StageMetrics.snapshot)"""
+        return self.metrics.snapshot()
+    
+    def get_stats(self):
+        """
+        Lấy stats - có thể gọi từ thread khác (HTTP /health, /metrics) trong lúc worker đang xử lý:
+        dict theo camera được copy (list(...items())) trước khi duyệt
+        """
+        runtime = time.time() - self.start_time
+        avg_fps = self.total_frames / runtime if runtime > 0 else 0
+        trackers = list(self.trackers.items())
+        camera_rois = list(self.camera_rois.items())
+        
+        return {
+            'total_frames': self.total_frames,
+            'total_detections': self.total_detections,
+            'runtime_seconds': int(runtime),
+            'avg_fps': round(avg_fps, 2),
+            'backend': {'detector': self.backend, 'recognizer': self.recognizer.backend},
+            'precision': {'detector': self.precision, 'recognizer': self.recognizer.precision},
+            'ocr_cascade': self.cascade.get_stats(),
+            'ocr_cache': self.ocr_cache.get_stats(),
+            'camera_rois': {camera_id: {'tiled': roi.tiled} for camera_id, roi in camera_rois},
+            'tracking': {
+                'enabled': self.tracking_config['enabled'],
+                'ocr_skipped': self.ocr_skipped,
+                'cameras': {camera_id: tracker.get_stats() for camera_id, tracker in trackers}
+            },
+            'motion_gate': self._motion_stats(),
+            'quality': self.quality.get_stats()
+        }
+    
+    def _motion_stats(self):
+        """Tỉ lệ frame bỏ qua inference nhờ motion gate"""
+        gates = list(self.motion_gates.items())
+        checked = sum(g.frames_checked for _, g in gates)
+        skipped = sum(g.frames_skipped for _, g in gates)
+        return {
+            'enabled': self.motion_config.get('enabled', DEFAULT_MOTION_CONFIG['enabled']),
+            'frames_checked': checked,
+            'inference_skipped': skipped,
+            'skip_ratio': round(skipped / checked, 4) if checked > 0 else 0.0,
+            'cameras': {camera_id: gate.get_stats() for camera_id, gate in gates}
+        }
+
+
+def encode_annotated(annotated, metrics=None, camera_id=None):
+    """Encode annotated frame → JPEG bytes (None ở chế độ metadata), ghi stage 'encode' nếu có metrics"""
+    if annotated is None:
+        return None
+    start = time.perf_counter()
+    _, buffer = cv2.imencode('.jpg', annotated, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if metrics is not None:
+        metrics.observe(camera_id, 'encode', time.perf_counter() - start)
+    return buffer.tobytes()
@@ -0,0 +1,115 @@
+"""
+Plate Post-processing Module
+Chuyển kết quả YOLO OBB thành danh sách biển số (points, bbox, confidence)
+Dùng chung cho LicensePlateDetector và PersistentDetector
+"""
+
+import cv2
+import numpy as np
+
+
+def downscale_for_detection(frame, max_side=None):
+    """
+    Thu nhỏ frame để detector chạy ở độ phân giải thấp hơn (crop vẫn lấy từ frame gốc)
+
+    Returns:
+        (small_frame, scale) - scale = kích thước mới / kích thước gốc (1.0 nếu không đổi)
+    """
+    if not max_side:
+        return frame, 1.0
+
+    h, w = frame.shape[:2]
+    longest = max(h, w)
+    if longest <= max_side:
+        return frame, 1.0
+
+    scale = max_side / longest
+    small = cv2.resize(frame, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def detect_plates(model, frame, conf, imgsz=None, max_side=None):
+    """
+    Chạy plate detector ở độ phân giải giảm + imgsz chữ nhật (h, w),
+    map OBB về toạ độ frame gốc
+
+    Returns:
+        list detections (xem extract_obb_detections)
+    """
+    return detect_plates_batch(model, [frame], conf, imgsz=imgsz, max_side=max_side)[0]
+
+
+def detect_plates_batch(model, frames, conf, imgsz=None, max_side=None):
+    """
+    Như detect_plates nhưng cho nhiều frame (nhiều camera) trong 1 lần forward của detector
+
+    Returns:
+        list (cùng thứ tự frames) các list detections
+    """
+    if not frames:
+        return []
+
+    downscaled = [downscale_for_detection(frame, max_side) for frame in frames]
+
+    kwargs = {'conf': conf, 'verbose': False}
+    if imgsz:
+        kwargs['imgsz'] = list(imgsz)
+    smalls = [small for small, _ in downscaled]
+    results = model(smalls if len(smalls) > 1 else smalls[0], **kwargs)
+
+    if not results:
+        return [[] for _ in frames]
+    return [
+        extract_obb_detections(result, frame.shape, scale)
+        for result, frame, (_, scale) in zip(results, frames, downscaled)
+    ]
+
+
+def extract_obb_detections(result, frame_shape, scale=1.0):
+    """
+    Lấy tất cả OBB detections, sắp xếp confidence giảm dần.
+    Tensor được copy sang numpy 1 lần cho tất cả box, bbox/clip tính bằng array.
+
+    Args:
+        result: ultralytics Results (có result.obb)
+        frame_shape: shape của frame gốc (để clip bbox)
+        scale: tỉ lệ ảnh đưa vào detector so với frame gốc (toạ độ được chia lại cho scale)
+
+    Returns:
+        list of dict: {'bbox': (x1, y1, x2, y2), 'points': np.ndarray (4, 2) int, 'confidence': float}
+    """
+    obb = result.obb
+    if obb is None or len(obb) == 0:
+        return []
+
+    h, w = frame_shape[:2]
+
+    # (N, 4, 2) tọa độ 4 điểm + (N,) confidence
+    points = obb.xyxyxyxy.cpu().numpy()
+    if scale != 1.0:
+        points = points / scale
+    points = points.astype(int)
+    confs = obb.conf.cpu().numpy() if obb.conf is not None else np.zeros(len(points))
+
+    # Bounding box + đảm bảo trong giới hạn
+    mins = points.min(axis=1)
+    maxs = points.max(axis=1)
+    x1 = np.maximum(mins[:, 0], 0)
+    y1 = np.maximum(mins[:, 1], 0)
+    x2 = np.minimum(maxs[:, 0], w)
+    y2 = np.minimum(maxs[:, 1], h)
+
+    order = np.argsort(-confs, kind='stable')
+    return [
+        {
+            'bbox': (int(x1[i]), int(y1[i]), int(x2[i]), int(y2[i])),
+            'points': points[i],
+            'confidence': float(confs[i])
+        }
+        for i in order
+    ]
+
+
+def is_valid_bbox(bbox):
+    x1, y1, x2, y2 = bbox
+    return x2 > x1 and y2 > y1
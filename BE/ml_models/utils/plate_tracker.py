@@ -0,0 +1,266 @@
+"""
+Plate Tracker Module
+Tracker IoU/centroid cho từng camera: gán track ID cho biển số qua các frame liên tiếp,
+cộng dồn vote từng ký tự của các lần OCR → khi track đã có kết quả hợp lệ ổn định thì khoá lại,
+các frame sau chỉ chạy detector, không OCR lại biển đó
+
+Khoá không vĩnh viễn (kết quả khoá dùng để mở barrier - không được "truyền" sang xe kế tiếp):
+- Hết hạn sau lock_ttl_s giây kể từ lần đọc xác nhận gần nhất
+- Track khoá được OCR lại mỗi reverify_every frame, hoặc ngay khi pHash crop đổi khác hẳn
+  (crop đổi → mở khoá + bỏ vote cũ); lần đọc lại hợp lệ nhưng khác text khoá → mở khoá
+- Track khoá chỉ được gán lại bằng IoU, không dùng centroid fallback
+"""
+
+import time
+from collections import Counter
+
+import numpy as np
+
+
+# Cấu hình mặc định - có thể override trong plate_detector/config.json (key "tracking")
+DEFAULT_TRACKING_CONFIG = {
+    'enabled': True,
+    # IoU tối thiểu để detection được gán vào track cũ
+    'iou_threshold': 0.3,
+    # Nếu IoU thấp (xe chạy nhanh): tâm lệch < tỉ lệ này × đường chéo box vẫn coi là cùng track
+    # (chỉ áp dụng cho track chưa khoá)
+    'centroid_ratio': 0.5,
+    # Số frame liên tiếp không thấy biển trước khi xoá track
+    'max_missed_frames': 15,
+    # Số lần đọc đồng thuận tối thiểu để khoá track
+    'lock_votes': 3,
+    # Tỉ lệ vote tối thiểu của ký tự yếu nhất (trong các lần đọc cùng độ dài)
+    'lock_agreement': 0.6,
+    # Khoá hết hạn sau số giây này kể từ lần đọc xác nhận gần nhất
+    'lock_ttl_s': 5.0,
+    # Track đã khoá vẫn OCR lại mỗi N frame để xác nhận (0 = tắt)
+    'reverify_every': 10,
+    # pHash crop lệch quá số bit này so với frame trước → crop khác hẳn, mở khoá (None = tắt)
+    'reverify_hash_distance': 32,
+}
+
+
+class PlateTrack:
+    """1 biển số được theo dõi qua nhiều frame"""
+
+    def __init__(self, track_id, detection):
+        self.track_id = track_id
+        self.bbox = detection['bbox']
+        self.hits = 1
+        self.missed = 0
+        self.reads = 0
+        self.locked_text = None
+        self.locked_at = None
+        # Số frame kể từ lần OCR gần nhất + pHash crop của frame gần nhất
+        self.frames_since_read = 0
+        self.last_hash = None
+        # Vote theo độ dài text → list Counter cho từng vị trí ký tự
+        self._votes = {}
+
+    @property
+    def locked(self):
+        return self.locked_text is not None
+
+    def update(self, detection):
+        self.bbox = detection['bbox']
+        self.hits += 1
+        self.missed = 0
+        self.frames_since_read += 1
+
+    def lock(self, text, now):
+        self.locked_text = text
+        self.locked_at = now
+
+    def unlock(self):
+        """Mở khoá + bỏ toàn bộ vote cũ (kết quả phải đồng thuận lại từ đầu)"""
+        self.locked_text = None
+        self.locked_at = None
+        self.reads = 0
+        self._votes = {}
+
+    def add_read(self, text):
+        """Cộng vote từng ký tự của 1 lần OCR"""
+        self.frames_since_read = 0
+        if not text:
+            return
+        self.reads += 1
+        counters = self._votes.setdefault(len(text), [Counter() for _ in text])
+        for counter, char in zip(counters, text):
+            counter[char] += 1
+
+    def voted_text(self):
+        """
+        Kết quả vote: chọn độ dài được đọc nhiều nhất, mỗi vị trí lấy ký tự nhiều vote nhất
+
+        Returns:
+            (text, support, agreement) - support: số lần đọc độ dài đó,
+            agreement: tỉ lệ vote của ký tự yếu nhất ('' , 0, 0.0 nếu chưa có lần đọc nào)
+        """
+        if not self._votes:
+            return '', 0, 0.0
+
+        counters = max(self._votes.values(), key=lambda c: (sum(c[0].values()), len(c)))
+        support = sum(counters[0].values())
+        chars, agreement = [], 1.0
+        for counter in counters:
+            char, count = counter.most_common(1)[0]
+            chars.append(char)
+            agreement = min(agreement, count / support)
+        return ''.join(chars), support, agreement
+
+
+class PlateTracker:
+    """
+    Tracker của 1 camera
+
+    - update(detections): gán mỗi detection (confidence giảm dần) vào track có IoU cao nhất,
+      hoặc tâm gần nhất nếu IoU thấp (chỉ track chưa khoá); detection không khớp tạo track mới.
+      Khoá quá lock_ttl_s bị mở
+    - needs_ocr(track, crop_hash): track chưa khoá, tới lượt xác nhận lại hoặc crop đổi → True
+    - record_read(track, text): cộng vote, khoá track khi text vote hợp lệ + đủ đồng thuận
+    """
+
+    def __init__(self, validate_fn, config=None):
+        self.validate_fn = validate_fn
+
+        self.config = dict(DEFAULT_TRACKING_CONFIG)
+        if config:
+            self.config.update(config)
+
+        self.tracks = []
+        self._next_id = 1
+
+        # Stats
+        self.locks_expired = 0
+        self.locks_broken = 0  # Mở khoá do crop đổi / đọc lại ra biển khác
+
+    def update(self, detections, now=None):
+        """
+        Returns:
+            list PlateTrack cùng thứ tự detections
+        """
+        now = now if now is not None else time.time()
+        for track in self.tracks:
+            track.missed += 1
+            if track.locked and now - track.locked_at > self.config['lock_ttl_s']:
+                track.unlock()
+                self.locks_expired += 1
+
+        assigned = [None] * len(detections)
+        free = list(self.tracks)
+
+        if free and detections:
+            det_boxes = np.array([d['bbox'] for d in detections], dtype=np.float32)
+            track_boxes = np.array([t.bbox for t in free], dtype=np.float32)
+            iou = _iou_matrix(det_boxes, track_boxes)
+
+            det_centers = (det_boxes[:, :2] + det_boxes[:, 2:]) / 2
+            track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+            track_diag = np.hypot(track_boxes[:, 2] - track_boxes[:, 0], track_boxes[:, 3] - track_boxes[:, 1])
+            dist = np.linalg.norm(det_centers[:, None, :] - track_centers[None, :, :], axis=2)
+            unlocked = np.array([not t.locked for t in free], dtype=bool)
+            near = (dist < self.config['centroid_ratio'] * track_diag[None, :]) & unlocked[None, :]
+
+            taken = np.zeros(len(free), dtype=bool)
+            for i in range(len(detections)):
+                scores = np.where(taken, -1.0, iou[i])
+                j = int(np.argmax(scores))
+                if scores[j] >= self.config['iou_threshold']:
+                    assigned[i] = free[j]
+                    taken[j] = True
+                    continue
+
+                # IoU thấp → thử track chưa khoá gần tâm nhất
+                candidates = np.where(~taken & near[i])[0]
+                if len(candidates) > 0:
+                    j = int(candidates[np.argmin(dist[i, candidates])])
+                    assigned[i] = free[j]
+                    taken[j] = True
+
+        for i, detection in enumerate(detections):
+            if assigned[i] is None:
+                assigned[i] = PlateTrack(self._next_id, detection)
+                self._next_id += 1
+                self.tracks.append(assigned[i])
+            else:
+                assigned[i].update(detection)
+
+        self.tracks = [t for t in self.tracks if t.missed <= self.config['max_missed_frames']]
+        return assigned
+
+    def needs_ocr(self, track, crop_hash=None):
+        """
+        Track có cần OCR ở frame này không (gọi 1 lần / frame cho mỗi track)
+
+        Args:
+            crop_hash: pHash crop biển số của frame này (None → bỏ qua kiểm tra đổi crop)
+        """
+        previous_hash = track.last_hash
+        if crop_hash is not None:
+            track.last_hash = crop_hash
+        if not track.locked:
+            return True
+
+        max_distance = self.config['reverify_hash_distance']
+        if (max_distance is not None and crop_hash is not None and previous_hash is not None
+                and bin(crop_hash ^ previous_hash).count('1') > max_distance):
+            # Crop khác hẳn frame trước (xe khác vào đúng chỗ) → đọc lại từ đầu
+            track.unlock()
+            self.locks_broken += 1
+            return True
+
+        reverify_every = self.config['reverify_every']
+        return bool(reverify_every) and track.frames_since_read >= reverify_every
+
+    def record_read(self, track, text, now=None):
+        """
+        Cộng 1 lần OCR vào track (track đã khoá: lần đọc xác nhận lại)
+
+        Returns:
+            str: text theo vote hiện tại của track (text khoá nếu track vẫn khoá)
+        """
+        now = now if now is not None else time.time()
+        is_valid, cleaned = self.validate_fn(text) if text else (False, '')
+
+        if track.locked:
+            if not is_valid:
+                # Lần xác nhận không đọc được → giữ khoá (không gia hạn), đợi lần sau
+                track.frames_since_read = 0
+                return track.locked_text
+            if cleaned == track.locked_text:
+                track.add_read(cleaned)
+                track.locked_at = now
+                return track.locked_text
+            # Đọc ra biển khác → kết quả khoá không còn đúng
+            track.unlock()
+            self.locks_broken += 1
+
+        track.add_read(cleaned)
+
+        voted, support, agreement = track.voted_text()
+        is_valid, _ = self.validate_fn(voted) if voted else (False, '')
+        if (is_valid and support >= self.config['lock_votes']
+                and agreement >= self.config['lock_agreement']):
+            track.lock(voted, now)
+        return voted
+
+    def get_stats(self):
+        return {
+            'active_tracks': len(self.tracks),
+            'locked_tracks': sum(1 for t in self.tracks if t.locked),
+            'locks_expired': self.locks_expired,
+            'locks_broken': self.locks_broken
+        }
+
+
+def _iou_matrix(a, b):
+    """IoU giữa từng box của a (N, 4) và b (M, 4) → (N, M)"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
@@ -0,0 +1,112 @@
+"""
+Profiler Module
+Profile process đang chạy theo yêu cầu (endpoint admin của websocket_detector), không cần restart:
+- SamplingProfiler: thread lấy mẫu stack của tất cả thread (sys._current_frames) mỗi interval,
+  kết quả dạng collapsed stack (flamegraph.pl / speedscope / inferno đọc trực tiếp)
+  Chỉ tồn tại trong thời gian profile → không tốn gì khi không bật
+- torch_op_profile: torch.profiler bao quanh 1 lần gọi (1 batch detector + recognizer forward)
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler wall-clock cho process hiện tại
+
+    Thread đang chờ (Condition.wait, socket recv...) cũng được đếm - xem được cả thời gian chờ
+    lẫn thời gian tính toán của handler Socket.IO / detection worker
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+
+    def run(self, seconds):
+        """
+        Lấy mẫu trong `seconds` giây (blocking - gọi từ thread riêng / request handler)
+
+        Returns:
+            Counter {(thread_name, frame_1, ..., frame_n): số mẫu} - frame từ ngoài vào trong
+        """
+        counts = Counter()
+        own_ident = threading.get_ident()
+        thread_names = {}
+        names_refreshed = 0.0
+        end = time.perf_counter() + seconds
+
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            # Tên thread đổi rất ít → làm mới mỗi giây
+            if now - names_refreshed > 1.0:
+                thread_names = {t.ident: t.name for t in threading.enumerate()}
+                names_refreshed = now
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(thread_names.get(ident, f'thread-{ident}'))
+                counts[tuple(reversed(stack))] += 1
+
+            self.samples += 1
+            time.sleep(self.interval)
+
+        return counts
+
+
+def collapse_stacks(counts, prefix=None):
+    """
+    Counter stack → collapsed stack format: 'frame;frame;...;frame count' mỗi dòng
+
+    Args:
+        prefix: frame gốc thêm vào đầu mỗi stack (VD tên process / worker khi gộp nhiều process)
+    """
+    lines = []
+    for stack, count in counts.most_common():
+        frames = [prefix] + list(stack) if prefix else list(stack)
+        lines.append(';'.join(f.replace(';', ':') for f in frames) + f' {count}')
+    return '\n'.join(lines) + ('\n' if lines else '')
+
+
+def profile_for(seconds, interval=0.005, prefix=None):
+    """Sampling profile `seconds` giây → collapsed stack text"""
+    return collapse_stacks(SamplingProfiler(interval).run(seconds), prefix)
+
+
+def torch_op_profile(fn, row_limit=40):
+    """
+    Chạy fn() dưới torch.profiler (CPU + CUDA nếu có)
+
+    Returns:
+        (kết quả fn(), bảng op tổng hợp dạng text)
+
+    Raises:
+        RuntimeError: không có torch (backend onnx / openvino không cần torch)
+    """
+    try:
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+    except ImportError:
+        raise RuntimeError('torch is not installed - op-level profile unavailable')
+
+    activities = [ProfilerActivity.CPU]
+    use_cuda = torch.cuda.is_available()
+    if use_cuda:
+        activities.append(ProfilerActivity.CUDA)
+
+    with profile(activities=activities, record_shapes=True) as prof:
+        result = fn()
+
+    sort_by = 'self_cuda_time_total' if use_cuda else 'self_cpu_time_total'
+    return result, prof.key_averages().table(sort_by=sort_by, row_limit=row_limit)
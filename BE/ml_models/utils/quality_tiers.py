@@ -0,0 +1,135 @@
+"""
+Quality Tiers Module
+Giảm chất lượng từng bậc khi server quá tải thay vì để latency tăng dần:
+    0 full            - tất cả pass OCR, detector độ phân giải đầy đủ
+    1 no_nlm          - bỏ pass NLM denoise ('adaptive', đắt nhất)
+    2 single_pass     - chỉ 1 pass OCR
+    3 low_res         - thêm: detector chạy độ phân giải thấp hơn
+Tự quay lại chất lượng đầy đủ khi tải giảm (có hysteresis + thời gian giữ tối thiểu mỗi bậc)
+
+Kèm DeadlineTracker: frame đã quá deadline (theo timestamp client) bị bỏ trước khi xử lý
+"""
+
+import time
+
+
+QUALITY_TIERS = [
+    {'name': 'full', 'exclude_passes': (), 'max_passes': None, 'low_res_detector': False},
+    {'name': 'no_nlm', 'exclude_passes': ('adaptive',), 'max_passes': None, 'low_res_detector': False},
+    {'name': 'single_pass', 'exclude_passes': ('adaptive',), 'max_passes': 1, 'low_res_detector': False},
+    {'name': 'low_res', 'exclude_passes': ('adaptive',), 'max_passes': 1, 'low_res_detector': True},
+]
+
+# Cấu hình mặc định - có thể override trong plate_detector/config.json (key "quality")
+DEFAULT_QUALITY_CONFIG = {
+    'enabled': True,
+    # Latency (nhận frame → xong xử lý, làm mượt) vượt ngưỡng này → giảm 1 bậc
+    'degrade_latency_ms': 400,
+    # Latency dưới ngưỡng này → tăng lại 1 bậc
+    'recover_latency_ms': 150,
+    # Thời gian tối thiểu giữ 1 bậc trước khi đổi tiếp
+    'min_dwell_s': 3.0,
+    'smoothing': 0.2,
+    # Tỉ lệ độ phân giải detector ở bậc low_res
+    'low_res_scale': 0.75,
+    # Frame cũ hơn deadline (so với timestamp client) bị bỏ, 0 = tắt
+    'deadline_ms': 1000,
+}
+
+
+class QualityController:
+    """Chọn quality tier theo latency đo được"""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_QUALITY_CONFIG)
+        if config:
+            self.config.update(config)
+
+        self.tier = 0
+        self.latency = 0.0
+        self.tier_changes = 0
+        self._last_change = 0.0
+
+    @property
+    def current(self):
+        return QUALITY_TIERS[self.tier]
+
+    def record(self, latency, now=None):
+        """Cập nhật latency (giây) của 1 batch và đổi tier nếu cần"""
+        if not self.config['enabled']:
+            return
+
+        alpha = self.config['smoothing']
+        self.latency = latency if self.latency == 0 else self.latency * (1 - alpha) + latency * alpha
+
+        now = now if now is not None else time.time()
+        if now - self._last_change < self.config['min_dwell_s']:
+            return
+
+        latency_ms = self.latency * 1000
+        if latency_ms > self.config['degrade_latency_ms'] and self.tier < len(QUALITY_TIERS) - 1:
+            self._set_tier(self.tier + 1, now)
+        elif latency_ms < self.config['recover_latency_ms'] and self.tier > 0:
+            self._set_tier(self.tier - 1, now)
+
+    def _set_tier(self, tier, now):
+        print(f"[Quality] Tier {QUALITY_TIERS[self.tier]['name']} → {QUALITY_TIERS[tier]['name']} "
+              f"(latency {self.latency * 1000:.0f}ms)")
+        self.tier = tier
+        self.tier_changes += 1
+        self._last_change = now
+
+    def detector_resolution(self, imgsz, max_side):
+        """(imgsz, max_side) cho detector theo tier hiện tại - low_res thu nhỏ, làm tròn bội số 32"""
+        if not self.current['low_res_detector']:
+            return imgsz, max_side
+
+        scale = self.config['low_res_scale']
+        if imgsz:
+            imgsz = [max(32, int(round(side * scale / 32)) * 32) for side in imgsz]
+        if max_side:
+            max_side = int(max_side * scale)
+        return imgsz, max_side
+
+    def get_stats(self):
+        return {
+            'enabled': self.config['enabled'],
+            'tier': self.tier,
+            'tier_name': self.current['name'],
+            'tier_changes': self.tier_changes,
+            'latency_ms': round(self.latency * 1000, 1)
+        }
+
+
+class DeadlineTracker:
+    """
+    Kiểm tra deadline theo timestamp client của 1 camera
+
+    Đồng hồ client có thể lệch server → ước lượng offset = min(server_nhận - timestamp)
+    (frame nhanh nhất coi như độ trễ 0), tuổi frame = now - timestamp - offset
+    """
+
+    def __init__(self, deadline_ms):
+        self.deadline = deadline_ms / 1000.0
+        self.offset = None
+        self.misses = 0
+
+    def observe(self, client_timestamp_ms, received_at):
+        """Gọi khi nhận frame - cập nhật offset đồng hồ client/server"""
+        if not isinstance(client_timestamp_ms, (int, float)) or not client_timestamp_ms:
+            return
+        offset = received_at - client_timestamp_ms / 1000.0
+        if self.offset is None or offset < self.offset:
+            self.offset = offset
+
+    def expired(self, client_timestamp_ms, now=None):
+        """True nếu frame đã quá deadline (đếm vào misses)"""
+        if self.deadline <= 0 or self.offset is None or not isinstance(client_timestamp_ms, (int, float)):
+            return False
+
+        now = now if now is not None else time.time()
+        age = now - client_timestamp_ms / 1000.0 - self.offset
+        if age > self.deadline:
+            self.misses += 1
+            return True
+        return False
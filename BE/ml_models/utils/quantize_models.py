@@ -0,0 +1,304 @@
+"""
+Post-training INT8 quantization cho plate detector + character recognizer
+và harness so sánh FP32 vs INT8 (độ chính xác + latency) trên cùng bộ ảnh
+
+Usage:
+    python quantize_models.py --backend onnx --calib-dir ./calib_frames
+    python quantize_models.py --backend openvino --calib-dir ./calib_frames \\
+        --eval-dir ./eval_frames --ground-truth ./eval_frames/labels.csv --report int8_report.json
+    python quantize_models.py --backend onnx --skip-quantize --eval-dir ./eval_frames   (chỉ chạy harness)
+
+Ground truth CSV: 2 cột `filename,plate` (VD: frame_001.jpg,29T1-82843)
+Sau khi quantize, đặt "precision": "quantized" trong config.json để detector dùng model INT8.
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.model_backend import exported_path, export_yolo, load_yolo
+from utils.export_models import (DETECTOR_PATH, RECOGNIZER_DIR, RECOGNIZER_PATH, list_images, parse_imgsz,
+                                 resolve_imgsz)
+from character_recognition.plate_preprocessing import prepare_gray, preprocess_variants
+
+try:
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    ORT_QUANT_AVAILABLE = True
+except ImportError:
+    CalibrationDataReader = object
+    ORT_QUANT_AVAILABLE = False
+
+
+def letterbox(image, imgsz):
+    """
+    Resize giữ tỉ lệ + pad về imgsz (int hoặc [h, w]),
+    trả tensor NCHW float32 (RGB, 0-1) như ultralytics
+    """
+    target_h, target_w = (imgsz, imgsz) if isinstance(imgsz, int) else imgsz
+    h, w = image.shape[:2]
+    scale = min(target_h / h, target_w / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    canvas = np.full((target_h, target_w, 3), 114, dtype=np.uint8)
+    top, left = (target_h - new_h) // 2, (target_w - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+
+    tensor = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)
+    return np.ascontiguousarray(tensor[None], dtype=np.float32) / 255.0
+
+
+class ImageFolderCalibrationReader(CalibrationDataReader):
+    """Đọc ảnh calibration từ thư mục cho onnxruntime quantize_static"""
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.index = 0
+
+    def get_next(self):
+        while self.index < len(self.image_paths):
+            image = cv2.imread(self.image_paths[self.index])
+            self.index += 1
+            if image is not None:
+                return {self.input_name: letterbox(image, self.imgsz)}
+        return None
+
+
+def extract_plate_crops(image_paths, output_dir, conf=0.25):
+    """
+    Tạo ảnh calibration cho recognizer: crop biển số bằng detector FP32
+    rồi lưu các biến thể tiền xử lý (đúng phân phối recognizer nhìn thấy lúc chạy)
+    """
+    detector, _, _ = load_yolo(DETECTOR_PATH, backend='pytorch', task='obb')
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        results = detector(image, conf=conf, verbose=False)
+        if not results or results[0].obb is None:
+            continue
+
+        h, w = image.shape[:2]
+        for i, points in enumerate(results[0].obb.xyxyxyxy.cpu().numpy()):
+            x1, y1 = np.maximum(points.min(axis=0).astype(int), 0)
+            x2, y2 = points.max(axis=0).astype(int)
+            crop = image[y1:min(h, y2), x1:min(w, x2)]
+            if crop.size == 0:
+                continue
+            gray = prepare_gray(crop)
+            for name, variant in preprocess_variants(gray):
+                if variant is None:
+                    continue
+                out = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(path))[0]}_{i}_{name}.png")
+                cv2.imwrite(out, variant)
+                count += 1
+
+    return count
+
+
+def quantize_onnx(pt_path, calib_paths, imgsz):
+    """Static INT8 quantization (QDQ, per-channel) cho model ONNX, chỉ quantize Conv của backbone/neck"""
+    if not ORT_QUANT_AVAILABLE:
+        raise RuntimeError("onnxruntime not available. Please install: onnx, onnxruntime")
+
+    fp32_path = exported_path(pt_path, 'onnx')
+    if not os.path.exists(fp32_path):
+        export_yolo(pt_path, 'onnx', imgsz=imgsz)
+
+    int8_path = exported_path(pt_path, 'onnx', 'quantized')
+    input_name = ort.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    reader = ImageFolderCalibrationReader(calib_paths, input_name, imgsz)
+
+    # Conv của head (box / angle / class) giữ FP32 để không mất độ chính xác toạ độ
+    head_nodes = head_conv_nodes(onnx.load(fp32_path).graph.node)
+    print(f"      Keeping {len(head_nodes)} head Conv node(s) in FP32")
+    quantize_static(fp32_path, int8_path, reader,
+                    quant_format=QuantFormat.QDQ,
+                    per_channel=True,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    op_types_to_quantize=['Conv'],
+                    nodes_to_exclude=head_nodes)
+    return int8_path
+
+
+def head_conv_nodes(nodes):
+    """
+    Tên các node Conv thuộc head của model YOLO export bởi ultralytics
+    (node đặt tên theo module '/model.<i>/...', head là module cuối cùng)
+    """
+    indices = [int(match.group(1)) for match in (re.match(r'/model\.(\d+)/', node.name) for node in nodes) if match]
+    if not indices:
+        return []
+    prefix = f'/model.{max(indices)}/'
+    return [node.name for node in nodes if node.op_type == 'Conv' and node.name.startswith(prefix)]
+
+
+def quantize_openvino(pt_path, calib_dir, imgsz):
+    """INT8 quantization bằng NNCF qua ultralytics export (int8=True), calibrate trên thư mục ảnh"""
+    from ultralytics import YOLO
+
+    model = YOLO(pt_path)
+    data_yaml = os.path.join(tempfile.mkdtemp(prefix='calib_'), 'calib.yaml')
+    with open(data_yaml, 'w', encoding='utf-8') as f:
+        f.write(f"path: {os.path.abspath(calib_dir)}\ntrain: .\nval: .\n")
+        f.write(f"names: {json.dumps({int(k): v for k, v in model.names.items()})}\n")
+
+    return model.export(format='openvino', imgsz=imgsz, int8=True, dynamic=True, data=data_yaml)
+
+
+def quantize(backend, pt_path, calib_dir, imgsz):
+    calib_paths = list_images(calib_dir)
+    if not calib_paths:
+        raise ValueError(f"No calibration images found in {calib_dir}")
+    print(f"      Calibrating on {len(calib_paths)} images from {calib_dir}")
+
+    if backend == 'onnx':
+        return quantize_onnx(pt_path, calib_paths, imgsz)
+    return quantize_openvino(pt_path, calib_dir, imgsz)
+
+
+def normalize_plate(text):
+    return (text or '').upper().replace('-', '').replace('.', '').replace(' ', '')
+
+
+def load_ground_truth(csv_path):
+    """Đọc CSV `filename,plate` → {filename: plate đã chuẩn hoá}"""
+    ground_truth = {}
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            ground_truth[os.path.basename(row['filename'])] = normalize_plate(row['plate'])
+    return ground_truth
+
+
+def evaluate(backend, image_paths, ground_truth=None, warmup=3):
+    """
+    Chạy pipeline đầy đủ (LicensePlateDetector.detect_and_recognize) ở FP32 và INT8
+
+    Returns:
+        dict: {'fp32': {...}, 'quantized': {...}}
+    """
+    from utils.inference import LicensePlateDetector
+
+    images = [(os.path.basename(p), cv2.imread(p)) for p in image_paths]
+    images = [(name, img) for name, img in images if img is not None]
+    if not images:
+        raise ValueError("No readable evaluation images")
+
+    report = {}
+    reads = {}
+    for precision in ('fp32', 'quantized'):
+        detector = LicensePlateDetector(backend=backend, precision=precision)
+
+        for _ in range(warmup):
+            detector.detect_and_recognize(images[0][1], conf_threshold=0.25)
+
+        latencies = []
+        reads[precision] = {}
+        for name, image in images:
+            start = time.perf_counter()
+            result = detector.detect_and_recognize(image, conf_threshold=0.25)
+            latencies.append((time.perf_counter() - start) * 1000)
+            reads[precision][name] = normalize_plate(result.get('plate_number'))
+
+        entry = {
+            'detector': f"{detector.backend}/{detector.precision}",
+            'recognizer': f"{detector.recognizer.backend}/{detector.recognizer.precision}",
+            'images': len(images),
+            'latency_ms_p50': round(float(np.percentile(latencies, 50)), 2),
+            'latency_ms_p95': round(float(np.percentile(latencies, 95)), 2),
+            'latency_ms_mean': round(float(np.mean(latencies)), 2),
+        }
+        if ground_truth:
+            labelled = [name for name, _ in images if name in ground_truth]
+            correct = sum(1 for name in labelled if reads[precision][name] == ground_truth[name])
+            entry['labelled_images'] = len(labelled)
+            entry['exact_plate_accuracy'] = round(correct / len(labelled), 4) if labelled else None
+        report[precision] = entry
+
+    # Tỉ lệ INT8 đọc giống FP32 (hữu ích khi không có ground truth)
+    same = sum(1 for name, _ in images if reads['fp32'][name] == reads['quantized'][name])
+    report['quantized']['agreement_with_fp32'] = round(same / len(images), 4)
+    report['speedup_p50'] = round(report['fp32']['latency_ms_p50'] / report['quantized']['latency_ms_p50'], 2) \
+        if report['quantized']['latency_ms_p50'] > 0 else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8 quantization + FP32 vs INT8 regression harness')
+    parser.add_argument('--backend', choices=['onnx', 'openvino'], required=True)
+    parser.add_argument('--calib-dir', help='Thư mục ảnh khung hình (frame) dùng để calibrate')
+    parser.add_argument('--recognizer-calib-dir',
+                        help='Thư mục ảnh crop biển số; mặc định tự crop từ --calib-dir bằng detector FP32')
+    parser.add_argument('--detector-imgsz', type=parse_imgsz,
+                        help='N hoặc H,W - mặc định input_size trong plate_detector/config.json')
+    parser.add_argument('--recognizer-imgsz', type=parse_imgsz,
+                        help='N hoặc H,W - mặc định input_size trong character_recognition/config.json')
+    parser.add_argument('--skip-quantize', action='store_true', help='Chỉ chạy harness')
+    parser.add_argument('--eval-dir', help='Thư mục ảnh đánh giá FP32 vs INT8')
+    parser.add_argument('--ground-truth', help='CSV filename,plate cho --eval-dir')
+    parser.add_argument('--report', help='Ghi kết quả harness ra file JSON')
+    args = parser.parse_args()
+
+    detector_imgsz = resolve_imgsz(args.detector_imgsz, os.path.dirname(DETECTOR_PATH))
+    recognizer_imgsz = resolve_imgsz(args.recognizer_imgsz, RECOGNIZER_DIR)
+
+    if not args.skip_quantize:
+        if not args.calib_dir:
+            parser.error('--calib-dir is required unless --skip-quantize')
+
+        print(f"[1/2] Quantizing plate detector → {args.backend} INT8...")
+        print(f"      {quantize(args.backend, DETECTOR_PATH, args.calib_dir, detector_imgsz)}")
+
+        print(f"[2/2] Quantizing character recognizer → {args.backend} INT8...")
+        crops_dir = args.recognizer_calib_dir
+        temp_dir = None
+        if not crops_dir:
+            temp_dir = crops_dir = tempfile.mkdtemp(prefix='plate_crops_')
+            count = extract_plate_crops(list_images(args.calib_dir), crops_dir)
+            print(f"      Extracted {count} plate crops for calibration")
+        try:
+            print(f"      {quantize(args.backend, RECOGNIZER_PATH, crops_dir, recognizer_imgsz)}")
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if not args.eval_dir:
+        print("No --eval-dir given, skipping FP32 vs INT8 evaluation")
+        return 0
+
+    ground_truth = load_ground_truth(args.ground_truth) if args.ground_truth else None
+    report = evaluate(args.backend, list_images(args.eval_dir), ground_truth)
+
+    print("\n" + "=" * 60)
+    print(f"FP32 vs INT8 ({args.backend})")
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.report}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Rate Controller Module
+Điều khiển tốc độ xử lý theo từng camera dựa trên thời gian chờ (queueing delay) + FPS frame đến:
+- Frame chờ lâu trước khi được xử lý → giảm FPS xử lý mục tiêu (bỏ frame ngay khi nhận, không decode)
+- Thời gian chờ thấp → tăng dần FPS mục tiêu tới max_fps
+Thời gian xử lý 1 frame (service time) không giảm khi gửi chậm lại → không dùng để giảm FPS
+(CPU chậm, 1 lần inference > budget vẫn giữ nguyên FPS nếu không có hàng đợi)
+- Đề xuất client giảm tốc độ gửi khi đang gửi nhiều hơn hẳn mức server xử lý
+"""
+
+import time
+
+
+# Cấu hình mặc định - có thể override trong plate_detector/config.json (key "rate_control")
+DEFAULT_RATE_CONFIG = {
+    'enabled': True,
+    # Thời gian chờ tối đa (nhận frame → bắt đầu xử lý) mong muốn
+    'queue_delay_budget_ms': 100,
+    'min_fps': 1.0,
+    'max_fps': 15.0,
+    # Hệ số giảm khi vượt budget (multiplicative decrease) / bước tăng khi dư budget (additive increase)
+    'decrease_factor': 0.8,
+    'increase_step': 0.5,
+    # Dưới tỉ lệ này của budget mới tăng FPS (tránh dao động)
+    'headroom_ratio': 0.6,
+    # Hệ số làm mượt EMA cho latency / thời gian chờ / FPS đến
+    'smoothing': 0.2,
+    # Gửi rate_advice khi client gửi nhanh hơn target × tỉ lệ này
+    'advise_ratio': 1.5,
+    # Khoảng cách tối thiểu giữa 2 lần gửi rate_advice
+    'advise_interval_s': 2.0,
+}
+
+
+class RateController:
+    """Rate controller của 1 camera"""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_RATE_CONFIG)
+        if config:
+            self.config.update(config)
+
+        self.target_fps = float(self.config['max_fps'])
+        self.incoming_fps = 0.0
+        self.latency = 0.0
+        self.queue_delay = 0.0
+
+        self._last_arrival = None
+        self._last_accepted = None
+        self._last_advice = 0.0
+        self._advised_fps = None
+
+        # Stats
+        self.received = 0
+        self.skipped = 0
+
+    def accept(self, now=None):
+        """
+        Frame mới đến - True nếu nên xử lý, False nếu bỏ (vượt FPS mục tiêu)
+        """
+        now = now if now is not None else time.time()
+        self.received += 1
+
+        if self._last_arrival is not None:
+            interval = now - self._last_arrival
+            if interval > 0:
+                self.incoming_fps = self._smooth(self.incoming_fps, 1.0 / interval)
+        self._last_arrival = now
+
+        if not self.config['enabled']:
+            return True
+
+        # Cho phép sai số 10% để không bỏ frame khi client gửi đúng bằng target
+        if self._last_accepted is not None and now - self._last_accepted < 0.9 / self.target_fps:
+            self.skipped += 1
+            return False
+
+        self._last_accepted = now
+        return True
+
+    def record_latency(self, latency, queue_delay):
+        """
+        1 frame đã xử lý xong → điều chỉnh FPS mục tiêu
+
+        Args:
+            latency: nhận frame → gửi kết quả (giây) - chỉ để thống kê
+            queue_delay: nhận frame → bắt đầu xử lý (giây) - phần giảm được khi gửi chậm lại
+        """
+        self.latency = self._smooth(self.latency, latency)
+        self.queue_delay = self._smooth(self.queue_delay, max(0.0, queue_delay))
+
+        # Không giới hạn theo FPS đến: client đã giảm theo rate_advice vẫn phải được báo tăng lại
+        budget = self.config['queue_delay_budget_ms'] / 1000.0
+        if self.queue_delay > budget:
+            self.target_fps = max(self.config['min_fps'], self.target_fps * self.config['decrease_factor'])
+        elif self.queue_delay < budget * self.config['headroom_ratio']:
+            self.target_fps = min(self.config['max_fps'], self.target_fps + self.config['increase_step'])
+
+    def advice(self, now=None):
+        """
+        FPS gửi đề xuất cho client (None nếu chưa cần gửi / không đổi)
+        """
+        if not self.config['enabled']:
+            return None
+
+        now = now if now is not None else time.time()
+        if now - self._last_advice < self.config['advise_interval_s']:
+            return None
+
+        suggested = round(self.target_fps, 1)
+        sending_too_fast = self.incoming_fps > self.target_fps * self.config['advise_ratio']
+        # Đã đề xuất thấp trước đó mà giờ server dư tải → báo client tăng lại
+        can_speed_up = self._advised_fps is not None and (
+            suggested > self._advised_fps * self.config['advise_ratio']
+            or (suggested >= self.config['max_fps'] and suggested > self._advised_fps))
+        if not (sending_too_fast or can_speed_up) or suggested == self._advised_fps:
+            return None
+
+        self._last_advice = now
+        self._advised_fps = suggested
+        return suggested
+
+    def _smooth(self, current, value):
+        alpha = self.config['smoothing']
+        return value if current == 0 else current * (1 - alpha) + value * alpha
+
+    def get_stats(self):
+        received = self.received
+        return {
+            'incoming_fps': round(self.incoming_fps, 2),
+            'target_fps': round(self.target_fps, 2),
+            'latency_ms': round(self.latency * 1000, 1),
+            'queue_delay_ms': round(self.queue_delay * 1000, 1),
+            'skipped': self.skipped,
+            'skip_ratio': round(self.skipped / received, 4) if received > 0 else 0.0,
+            'advised_fps': self._advised_fps
+        }
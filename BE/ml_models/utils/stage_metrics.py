@@ -0,0 +1,122 @@
+"""
+Stage Metrics Module
+Histogram latency theo từng stage của pipeline (decode, detect, crop, từng pass OCR, annotate, encode...)
+cho từng camera → render dạng Prometheus text format cho endpoint /metrics
+
+Histogram lưu dạng dict thuần (snapshot) để gửi được từ worker process của DetectorPool
+và gộp ở process chính
+"""
+
+import threading
+
+
+# Bucket mặc định (ms) - có thể override trong plate_detector/config.json (key "metrics.latency_buckets_ms")
+DEFAULT_LATENCY_BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+class StageMetrics:
+    """
+    Histogram latency (camera, stage) - thread-safe
+
+    - observe(camera_id, stage, seconds): ghi 1 lần đo
+    - snapshot(): {camera_id: {stage: {'counts': [...], 'sum': float, 'count': int}}}
+      counts không cộng dồn, phần tử cuối là bucket +Inf
+    """
+
+    def __init__(self, buckets_ms=None):
+        self.buckets = [b / 1000.0 for b in sorted(buckets_ms or DEFAULT_LATENCY_BUCKETS_MS)]
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, camera_id, stage, seconds):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+
+        with self._lock:
+            stages = self._histograms.setdefault(camera_id, {})
+            histogram = stages.get(stage)
+            if histogram is None:
+                histogram = stages[stage] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            histogram['counts'][index] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def observe_many(self, camera_ids, stage, seconds):
+        """Stage chạy chung 1 batch cho nhiều camera → mỗi camera ghi cùng 1 thời gian (mỗi camera 1 lần)"""
+        for camera_id in set(camera_ids):
+            self.observe(camera_id, stage, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                camera_id: {
+                    stage: {'counts': list(h['counts']), 'sum': h['sum'], 'count': h['count']}
+                    for stage, h in stages.items()
+                }
+                for camera_id, stages in self._histograms.items()
+            }
+
+    def discard(self, camera_id):
+        with self._lock:
+            self._histograms.pop(camera_id, None)
+
+
+def merge_snapshots(snapshots):
+    """Gộp snapshot của nhiều StageMetrics (cùng bucket) - VD các worker của DetectorPool + process chính"""
+    merged = {}
+    for snapshot in snapshots:
+        for camera_id, stages in (snapshot or {}).items():
+            target = merged.setdefault(camera_id, {})
+            for stage, h in stages.items():
+                if stage not in target:
+                    target[stage] = {'counts': list(h['counts']), 'sum': h['sum'], 'count': h['count']}
+                    continue
+                t = target[stage]
+                t['counts'] = [a + b for a, b in zip(t['counts'], h['counts'])]
+                t['sum'] += h['sum']
+                t['count'] += h['count']
+    return merged
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot, buckets, gauges=None):
+    """
+    Prometheus text format (version 0.0.4)
+
+    Args:
+        snapshot: StageMetrics.snapshot() / merge_snapshots()
+        buckets: bucket (giây) của StageMetrics
+        gauges: list (name, help, type, [(labels_dict, value), ...]) - metric bổ sung (frame, drop, tier...)
+    """
+    name = 'eparking_stage_latency_seconds'
+    lines = [
+        f'# HELP {name} Latency of each pipeline stage per camera.',
+        f'# TYPE {name} histogram',
+    ]
+    bounds = [f'{b:g}' for b in buckets] + ['+Inf']
+
+    for camera_id in sorted(snapshot, key=str):
+        for stage in sorted(snapshot[camera_id]):
+            h = snapshot[camera_id][stage]
+            labels = f'camera="{_escape_label(camera_id)}",stage="{_escape_label(stage)}"'
+            cumulative = 0
+            for bound, count in zip(bounds, h['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {h["sum"]:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {h["count"]}')
+
+    for metric, help_text, metric_type, samples in gauges or []:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        for labels, value in samples:
+            label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            lines.append(f'{metric}{{{label_text}}} {value}' if label_text else f'{metric} {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -11,323 +11,122 @@ Usage:
     python websocket_detector.py
 """
 
-from flask import Flask
+from flask import Flask, Response
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
+import argparse
+import atexit
 import cv2
 import numpy as np
 import base64
-from ultralytics import YOLO
-import re
-import time
 import os
 import sys
+import threading
+import time
+import traceback
+from collections import deque
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from character_recognition.plate_recognizer_inference import PlateRecognizer
+from utils.model_backend import load_model_config
+from utils.camera_roi import CameraROI
+from utils.frame_mailbox import LatestFrameMailbox
+from utils.rate_controller import RateController
+from utils.quality_tiers import DEFAULT_QUALITY_CONFIG, DeadlineTracker
+from utils.stage_metrics import StageMetrics, merge_snapshots, render_prometheus
+from utils.profiler import profile_for, torch_op_profile
+from utils.frame_trace import FrameTraceBuffer, install_dump_signal
+from utils.persistent_detector import PersistentDetector, encode_annotated
+from utils.detector_pool import DEFAULT_SLOT_BYTES, DetectorPool
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', 
                    max_http_buffer_size=10_000_000)  # 10MB buffer
 
-class PersistentDetector:
-    """
-    Detector PERSISTENT - Model load 1 lần duy nhất!
-    Sử dụng YOLO character detector với preprocessing cải tiến cho độ chính xác cao
-    """
-    
-    def __init__(self, model_path='ml_models/plate_detector/best.pt'):
-        print("\n" + "=" * 60)
-        print("🚀 INITIALIZING PERSISTENT DETECTOR")
-        print("=" * 60)
-        
-        # Check model path
-        if not os.path.exists(model_path):
-            print(f"[ERROR] Model not found: {model_path}")
-            raise FileNotFoundError(f"Model not found: {model_path}")
-        
-        # Load YOLO model - 1 LẦN DUY NHẤT!
-        print(f"\n[1/2] 📦 Loading YOLO model from {model_path}...")
-        start_time = time.time()
-        self.model = YOLO(model_path)
-        print(f"[1/2] ✅ YOLO model loaded in {time.time() - start_time:.2f}s")
-        
-        # Load PlateRecognizer (YOLO char detector) - 1 LẦN DUY NHẤT!
-        print(f"\n[2/2] 📖 Initializing PlateRecognizer (YOLO char detector)...")
-        start_time = time.time()
-        self.recognizer = PlateRecognizer()
-        print(f"[2/2] ✅ PlateRecognizer loaded in {time.time() - start_time:.2f}s")
-        
-        print("\n" + "=" * 60)
-        print("🎉 DETECTOR READY FOR REALTIME DETECTION!")
-        print("=" * 60 + "\n")
-        
-        # Stats
-        self.total_frames = 0
-        self.total_detections = 0
-        self.start_time = time.time()
-        
-        # Frame skipping for performance
-        self.frame_skip = 0  # Process every frame (0 = no skip)
-        self.frame_counter = 0
-    
-    def validate_plate_format(self, text):
-        """Kiểm tra format biển số xe máy VN: XXYY-1234(5)
-        XX: 2 số đầu (01-99)
-        YY: 2 ký tự (AA, AB, A1, 1A, B2, etc) - BẮT BUỘC 2 KÝ TỰ
-        1234(5): 4 hoặc 5 số cuối
-        
-        VD hợp lệ: 29T1-82843, 30AB-1234, 51F9-98765
-        VD KHÔNG hợp lệ: 29T-82843 (chỉ có 1 ký tự T)
-        """
-        text = text.upper().replace(' ', '').replace('-', '').replace('.', '')
-        # Pattern CHÍNH XÁC: 2 số + 2 ký tự (chữ hoặc số) + 4-5 số
-        # [A-Z0-9]{2} = chính xác 2 ký tự (có thể là AA, AB, A1, 1A, B2, etc)
-        pattern = r'^(\d{2})([A-Z0-9]{2})(\d{4,5})$'
-        match = re.match(pattern, text)
-        return match is not None, text
-    
-    def format_plate_text(self, text):
-        """Format biển số xe máy VN: XXYY-1234(5)
-        XX: 2 số đầu
-        YY: 2 ký tự (chữ hoặc số) - BẮT BUỘC 2 KÝ TỰ
-        1234(5): 4 hoặc 5 số cuối
-        
-        VD: 29T1-82843, 30AB-1234, 51F9-98765
-        """
-        text = text.upper().replace(' ', '').replace('-', '').replace('.', '')
-        # Match CHÍNH XÁC: 2 số + 2 ký tự + 4-5 số
-        match = re.search(r'(\d{2})([A-Z0-9]{2})(\d{4,5})', text)
-        if match:
-            return f"{match.group(1)}{match.group(2)}-{match.group(3)}"
-        return text
-    
-    def detect_and_annotate(self, frame):
-        """
-        DETECT VÀ VẼ NGAY - REALTIME!
-        Giống y hệt project test's process_frame()
-        
-        Args:
-            frame: BGR numpy array
-            
-        Returns:
-            annotated_frame: Frame đã vẽ khung xanh lá + text
-            plate_info: Dict chứa thông tin biển số (hoặc None)
-        """
-        start_time = time.time()
-        self.total_frames += 1
-        self.frame_counter += 1
-        
-        # Frame skipping - chỉ process mỗi N frame
-        if self.frame_skip > 0 and self.frame_counter % (self.frame_skip + 1) != 0:
-            # Skip frame - return original without processing
-            fps = 1.0 / (time.time() - start_time) if (time.time() - start_time) > 0 else 0
-            cv2.putText(frame, f"FPS: {fps:.1f} (skipped)", (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            return frame, None
-        
-        # Detect với YOLO
-        results = self.model(frame, conf=0.25, verbose=False)
-        
-        if not results or len(results) == 0:
-            return frame, None
-        
-        result = results[0]
-        
-        # Check OBB results
-        if result.obb is None or len(result.obb) == 0:
-            return frame, None
-        
-        # Lấy detection TỐT NHẤT (highest confidence)
-        best_detection = None
-        best_conf = 0.0
-        
-        for obb in result.obb:
-            conf = float(obb.conf[0]) if obb.conf is not None else 0.0
-            
-            if conf > best_conf:
-                best_conf = conf
-                
-                # Lấy tọa độ OBB (4 điểm)
-                points = obb.xyxyxyxy[0].cpu().numpy().astype(int)
-                
-                # Tính bounding box
-                x_coords = points[:, 0]
-                y_coords = points[:, 1]
-                x1, x2 = int(x_coords.min()), int(x_coords.max())
-                y1, y2 = int(y_coords.min()), int(y_coords.max())
-                
-                # Đảm bảo trong giới hạn
-                h, w = frame.shape[:2]
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(w, x2)
-                y2 = min(h, y2)
-                
-                best_detection = {
-                    'bbox': (x1, y1, x2, y2),
-                    'points': points,
-                    'confidence': conf
-                }
-        
-        if best_detection is None:
-            return frame, None
-        
-        # Crop biển số
-        x1, y1, x2, y2 = best_detection['bbox']
-        
-        if x2 <= x1 or y2 <= y1:
-            return frame, None
-        
-        cropped_plate = frame[y1:y2, x1:x2]
-        
-        # MULTI-PASS Recognition với preprocessing cải tiến - Độ chính xác cao!
-        # Thử nhiều phương pháp tiền xử lý và chọn kết quả tốt nhất
-        
-        gray = cv2.cvtColor(cropped_plate, cv2.COLOR_BGR2GRAY)
-        
-        # Resize to optimal size (300px width for better recognition)
-        if gray.shape[1] < 300:
-            scale = 300 / gray.shape[1]
-            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-        
-        candidates = []
-        
-        # Method 1: CLAHE + Bilateral Filter (tốt cho hầu hết trường hợp)
-        try:
-            denoised1 = cv2.bilateralFilter(gray, 11, 17, 17)
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-            enhanced1 = clahe.apply(denoised1)
-            # Sharpen
-            kernel_sharpen = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            sharpened1 = cv2.filter2D(enhanced1, -1, kernel_sharpen)
-            
-            text1 = self.recognizer.recognize(sharpened1)
-            if text1 and len(text1) >= 7:
-                candidates.append(text1.upper())
-        except:
-            pass
-        
-        # Method 2: Adaptive Threshold (tốt cho ánh sáng không đều)
-        try:
-            denoised2 = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
-            thresh2 = cv2.adaptiveThreshold(denoised2, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY, 11, 2)
-            
-            text2 = self.recognizer.recognize(thresh2)
-            if text2 and len(text2) >= 7:
-                candidates.append(text2.upper())
-        except:
-            pass
-        
-        # Method 3: Simple contrast enhancement (backup)
-        try:
-            enhanced3 = cv2.equalizeHist(gray)
-            text3 = self.recognizer.recognize(enhanced3)
-            if text3 and len(text3) >= 7:
-                candidates.append(text3.upper())
-        except:
-            pass
-        
-        # Chọn kết quả tốt nhất (dài nhất và hợp lệ nhất)
-        plate_text_raw = ''
-        if candidates:
-            # Ưu tiên kết quả match format biển số VN
-            for cand in candidates:
-                is_valid, _ = self.validate_plate_format(cand)
-                if is_valid:
-                    plate_text_raw = cand
-                    break
-            
-            # Nếu không có valid, chọn dài nhất
-            if not plate_text_raw:
-                plate_text_raw = max(candidates, key=len)
-        
-        # Validate và format
-        is_valid, plate_text = self.validate_plate_format(plate_text_raw)
-        plate_text_formatted = self.format_plate_text(plate_text) if is_valid else plate_text_raw
-        
-        # VẼ KẾT QUẢ LÊN FRAME - KHUNG XANH LÁ!
-        annotated = frame.copy()
-        points = best_detection['points']
-        conf = best_detection['confidence']
-        
-        # Vẽ OBB polygon (XANH LÁ - BGR: 0,255,0)
-        cv2.polylines(annotated, [points], True, (0, 255, 0), 3)
-        
-        # Vẽ rectangle
-        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        
-        # Tạo label
-        if is_valid:
-            label = f"{plate_text_formatted}"
-            conf_label = f"Conf: {conf*100:.1f}%"
-        else:
-            label = "License Plate"
-            conf_label = f"Conf: {conf*100:.1f}%"
-        
-        # Đo kích thước text
-        (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
-        (conf_w, conf_h), _ = cv2.getTextSize(conf_label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-        
-        # Vẽ background xanh lá
-        box_height = label_h + conf_h + 20
-        box_width = max(label_w, conf_w) + 20
-        cv2.rectangle(annotated, (x1, y1 - box_height - 5), 
-                     (x1 + box_width, y1), (0, 255, 0), -1)
-        
-        # Vẽ text biển số (ĐEN ĐẬM)
-        cv2.putText(annotated, label, (x1 + 10, y1 - conf_h - 15),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
-        
-        # Vẽ confidence
-        cv2.putText(annotated, conf_label, (x1 + 10, y1 - 5),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-        
-        # Tính FPS
-        process_time = time.time() - start_time
-        fps = 1.0 / process_time if process_time > 0 else 0
-        
-        # Vẽ FPS (góc trên bên trái)
-        cv2.putText(annotated, f"FPS: {fps:.1f}", (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        
-        # Tạo plate_info
-        plate_info = {
-            'text': plate_text_formatted if is_valid else plate_text_raw,
-            'confidence': float(conf),
-            'is_valid': is_valid,
-            'bbox': [int(x1), int(y1), int(x2), int(y2)],
-            'fps': float(fps)
-        }
-        
-        if is_valid:
-            self.total_detections += 1
-        
-        return annotated, plate_info
-    
-    def get_stats(self):
-        """Lấy stats"""
-        runtime = time.time() - self.start_time
-        avg_fps = self.total_frames / runtime if runtime > 0 else 0
-        
-        return {
-            'total_frames': self.total_frames,
-            'total_detections': self.total_detections,
-            'runtime_seconds': int(runtime),
-            'avg_fps': round(avg_fps, 2)
-        }
-
+MODEL_PATH = 'ml_models/plate_detector/best.pt'
+server_config = load_model_config(os.path.dirname(MODEL_PATH))
 
-# Khởi tạo PERSISTENT DETECTOR - Load 1 lần khi server khởi động!
-print("\n🚀 Starting WebSocket Detector Server...")
-detector = PersistentDetector()
+# Backend xử lý - khởi tạo trong start_detection() (không ở top-level: process con của pool
+# dùng spawn nên import lại module này)
+# - worker_pool.processes = 0: 1 PersistentDetector in-process
+# - worker_pool.processes = N: DetectorPool N process, camera chia shard cho các worker
+detector = None
+detector_pool = None
 
 # Connected clients tracking
 connected_cameras = {}
 
+# Tuỳ chọn của từng client (sid → dict), gửi kèm lúc register_camera
+camera_options = {}
+
+# ROI gửi kèm register_camera (cameraId → roi config) - chuyển cho worker cùng frame
+camera_roi_overrides = {}
+
+# Mailbox 1 slot / client (sid) cho mỗi shard - frame mới thay frame chưa xử lý
+# exclusive: mỗi client tối đa 1 frame đang xử lý → kết quả luôn đúng thứ tự dù nhiều thread / shard
+shard_mailboxes = []
+
+# cameraId → shard (worker) xử lý - giữ lại sau khi ngắt kết nối: tracker / motion gate trong
+# worker theo cameraId, camera kết nối lại vẫn về đúng worker đang giữ state của nó
+camera_shards = {}
+camera_shards_lock = threading.Lock()
+
+# Rate controller theo client (sid) - FPS xử lý mục tiêu theo latency, đề xuất client giảm tốc độ gửi
+rate_controllers = {}
+
+
+# Deadline theo client (sid) - frame quá cũ so với timestamp client bị bỏ trước khi decode
+deadline_trackers = {}
+
+# Histogram latency các stage ở process chính (queue_wait, decode, total) - stage của detector
+# (detect, crop, ocr_*, annotate, encode) nằm trong PersistentDetector / worker của pool
+server_metrics = StageMetrics((server_config.get('metrics') or {}).get('latency_buckets_ms'))
+
+# Profile theo yêu cầu (endpoint /admin/profile*) - chỉ 1 sampling profile mỗi lúc;
+# yêu cầu torch op profile chờ batch kế tiếp của detection_worker ({'event', 'result'})
+MAX_PROFILE_SECONDS = 120
+profile_lock = threading.Lock()
+op_profile_requests = deque()
+
+# Trace từng frame (camera, thời gian từng bước, kết quả) trong ring buffer - không print trên hot path
+# Xem qua /admin/trace, dump ra file qua /admin/trace/dump hoặc kill -USR1 <pid>
+frame_trace = FrameTraceBuffer(server_config.get('trace'), name='frame_trace')
+
+# Biển hợp lệ gần nhất đã log của từng camera - chỉ in khi đổi biển
+last_logged_plates = {}
+
+# Counter nhỏ theo camera gửi kèm mỗi detection_result - stats đầy đủ (mọi camera) chỉ qua
+# get_stats / /health / /metrics, không gửi mỗi frame
+camera_counters = {}
+camera_counters_lock = threading.Lock()
+
+
+def deadline_tracker_for(sid):
+    if sid not in deadline_trackers:
+        config = dict(DEFAULT_QUALITY_CONFIG)
+        config.update(server_config.get('quality') or {})
+        deadline_trackers[sid] = DeadlineTracker(config['deadline_ms'])
+    return deadline_trackers[sid]
+
+
+def rate_controller_for(sid):
+    if sid not in rate_controllers:
+        rate_controllers[sid] = RateController(server_config.get('rate_control'))
+    return rate_controllers[sid]
+
+
+def shard_for(camera_id):
+    """Gán camera cho shard đang có ít camera kết nối nhất (giữ nguyên sau lần gán đầu tiên)"""
+    with camera_shards_lock:
+        if camera_id not in camera_shards:
+            loads = [0] * len(shard_mailboxes)
+            for connected in set(connected_cameras.values()):
+                if connected in camera_shards:
+                    loads[camera_shards[connected]] += 1
+            camera_shards[camera_id] = loads.index(min(loads))
+        return camera_shards[camera_id]
+
 
 @socketio.on('connect')
 def handle_connect():
@@ -340,21 +139,102 @@ def handle_connect():
 def handle_disconnect():
     """Client ngắt kết nối"""
     sid = request.sid
+    # State theo sid (kể cả client gửi frame mà chưa register_camera) → không còn trong stats / metrics
+    camera_options.pop(sid, None)
+    rate_controllers.pop(sid, None)
+    deadline_trackers.pop(sid, None)
     if sid in connected_cameras:
         camera_id = connected_cameras[sid]
         del connected_cameras[sid]
+        last_logged_plates.pop(camera_id, None)
+        # Camera không còn kết nối nào → bỏ counter + histogram stage khỏi stats / /metrics
+        if camera_id not in connected_cameras.values():
+            with camera_counters_lock:
+                camera_counters.pop(camera_id, None)
+            server_metrics.discard(camera_id)
+            if detector_pool is not None:
+                detector_pool.discard_camera(camera_id)
+            elif detector is not None:
+                detector.metrics.discard(camera_id)
         print(f"[WebSocket] 🔌 Camera {camera_id} disconnected: {sid}")
     else:
         print(f"[WebSocket] 🔌 Client disconnected: {sid}")
+    
+    for mailbox in shard_mailboxes:
+        mailbox.discard(sid)
 
 
 @socketio.on('register_camera')
 def handle_register_camera(data):
-    """Đăng ký camera"""
+    """
+    Đăng ký camera
+    
+    Data format:
+    {
+        'cameraId': 'camera_123',
+        'multiPlate': false,  # (tuỳ chọn) đọc tất cả biển số trong frame
+        'resultMode': 'annotated',  # (tuỳ chọn) 'metadata' → chỉ trả geometry/text, client tự vẽ overlay
+        'roi': {              # (tuỳ chọn) ROI làn xe, ghi đè camera_rois trong config
+            'polygon': [[0.2, 0.4], [0.8, 0.4], [0.9, 1.0], [0.1, 1.0]],
+            'tiled': false
+        }
+    }
+    """
     camera_id = data.get('cameraId', 'unknown')
     connected_cameras[request.sid] = camera_id
+    camera_options[request.sid] = {
+        'multi_plate': bool(data.get('multiPlate', False)),
+        'result_mode': 'metadata' if data.get('resultMode') == 'metadata' else 'annotated'
+    }
+    
+    if data.get('roi') is not None:
+        try:
+            CameraROI.from_config(data['roi'])
+            camera_roi_overrides[camera_id] = data['roi']
+            if detector is not None:
+                detector.set_camera_roi(camera_id, data['roi'])
+        except (KeyError, ValueError) as e:
+            print(f"[WebSocket] ⚠️ Invalid ROI for {camera_id}: {e}")
+            emit('detection_error', {'error': f'Invalid ROI: {e}'})
+    camera_options[request.sid]['roi'] = (camera_id in camera_roi_overrides
+                                          or camera_id in (server_config.get('camera_rois') or {}))
+    shard_for(camera_id)
     print(f"[WebSocket] 📹 Camera registered: {camera_id} (sid: {request.sid})")
-    emit('camera_registered', {'cameraId': camera_id, 'status': 'registered'})
+    emit('camera_registered', {'cameraId': camera_id, 'status': 'registered',
+                               'options': camera_options[request.sid]})
+
+
+def decode_frame_payload(frame_data):
+    """
+    Lấy JPEG bytes từ payload 'frame' của video_frame
+    
+    - bytes / bytearray: Socket.IO binary attachment (client mới) - dùng trực tiếp, không copy
+    - str: base64 data URL (client cũ) - data:image/jpeg;base64,/9j/4AAQ...
+    
+    Returns:
+        (frame_bytes, is_binary)
+    
+    Raises:
+        ValueError: payload không hợp lệ
+    """
+    if isinstance(frame_data, (bytes, bytearray, memoryview)):
+        return frame_data, True
+    
+    if not isinstance(frame_data, str):
+        raise ValueError(f'Unsupported frame payload type: {type(frame_data).__name__}')
+    
+    # Bỏ header data URL (partition không tạo list như split)
+    header, sep, frame_base64 = frame_data.partition(',')
+    if not sep:
+        frame_base64 = header
+    
+    if len(frame_base64) < 100:
+        raise ValueError(f'Frame base64 too short: {len(frame_base64)}')
+    
+    try:
+        return base64.b64decode(frame_base64), False
+    except Exception as e:
+        raise ValueError(f'Base64 decode error: {e}')
 
 
 @socketio.on('video_frame')
@@ -365,104 +245,499 @@ def handle_video_frame(data):
     Data format:
     {
         'cameraId': 'camera_123',
-        'frame': 'base64_encoded_image_data',
+        'frame': <JPEG bytes> | 'data:image/jpeg;base64,...',
         'timestamp': 1234567890
     }
+    
+    Frame gửi dạng binary attachment → annotated_frame trả về cũng là JPEG bytes;
+    frame gửi dạng base64 (client cũ) → annotated_frame là base64 data URL như trước
+    
+    resultMode 'metadata' (chọn lúc register_camera): annotated_frame = None, không copy/vẽ/encode;
+    detection chứa points/bbox theo toạ độ frame gốc, frame_size = [width, height] để client scale overlay
+
+    Frame được đặt vào mailbox của client (latest-frame-wins) - detection_worker xử lý frame mới nhất,
+    frame cũ chưa xử lý bị thay thế (đếm trong stats['frame_queue'])
+    
+    Rate controller bỏ frame ngay khi nhận nếu vượt FPS mục tiêu của camera (stats['rate_control']);
+    server gửi 'rate_advice' {cameraId, max_fps} để client giảm / tăng lại tốc độ gửi
+    """
+    camera_id = data.get('cameraId', 'unknown')
+    
+    if not data.get('frame'):
+        frame_trace.record(camera=camera_id, error='No frame data')
+        emit('detection_error', {'error': 'No frame data'})
+        return
+    
+    # Vượt FPS mục tiêu (latency đang cao) → bỏ luôn, không decode
+    if not rate_controller_for(request.sid).accept():
+        return
+    
+    data['_received_at'] = time.time()
+    deadline_tracker_for(request.sid).observe(data.get('timestamp'), data['_received_at'])
+    shard_mailboxes[shard_for(camera_id)].put(request.sid, data)
+
+
+def decode_video_frame(data):
+    """
+    Decode payload video_frame → BGR frame
+    
+    Returns:
+        (frame, is_binary)
+    
+    Raises:
+        ValueError: frame không hợp lệ (gửi detection_error về client)
     """
     try:
+        frame_bytes, is_binary = decode_frame_payload(data.get('frame'))
+    except ValueError as e:
+        raise ValueError(f'Invalid frame data: {e}')
+    
+    if len(frame_bytes) == 0:
+        raise ValueError('Empty frame bytes')
+    
+    frame_np = np.frombuffer(frame_bytes, dtype=np.uint8)
+    frame = cv2.imdecode(frame_np, cv2.IMREAD_COLOR)
+    
+    if frame is None:
+        raise ValueError('Failed to decode frame')
+    
+    return frame, is_binary
+
+
+def camera_frame_stats(sid, camera_id, plate_info, mailbox):
+    """
+    Cập nhật + trả counter của riêng camera này cho detection_result
+    (kích thước cố định, không phụ thuộc số camera đang kết nối)
+    """
+    with camera_counters_lock:
+        counters = camera_counters.setdefault(camera_id, {'total_frames': 0, 'total_detections': 0})
+        counters['total_frames'] += 1
+        if plate_info and plate_info['is_valid']:
+            counters['total_detections'] += 1
+        stats = dict(counters)
+    
+    queue = mailbox.get_key_stats(sid)
+    controller = rate_controllers.get(sid)
+    tracker = deadline_trackers.get(sid)
+    stats['frames_dropped'] = queue['dropped'] if queue else 0
+    stats['rate_skipped'] = controller.skipped if controller is not None else 0
+    stats['deadline_misses'] = tracker.misses if tracker is not None else 0
+    return stats
+
+
+def build_detection_response(data, frame, is_binary, jpeg, plate_info, metadata_only, stats):
+    """Tạo payload cho event detection_result (jpeg: annotated frame đã encode hoặc None)"""
+    camera_id = data.get('cameraId', 'unknown')
+    
+    # Annotated frame -> JPEG binary attachment, hoặc base64 data URL cho client cũ
+    annotated_payload = None
+    if jpeg is not None:
+        if is_binary:
+            annotated_payload = jpeg
+        else:
+            annotated_payload = f"data:image/jpeg;base64,{base64.b64encode(jpeg).decode('utf-8')}"
+    
+    response = {
+        'cameraId': camera_id,
+        'timestamp': data.get('timestamp', 0),
+        'annotated_frame': annotated_payload,
+        'detection': plate_info,
+        'stats': stats
+    }
+    if metadata_only:
+        response['frame_size'] = [frame.shape[1], frame.shape[0]]
+    
+    # Log khi camera đọc được biển hợp lệ MỚI (không in mỗi frame - chi tiết từng frame nằm trong frame_trace)
+    if plate_info and plate_info['is_valid'] and last_logged_plates.get(camera_id) != plate_info['text']:
+        last_logged_plates[camera_id] = plate_info['text']
+        print(f"[Camera {camera_id}] 🎯 DETECTED: {plate_info['text']} "
+              f"(Conf: {plate_info['confidence']*100:.1f}%, FPS: {plate_info['fps']:.1f})")
+    
+    return response
+
+
+def run_detection_batch(shard, requests, op_request=None):
+    """
+    Detect + vẽ + encode 1 batch - in-process hoặc trên worker process của shard
+    
+    Args:
+        op_request: (tuỳ chọn) yêu cầu torch op profile đang chờ - batch chạy dưới torch.profiler,
+                    bảng op ghi vào op_request['result'], lỗi profile vào op_request['error']
+    
+    Returns:
+        list (jpeg_bytes | None, plate_info) cùng thứ tự requests
+    """
+    if op_request is not None:
+        try:
+            if detector_pool is not None:
+                outputs, op_request['result'], op_request['error'] = detector_pool.run_batch(
+                    shard, requests, op_profile=True)
+                return outputs
+            try:
+                results, op_request['result'] = torch_op_profile(lambda: detector.detect_and_annotate_batch(requests))
+            except RuntimeError as e:
+                op_request['error'] = str(e)
+                results = detector.detect_and_annotate_batch(requests)
+        except Exception as e:
+            op_request['error'] = f'Batch failed: {e}'
+            raise
+        finally:
+            op_request['event'].set()
+    elif detector_pool is not None:
+        return detector_pool.run_batch(shard, requests)
+    else:
+        results = detector.detect_and_annotate_batch(requests)
+    
+    return [(encode_annotated(annotated, detector.metrics, req['camera_id']), plate_info)
+            for req, (annotated, plate_info) in zip(requests, results)]
+
+
+def process_video_frames(shard, entries):
+    """
+    Xử lý 1 micro-batch frame (mỗi entry là frame mới nhất của 1 client)
+    
+    Decode từng frame → 1 batch detector + 1 batch OCR cho tất cả → gửi kết quả về đúng socket
+    
+    Args:
+        shard: shard (worker) của các client trong batch
+        entries: list (sid, data)
+    """
+    decoded = []
+    batch_start = time.time()
+    for sid, data in entries:
         camera_id = data.get('cameraId', 'unknown')
-        frame_base64 = data.get('frame', '')
-        timestamp = data.get('timestamp', 0)
-        
-        if not frame_base64:
-            print(f"[ERROR] No frame data from camera {camera_id}")
-            emit('detection_error', {'error': 'No frame data'})
-            return
+        timings = {}
+        if '_received_at' in data:
+            timings['queue_wait'] = (batch_start - data['_received_at']) * 1000
+            server_metrics.observe(camera_id, 'queue_wait', batch_start - data['_received_at'])
         
-        # DEBUG: Log frame info
-        print(f"[Camera {camera_id}] Received frame, length: {len(frame_base64)}")
+        # Frame đã quá deadline → bỏ (client đã gửi frame mới hơn)
+        tracker = deadline_trackers.get(sid)
+        if tracker is not None and tracker.expired(data.get('timestamp')):
+            frame_trace.record(camera=camera_id, dropped='deadline', timings_ms=timings)
+            continue
         
-        # Decode base64 -> numpy array
-        # Format: data:image/jpeg;base64,/9j/4AAQ...
-        if ',' in frame_base64:
-            frame_base64 = frame_base64.split(',')[1]
-        
-        # DEBUG: Check base64 after split
-        if not frame_base64 or len(frame_base64) < 100:
-            print(f"[ERROR] Frame base64 too short after split: {len(frame_base64)}")
-            emit('detection_error', {'error': 'Invalid frame data'})
-            return
+        try:
+            stage_start = time.perf_counter()
+            frame, is_binary = decode_video_frame(data)
+            timings['decode'] = (time.perf_counter() - stage_start) * 1000
+            server_metrics.observe(camera_id, 'decode', timings['decode'] / 1000)
+            if detector_pool is not None and frame.nbytes > detector_pool.slot_bytes:
+                raise ValueError(f'Frame too large for worker pool: {frame.shape[1]}x{frame.shape[0]}')
+        except ValueError as e:
+            frame_trace.record(camera=camera_id, error=str(e), timings_ms=timings)
+            socketio.emit('detection_error', {'error': str(e)}, to=sid)
+            continue
+        
+        options = camera_options.get(sid, {})
+        decoded.append((sid, data, frame, is_binary, options.get('result_mode') == 'metadata', timings))
+    
+    if not decoded:
+        return
+    
+    try:
+        op_request = op_profile_requests.popleft()
+    except IndexError:
+        op_request = None
+    
+    # DETECT VÀ VẼ - REALTIME! (tất cả camera trong 1 batch)
+    detect_start = time.perf_counter()
+    results = run_detection_batch(shard, [
+        {
+            'frame': frame,
+            'multi_plate': camera_options.get(sid, {}).get('multi_plate', False),
+            'camera_id': data.get('cameraId', 'unknown'),
+            'annotate': not metadata_only,
+            'roi': camera_roi_overrides.get(data.get('cameraId', 'unknown')),
+            'received_at': data.get('_received_at')
+        }
+        for sid, data, frame, _, metadata_only, _ in decoded
+    ], op_request)
+    detect_ms = (time.perf_counter() - detect_start) * 1000
+    
+    for (sid, data, frame, is_binary, metadata_only, timings), (jpeg, plate_info) in zip(decoded, results):
+        camera_id = data.get('cameraId', 'unknown')
+        stats = camera_frame_stats(sid, camera_id, plate_info, shard_mailboxes[shard])
+        response = build_detection_response(data, frame, is_binary, jpeg, plate_info, metadata_only, stats)
+        socketio.emit('detection_result', response, to=sid)
+        
+        timings['detect_batch'] = detect_ms
+        if '_received_at' in data:
+            timings['total'] = (time.time() - data['_received_at']) * 1000
+            server_metrics.observe(camera_id, 'total', timings['total'] / 1000)
+        frame_trace.record(
+            camera=camera_id,
+            batch_size=len(decoded),
+            timings_ms={k: round(v, 2) for k, v in timings.items()},
+            plates=[p['text'] for p in (plate_info.get('plates') or [plate_info])] if plate_info else [],
+            valid=bool(plate_info and plate_info['is_valid']),
+            motion_skipped=bool(plate_info and plate_info.get('motion_skipped'))
+        )
+        
+        # Thời gian chờ trước khi xử lý (không phải service time) điều chỉnh FPS mục tiêu của camera
+        controller = rate_controllers.get(sid)
+        if controller is not None and '_received_at' in data:
+            controller.record_latency(time.time() - data['_received_at'], batch_start - data['_received_at'])
+            max_fps = controller.advice()
+            if max_fps is not None:
+                socketio.emit('rate_advice', {'cameraId': data.get('cameraId', 'unknown'), 'max_fps': max_fps}, to=sid)
+
+
+def detection_worker(shard):
+    """
+    Worker nền của 1 shard: gom frame mới nhất của các camera trong cửa sổ ngắn (micro-batch),
+    xử lý chung 1 batch và gửi kết quả về đúng client
+    """
+    batching = server_config.get('batching', {})
+    max_batch_size = max(1, int(batching.get('max_batch_size', 8)))
+    window = batching.get('window_ms', 15) / 1000.0
+    mailbox = shard_mailboxes[shard]
+    
+    while True:
+        batch = mailbox.get_batch(max_batch_size, window=window)
+        if not batch:
+            break
         
         try:
-            frame_bytes = base64.b64decode(frame_base64)
-            print(f"[Camera {camera_id}] Decoded {len(frame_bytes)} bytes")
+            process_video_frames(shard, [(sid, data) for sid, data, _ in batch])
         except Exception as e:
-            print(f"[ERROR] Base64 decode failed: {e}")
-            emit('detection_error', {'error': f'Base64 decode error: {e}'})
-            return
-        
-        if len(frame_bytes) == 0:
-            print(f"[ERROR] Frame bytes empty after decode!")
-            emit('detection_error', {'error': 'Empty frame bytes'})
-            return
-        
-        frame_np = np.frombuffer(frame_bytes, dtype=np.uint8)
-        frame = cv2.imdecode(frame_np, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            print(f"[ERROR] OpenCV imdecode failed, bytes length: {len(frame_bytes)}")
-            emit('detection_error', {'error': 'Failed to decode frame'})
+            frame_trace.record(cameras=[data.get('cameraId', 'unknown') for _, data, _ in batch],
+                               error=f'Frame processing error: {e}', traceback=traceback.format_exc())
+            for sid, _, _ in batch:
+                socketio.emit('detection_error', {'error': str(e)}, to=sid)
+        finally:
+            mailbox.release([sid for sid, _, _ in batch])
+
+
+def get_server_stats():
+    """
+    Stats detector (gộp các worker nếu chạy pool) + hàng đợi frame theo camera
+    Gọi từ thread HTTP / Socket.IO trong lúc worker đang chạy → chỉ duyệt bản copy của các dict
+    """
+    stats = detector_pool.get_stats() if detector_pool is not None else detector.get_stats()
+    stats['frame_queue'] = {}
+    for mailbox in shard_mailboxes:
+        for sid, queue_stats in mailbox.get_stats().items():
+            stats['frame_queue'][connected_cameras.get(sid, sid)] = queue_stats
+    stats['rate_control'] = {
+        connected_cameras.get(sid, sid): controller.get_stats()
+        for sid, controller in list(rate_controllers.items())
+    }
+    stats['trace'] = frame_trace.get_stats()
+    stats['deadline_misses'] = {
+        connected_cameras.get(sid, sid): tracker.misses
+        for sid, tracker in list(deadline_trackers.items())
+    }
+    return stats
+
+
+def camera_counter_totals():
+    """
+    Counter theo cameraId cho /metrics: cộng dồn các kết nối cùng cameraId,
+    bỏ qua client chưa register_camera / đã ngắt kết nối (không lộ sid ra label)
+    """
+    totals = {}
+    
+    def add(sid, key, value):
+        camera_id = connected_cameras.get(sid)
+        if camera_id is None:
             return
-        
-        # DETECT VÀ VẼ - REALTIME!
-        annotated_frame, plate_info = detector.detect_and_annotate(frame)
-        
-        # Encode annotated frame -> base64
-        _, buffer = cv2.imencode('.jpg', annotated_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        annotated_base64 = base64.b64encode(buffer).decode('utf-8')
-        annotated_data_url = f"data:image/jpeg;base64,{annotated_base64}"
-        
-        # Gửi kết quả về frontend
-        response = {
-            'cameraId': camera_id,
-            'timestamp': timestamp,
-            'annotated_frame': annotated_data_url,
-            'detection': plate_info,
-            'stats': detector.get_stats()
-        }
-        
-        emit('detection_result', response)
-        
-        # Log nếu detect được biển số hợp lệ
-        if plate_info and plate_info['is_valid']:
-            print(f"[Camera {camera_id}] 🎯 DETECTED: {plate_info['text']} "
-                  f"(Conf: {plate_info['confidence']*100:.1f}%, FPS: {plate_info['fps']:.1f})")
-        
-    except Exception as e:
-        print(f"[ERROR] Frame processing error: {e}")
-        import traceback
-        traceback.print_exc()
-        emit('detection_error', {'error': str(e)})
+        counters = totals.setdefault(camera_id, {'dropped': 0, 'rate_skipped': 0, 'deadline_misses': 0})
+        counters[key] += value
+    
+    for mailbox in shard_mailboxes:
+        for sid, queue_stats in mailbox.get_stats().items():
+            add(sid, 'dropped', queue_stats['dropped'])
+    for sid, controller in list(rate_controllers.items()):
+        add(sid, 'rate_skipped', controller.skipped)
+    for sid, tracker in list(deadline_trackers.items()):
+        add(sid, 'deadline_misses', tracker.misses)
+    return totals
+
+
+def start_detection(num_workers):
+    """
+    Khởi tạo backend xử lý + worker nền cho từng shard
+    
+    Args:
+        num_workers: 0 → PersistentDetector in-process; N → DetectorPool N process
+    """
+    global detector, detector_pool
+    
+    batching = server_config.get('batching', {})
+    max_batch_size = max(1, int(batching.get('max_batch_size', 8)))
+    pool_config = server_config.get('worker_pool', {})
+    pipeline_depth = max(1, int(pool_config.get('pipeline_depth', 2)))
+    
+    if num_workers > 0:
+        detector_pool = DetectorPool(
+            num_workers,
+            detector_kwargs={'model_path': MODEL_PATH},
+            max_batch_size=max_batch_size,
+            pipeline_depth=pipeline_depth,
+            slot_bytes=int(pool_config.get('max_frame_bytes', DEFAULT_SLOT_BYTES))
+        )
+        detector_pool.start()
+        atexit.register(detector_pool.shutdown)
+        shard_mailboxes.extend(LatestFrameMailbox(exclusive=True) for _ in range(num_workers))
+        # pipeline_depth thread / shard: batch sau (camera khác) được decode + ghi shared memory
+        # trong lúc worker bận; frame kế tiếp của cùng camera chờ batch trước xong
+        threads_per_shard = pipeline_depth
+    else:
+        # Khởi tạo PERSISTENT DETECTOR - Load 1 lần khi server khởi động!
+        detector = PersistentDetector(MODEL_PATH)
+        shard_mailboxes.append(LatestFrameMailbox(exclusive=True))
+        threads_per_shard = 1
+    
+    for shard in range(len(shard_mailboxes)):
+        for _ in range(threads_per_shard):
+            socketio.start_background_task(detection_worker, shard)
 
 
 @socketio.on('get_stats')
 def handle_get_stats():
     """Lấy thống kê"""
-    stats = detector.get_stats()
+    stats = get_server_stats()
     emit('stats_response', stats)
 
 
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    stats = detector.get_stats()
+    stats = get_server_stats()
     return {
         'status': 'healthy',
         'detector': 'ready',
+        'quality_tier': stats.get('quality', {}).get('tier_name'),
+        'deadline_misses': sum(stats['deadline_misses'].values()),
         'stats': stats
     }
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: histogram latency từng stage theo camera + counter / gauge chính"""
+    detector_metrics = detector_pool.get_metrics() if detector_pool is not None else detector.get_metrics()
+    snapshot = merge_snapshots([server_metrics.snapshot(), detector_metrics])
+    stats = get_server_stats()
+    
+    cameras = camera_counter_totals()
+    gauges = [
+        ('eparking_frames_processed_total', 'Frames processed by the detector.', 'counter',
+         [({}, stats['total_frames'])]),
+        ('eparking_plates_detected_total', 'Valid plates read.', 'counter',
+         [({}, stats['total_detections'])]),
+        ('eparking_frames_dropped_total', 'Frames replaced in the mailbox before processing.', 'counter',
+         [({'camera': camera}, c['dropped']) for camera, c in cameras.items()]),
+        ('eparking_frames_rate_skipped_total', 'Frames dropped by the rate controller.', 'counter',
+         [({'camera': camera}, c['rate_skipped']) for camera, c in cameras.items()]),
+        ('eparking_deadline_misses_total', 'Frames dropped after their deadline.', 'counter',
+         [({'camera': camera}, c['deadline_misses']) for camera, c in cameras.items()]),
+    ]
+    if stats.get('quality'):
+        gauges.append(('eparking_quality_tier', 'Current quality tier (0 = full quality).', 'gauge',
+                       [({'tier': stats['quality']['tier_name']}, stats['quality']['tier'])]))
+    
+    text = render_prometheus(snapshot, server_metrics.buckets, gauges)
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+def admin_authorized():
+    """Endpoint admin: cần token (admin.token trong config / env EPARKING_ADMIN_TOKEN), không có token → chỉ localhost"""
+    token = (server_config.get('admin') or {}).get('token') or os.environ.get('EPARKING_ADMIN_TOKEN')
+    if token:
+        return token in (request.headers.get('X-Admin-Token'), request.args.get('token'))
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/admin/profile')
+def admin_profile():
+    """
+    Sampling profile process đang chạy (+ tất cả worker nếu chạy pool) → collapsed stack (flamegraph)
+    
+    Query: seconds (mặc định 10, tối đa MAX_PROFILE_SECONDS), interval_ms (mặc định 5)
+    VD: curl 'localhost:5001/admin/profile?seconds=15' > stacks.txt && flamegraph.pl stacks.txt > flame.svg
+    """
+    if not admin_authorized():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    try:
+        seconds = min(max(float(request.args.get('seconds', 10)), 0.1), MAX_PROFILE_SECONDS)
+        interval = max(float(request.args.get('interval_ms', 5)), 1.0) / 1000.0
+    except ValueError:
+        return Response('Invalid seconds / interval_ms\n', status=400, mimetype='text/plain')
+    
+    if not profile_lock.acquire(blocking=False):
+        return Response('Profile already running\n', status=409, mimetype='text/plain')
+    try:
+        print(f"[Profiler] Sampling for {seconds:.1f}s (interval {interval * 1000:.0f}ms)...")
+        main_stacks = []
+        sampler = threading.Thread(
+            target=lambda: main_stacks.append(profile_for(seconds, interval, prefix='websocket_detector')),
+            name='sampling-profiler', daemon=True)
+        sampler.start()
+        worker_stacks = detector_pool.profile(seconds, interval) if detector_pool is not None else []
+        sampler.join()
+    finally:
+        profile_lock.release()
+    
+    return Response(''.join(main_stacks + worker_stacks), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=profile.collapsed'})
+
+
+@app.route('/admin/profile/torch')
+def admin_profile_torch():
+    """
+    torch op-level profile của batch kế tiếp (detector + recognizer forward) → bảng op dạng text
+    
+    Query: timeout (giây chờ có frame để xử lý, mặc định 30)
+    """
+    if not admin_authorized():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    try:
+        timeout = float(request.args.get('timeout', 30))
+    except ValueError:
+        return Response('Invalid timeout\n', status=400, mimetype='text/plain')
+    
+    op_request = {'event': threading.Event(), 'result': None, 'error': None}
+    op_profile_requests.append(op_request)
+    if not op_request['event'].wait(timeout):
+        try:
+            op_profile_requests.remove(op_request)
+        except ValueError:
+            pass
+        return Response(f'No frame processed within {timeout:.0f}s\n', status=504, mimetype='text/plain')
+    if op_request['error']:
+        return Response(f"Op profile failed: {op_request['error']}\n", status=500, mimetype='text/plain')
+    
+    return Response(op_request['result'] or '', mimetype='text/plain')
+
+
+@app.route('/admin/trace')
+def admin_trace():
+    """
+    Trace các frame gần nhất (cũ → mới) dạng JSON
+    
+    Query: camera (lọc theo cameraId), limit (mặc định 200)
+    """
+    if not admin_authorized():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    try:
+        limit = int(request.args.get('limit', 200))
+    except ValueError:
+        return Response('Invalid limit\n', status=400, mimetype='text/plain')
+    
+    filters = {'camera': request.args['camera']} if request.args.get('camera') else {}
+    return {'stats': frame_trace.get_stats(), 'records': frame_trace.snapshot(limit=limit, **filters)}
+
+
+@app.route('/admin/trace/dump', methods=['POST'])
+def admin_trace_dump():
+    """Ghi toàn bộ ring buffer trace ra file JSON-lines (trace.dump_dir) - giống kill -USR1 <pid>"""
+    if not admin_authorized():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return {'path': frame_trace.dump(), 'records': frame_trace.get_stats()['records']}
+
+
 @app.route('/')
 def index():
     """Root endpoint"""
@@ -471,17 +746,31 @@ def index():
         'status': 'running',
         'endpoints': {
             'health': '/health',
+            'metrics': '/metrics',
+            'profile': '/admin/profile?seconds=10',
+            'torch_profile': '/admin/profile/torch',
+            'trace': '/admin/trace',
             'websocket': 'ws://localhost:5555'
         }
     }
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='WebSocket License Plate Detector')
+    parser.add_argument('--workers', type=int,
+                        default=server_config.get('worker_pool', {}).get('processes', 0),
+                        help='Số process detector (0 = in-process, mặc định theo worker_pool.processes)')
+    args = parser.parse_args()
+    
+    print("\n🚀 Starting WebSocket Detector Server...")
+    install_dump_signal(frame_trace)
+    start_detection(args.workers)
+    
     print("\n" + "=" * 60)
     print("🚀 WebSocket Detector Server Starting...")
     print("=" * 60)
-    print(f"🌐 HTTP Server: http://0.0.0.0:5001")
-    print(f"🔌 WebSocket: ws://0.0.0.0:5001")
+    print("🌐 HTTP Server: http://0.0.0.0:5001")
+    print("🔌 WebSocket: ws://0.0.0.0:5001")
     print("=" * 60 + "\n")
     
     # Import request here to avoid issues
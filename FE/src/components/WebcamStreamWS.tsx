@@ -9,46 +9,126 @@
  * - Backend: Process với YOLO + EasyOCR (loaded 1 lần duy nhất!)
  * - Receive annotated frames realtime
  * - Display video with detection overlay
+ *
+ * resultMode 'metadata': server chỉ trả toạ độ + text (annotated_frame = null),
+ * component tự vẽ box / label lên canvas phủ trên <video>
  */
 
 import { useEffect, useRef, useState } from 'react';
 import { AlertCircle, Camera, CheckCircle, ScanLine, Wifi, WifiOff } from 'lucide-react';
 import io, { Socket } from 'socket.io-client';
 
+type ResultMode = 'annotated' | 'metadata';
+
 interface WebcamStreamWSProps {
     cameraId: number;
     name: string;
     onError?: (error: string) => void;
+    // 'metadata' → server không vẽ / encode JPEG, client vẽ overlay (mặc định 'annotated')
+    resultMode?: ResultMode;
 }
 
-interface DetectionInfo {
+interface PlateBox {
     text: string;
     confidence: number;
     is_valid: boolean;
     bbox: [number, number, number, number];
+    points?: [number, number][];
+}
+
+interface DetectionInfo extends PlateBox {
     fps: number;
+    plates?: PlateBox[];
+}
+
+interface DetectionOverlay {
+    plates: PlateBox[];
+    // [width, height] của frame đã gửi - toạ độ box theo frame này
+    frameSize: [number, number];
 }
 
 interface DetectionResult {
     cameraId: string;
     timestamp: number;
-    annotated_frame: string;
+    // JPEG bytes (binary attachment), base64 data URL (server cũ) hoặc null (resultMode 'metadata')
+    annotated_frame: ArrayBuffer | string | null;
     detection: DetectionInfo | null;
+    frame_size?: [number, number];
+    // Counter của riêng camera này (stats toàn server: GET /health)
     stats: {
         total_frames: number;
         total_detections: number;
-        runtime_seconds: number;
-        avg_fps: number;
+        frames_dropped: number;
+        rate_skipped: number;
+        deadline_misses: number;
     };
 }
 
+/**
+ * Vẽ box + label lên canvas overlay, scale theo vùng hiển thị của video (object-contain)
+ */
+function drawDetectionOverlay(canvas: HTMLCanvasElement, overlay: DetectionOverlay | null) {
+    const width = canvas.clientWidth;
+    const height = canvas.clientHeight;
+    canvas.width = width;
+    canvas.height = height;
+
+    const ctx = canvas.getContext('2d');
+    if (!ctx) return;
+    ctx.clearRect(0, 0, width, height);
+    if (!overlay || overlay.frameSize[0] <= 0 || overlay.frameSize[1] <= 0) return;
+
+    const [frameWidth, frameHeight] = overlay.frameSize;
+    const scale = Math.min(width / frameWidth, height / frameHeight);
+    const offsetX = (width - frameWidth * scale) / 2;
+    const offsetY = (height - frameHeight * scale) / 2;
+    const toCanvas = (x: number, y: number): [number, number] => [offsetX + x * scale, offsetY + y * scale];
+
+    overlay.plates.forEach(plate => {
+        // OBB polygon (nếu có), nếu không thì bbox
+        const points = plate.points && plate.points.length === 4
+            ? plate.points
+            : [
+                [plate.bbox[0], plate.bbox[1]], [plate.bbox[2], plate.bbox[1]],
+                [plate.bbox[2], plate.bbox[3]], [plate.bbox[0], plate.bbox[3]]
+            ] as [number, number][];
+
+        ctx.strokeStyle = '#00ff00';
+        ctx.lineWidth = 3;
+        ctx.beginPath();
+        points.forEach(([x, y], i) => {
+            const [cx, cy] = toCanvas(x, y);
+            if (i === 0) ctx.moveTo(cx, cy); else ctx.lineTo(cx, cy);
+        });
+        ctx.closePath();
+        ctx.stroke();
+
+        // Label giống overlay server vẽ: biển số (hoặc 'License Plate') + confidence
+        const label = plate.is_valid ? plate.text : 'License Plate';
+        const confLabel = `Conf: ${(plate.confidence * 100).toFixed(1)}%`;
+        const [labelX, labelY] = toCanvas(plate.bbox[0], plate.bbox[1]);
+        ctx.font = 'bold 16px sans-serif';
+        const boxWidth = Math.max(ctx.measureText(label).width, ctx.measureText(confLabel).width) + 16;
+        const boxHeight = 44;
+        const top = Math.max(labelY - boxHeight - 4, 0);
+        ctx.fillStyle = '#00ff00';
+        ctx.fillRect(labelX, top, boxWidth, boxHeight);
+        ctx.fillStyle = '#000000';
+        ctx.fillText(label, labelX + 8, top + 19);
+        ctx.font = '12px sans-serif';
+        ctx.fillText(confLabel, labelX + 8, top + 37);
+    });
+}
+
 export function WebcamStreamWS({
     cameraId,
     name,
-    onError
+    onError,
+    resultMode = 'annotated'
 }: WebcamStreamWSProps) {
     const videoRef = useRef<HTMLVideoElement>(null);
     const canvasRef = useRef<HTMLCanvasElement>(null);
+    const overlayCanvasRef = useRef<HTMLCanvasElement>(null);
     const socketRef = useRef<Socket | null>(null);
     
     // States
@@ -58,6 +138,7 @@ export function WebcamStreamWS({
     const [wsConnected, setWsConnected] = useState(false);
     const [lastDetection, setLastDetection] = useState<DetectionInfo | null>(null);
     const [annotatedFrame, setAnnotatedFrame] = useState<string | null>(null);
+    const [overlay, setOverlay] = useState<DetectionOverlay | null>(null);
     const [stats, setStats] = useState<DetectionResult['stats'] | null>(null);
     const [fps, setFps] = useState<number>(0);
     const [statusMessage, setStatusMessage] = useState<{
@@ -70,6 +151,9 @@ export function WebcamStreamWS({
     const streamIntervalRef = useRef<NodeJS.Timeout | null>(null);
     const detectionTimeoutRef = useRef<NodeJS.Timeout | null>(null);
     const statusTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+    // Khoảng cách gửi tối thiểu (ms) theo rate_advice của server (0 = gửi theo interval mặc định)
+    const minSendIntervalRef = useRef<number>(0);
+    const lastSendTimeRef = useRef<number>(0);
 
     // WebSocket URL - auto-detect from current window location
     const getWebSocketURL = () => {
@@ -106,7 +190,7 @@ export function WebcamStreamWS({
             setWsConnected(true);
             
             // Register camera
-            socket.emit('register_camera', { cameraId: `camera_${cameraId}` });
+            socket.emit('register_camera', { cameraId: `camera_${cameraId}`, resultMode });
         });
 
         socket.on('disconnect', () => {
@@ -124,8 +208,21 @@ export function WebcamStreamWS({
 
         // Detection result handler
         socket.on('detection_result', (result: DetectionResult) => {
-            // Update annotated frame
-            setAnnotatedFrame(result.annotated_frame);
+            // Metadata mode: không có ảnh - vẽ box / label lên canvas phủ trên video
+            if (result.annotated_frame === null) {
+                setOverlay(result.detection && result.frame_size ? {
+                    plates: result.detection.plates || [result.detection],
+                    frameSize: result.frame_size
+                } : null);
+            } else if (typeof result.annotated_frame === 'string') {
+                setAnnotatedFrame(result.annotated_frame);
+            } else {
+                const url = URL.createObjectURL(new Blob([result.annotated_frame], { type: 'image/jpeg' }));
+                setAnnotatedFrame(prev => {
+                    if (prev && prev.startsWith('blob:')) URL.revokeObjectURL(prev);
+                    return url;
+                });
+            }
             
             // Update stats
             setStats(result.stats);
@@ -151,6 +248,7 @@ export function WebcamStreamWS({
                 
                 detectionTimeoutRef.current = setTimeout(() => {
                     setLastDetection(null);
+                    setOverlay(null);
                 }, 3000);
             } else {
                 // No detection in this frame
@@ -158,6 +256,12 @@ export function WebcamStreamWS({
             }
         });
 
+        // Server đang quá tải (hoặc đã hết tải) → điều chỉnh tốc độ gửi frame
+        socket.on('rate_advice', (data: { cameraId: string; max_fps: number }) => {
+            console.log(`[Camera ${cameraId}] ⏱️ Rate advice: max ${data.max_fps} fps`);
+            minSendIntervalRef.current = data.max_fps > 0 ? 1000 / data.max_fps : 0;
+        });
+
         socket.on('detection_error', (error: any) => {
             console.error(`[Camera ${cameraId}] ❌ Detection error:`, error);
         });
@@ -176,7 +280,19 @@ export function WebcamStreamWS({
                 clearTimeout(statusTimeoutRef.current);
             }
         };
-    }, [cameraId]);
+    }, [cameraId, resultMode]);
+
+    // Vẽ lại overlay khi có kết quả mới hoặc khi khung hình đổi kích thước
+    useEffect(() => {
+        const redraw = () => {
+            if (overlayCanvasRef.current) {
+                drawDetectionOverlay(overlayCanvasRef.current, overlay);
+            }
+        };
+        redraw();
+        window.addEventListener('resize', redraw);
+        return () => window.removeEventListener('resize', redraw);
+    }, [overlay]);
 
     // Initialize webcam
     useEffect(() => {
@@ -253,7 +369,7 @@ export function WebcamStreamWS({
     }, [cameraId, onError]);
 
     // Capture frame from video
-    const captureFrame = (): string | null => {
+    const captureFrame = async (): Promise<ArrayBuffer | null> => {
         if (!videoRef.current || !canvasRef.current) return null;
 
         const video = videoRef.current;
@@ -277,8 +393,9 @@ export function WebcamStreamWS({
         
         ctx.drawImage(video, 0, 0, width, height);
         
-        // Convert to base64 JPEG
-        return canvas.toDataURL('image/jpeg', 0.7);
+        // Convert to JPEG bytes - gửi dạng Socket.IO binary attachment (không base64)
+        const blob = await new Promise<Blob | null>(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.7));
+        return blob ? blob.arrayBuffer() : null;
     };
 
     // Stream frames to WebSocket server
@@ -292,12 +409,19 @@ export function WebcamStreamWS({
 
         // Stream frames every 200ms (5fps) - tối ưu cho realtime với OCR
         // OCR rất nặng nên giảm FPS để tránh lag
-        streamIntervalRef.current = setInterval(() => {
+        streamIntervalRef.current = setInterval(async () => {
             if (!wsConnected || !isConnected) {
                 return;
             }
 
-            const frameData = captureFrame();
+            // Tôn trọng rate_advice - không chụp / gửi frame mà server sẽ bỏ
+            const now = Date.now();
+            if (now - lastSendTimeRef.current < minSendIntervalRef.current) {
+                return;
+            }
+            lastSendTimeRef.current = now;
+
+            const frameData = await captureFrame();
             if (!frameData || !socketRef.current) {
                 return;
             }
@@ -415,21 +539,30 @@ export function WebcamStreamWS({
                 </div>
             )}
             
-            {/* Display: Annotated frame (if available) OR raw video */}
-            {annotatedFrame ? (
+            {/* Display: Annotated frame (if available) OR raw video
+                Video luôn được mount (chỉ ẩn) để captureFrame vẫn chụp được frame */}
+            {annotatedFrame && (
                 <img
                     src={annotatedFrame}
                     alt="Detection result"
                     className="w-full h-full object-contain"
                     style={{ display: isLoading ? 'none' : 'block' }}
                 />
-            ) : (
-                <video
-                    ref={videoRef}
-                    autoPlay
-                    playsInline
-                    muted
-                    className="w-full h-full object-contain"
+            )}
+            <video
+                ref={videoRef}
+                autoPlay
+                playsInline
+                muted
+                className="w-full h-full object-contain"
+                style={{ display: isLoading || annotatedFrame ? 'none' : 'block' }}
+            />
+
+            {/* Metadata mode: box + label do client vẽ, phủ đúng vùng video */}
+            {resultMode === 'metadata' && (
+                <canvas
+                    ref={overlayCanvasRef}
+                    className="absolute inset-0 w-full h-full pointer-events-none"
                     style={{ display: isLoading ? 'none' : 'block' }}
                 />
             )}
@@ -438,9 +571,9 @@ export function WebcamStreamWS({
             <div className="absolute top-2 left-2 flex flex-col space-y-2">
                 {/* Detection status only */}
                 <div className="flex items-center space-x-2 bg-black bg-opacity-70 px-3 py-2 rounded-lg">
-                    <ScanLine className={`w-5 h-5 ${annotatedFrame ? 'text-cyan-400 animate-pulse' : 'text-gray-400'}`} />
+                    <ScanLine className={`w-5 h-5 ${annotatedFrame || stats ? 'text-cyan-400 animate-pulse' : 'text-gray-400'}`} />
                     <span className="text-sm font-medium text-white">
-                        {annotatedFrame ? 'Đang quét...' : 'Sẵn sàng'}
+                        {annotatedFrame || stats ? 'Đang quét...' : 'Sẵn sàng'}
                     </span>
                 </div>
             </div>